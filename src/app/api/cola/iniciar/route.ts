@@ -12,6 +12,7 @@ export async function POST(request: NextRequest) {
 
   try {
     const { contacts, phones, from_number, agent_id } = await request.json();
+    const idempotencyKey = request.headers.get('Idempotency-Key');
 
     // Backward compatibility: construct contacts array if only 'phones' is provided
     let targets: { phone: string; user_name?: string }[] = [];
@@ -51,6 +52,8 @@ export async function POST(request: NextRequest) {
         headers: {
           'Content-Type': 'application/json',
           Authorization: `Bearer ${process.env.VOICE_AI_SERVICE_TOKEN}`,
+          // Un reintento del dashboard recibe los mismos job_ids en vez de volver a marcar
+          ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {}),
         },
         body: JSON.stringify(calls),
       }
@@ -62,26 +65,55 @@ export async function POST(request: NextRequest) {
 
     const voiceData = await voiceRes.json();
 
+    // job_ids viene alineado con targets; null = número suprimido (DNC, inactivo, cooldown).
+    // Números repetidos, elementos ya encolados y reintentos (replayed) comparten
+    // job_id con una fila que puede existir: solo se inserta la primera vez.
+    const jobIds: (string | null)[] = voiceData.job_ids;
+    const uniqueJobIds = Array.from(new Set(jobIds.filter((id): id is string => Boolean(id))));
+
+    let existingJobIds = new Set<string>();
+    if (uniqueJobIds.length > 0) {
+      const { data: existingRows, error: existingError } = await supabase
+        .from('outbound_call_queue')
+        .select('job_id')
+        .in('job_id', uniqueJobIds);
+
+      if (existingError) throw existingError;
+      existingJobIds = new Set((existingRows ?? []).map((row) => row.job_id as string));
+    }
+
+    const seen = new Set<string>(existingJobIds);
+    const queued: { contact: (typeof targets)[number]; jobId: string }[] = [];
+    targets.forEach((contact, idx) => {
+      const jobId = jobIds[idx];
+      if (!jobId || seen.has(jobId)) return;
+      seen.add(jobId);
+      queued.push({ contact, jobId });
+    });
+    const queuedTargets = queued.map(({ contact }) => contact);
+
     // Insertar en Supabase
-    const callRecords = targets.map((contact, idx) => ({
+    const callRecords = queued.map(({ contact, jobId }) => ({
       phone: contact.phone,
       user_name: contact.user_name || 'Cliente',
       from_number: from_number || '+18887719555',
-      job_id: voiceData.job_ids[idx],
+      job_id: jobId,
       status: 'queued',
       retell_call_id: null,
       active: true,
       // created_at y updated_at se generan automáticamente en la DB
     }));
 
-    const { error: insertError } = await supabase
-      .from('outbound_call_queue')
-      .insert(callRecords);
+    if (callRecords.length > 0) {
+      const { error: insertError } = await supabase
+        .from('outbound_call_queue')
+        .insert(callRecords);
 
-    if (insertError) throw insertError;
+      if (insertError) throw insertError;
+    }
 
     // Actualizar contactos
-    for (const contact of targets) {
+    for (const contact of queuedTargets) {
       const { data: existingContact } = await supabase
         .from('outbound_call_contacts')
         .select('times_called')
@@ -101,6 +133,9 @@ export async function POST(request: NextRequest) {
       success: true,
       queued: voiceData.queued,
       job_ids: voiceData.job_ids,
+      skipped: voiceData.skipped || [],
+      duplicates: voiceData.duplicates || [],
+      replayed: Boolean(voiceData.replayed),
       active_calls: voiceData.active_calls,
       queue_size: voiceData.queue_size,
     });
@@ -13,12 +13,10 @@ type Customer = {
   interest_second: string | null;
   qualified: string | null;
   qualified_for: string | null;
-  conversations: Array<Record<string, unknown>> | null;
   last_call_id: string | null;
   last_interaction_ts: string | null;
   wa_sending: boolean | null;
   wa_number_backup: string | null;
-  conversation_context: Record<string, unknown> | null;
   last_wa_interaction: string | null;
   wa_consent_received: boolean | null;
   trees_interested_count: number | null;
@@ -49,13 +47,30 @@ export default async function ClientsPage() {
     }
   );
 
+  // Sin las columnas JSONB: el historial vive en conversation_events
   const { data } = await supabase
     .from('out_customers')
-    .select('*')
+    .select(
+      'id, created_at, updated_at, user_name, user_number, user_wa_number, locale, interest_first, ' +
+        'interest_second, qualified, qualified_for, last_call_id, last_interaction_ts, wa_sending, ' +
+        'wa_number_backup, last_wa_interaction, wa_consent_received, trees_interested_count, interaction_stage'
+    )
     .order('last_interaction_ts', { ascending: false })
     .limit(50);
 
-  const customers: Customer[] = (data as Customer[]) || [];
+  const customers: Customer[] = (data as unknown as Customer[]) || [];
+
+  // Conversaciones por número: array legado + conversation_events
+  const conversationCounts = new Map<string, number>();
+  if (customers.length > 0) {
+    const { data: counts } = await supabase
+      .from('out_customer_conversation_counts')
+      .select('phone, conversations')
+      .in('phone', customers.map((c) => c.user_number));
+    for (const row of (counts as Array<{ phone: string; conversations: number }>) || []) {
+      conversationCounts.set(row.phone, row.conversations);
+    }
+  }
 
   const total = customers.length;
   const withConsent = customers.filter((c) => c.wa_consent_received === true).length;
@@ -117,8 +132,8 @@ export default async function ClientsPage() {
                     <td className="px-4 py-2 text-sm text-gray-700">{c.qualified ?? '—'}{c.qualified_for ? ` (${c.qualified_for})` : ''}</td>
                     <td className="px-4 py-2 text-sm text-gray-700">{formatDate(c.last_interaction_ts)}</td>
                     <td className="px-4 py-2 text-xs text-gray-600">
-                      {c.conversations && c.conversations.length > 0
-                        ? `Items: ${c.conversations.length}`
+                      {conversationCounts.get(c.user_number)
+                        ? `Items: ${conversationCounts.get(c.user_number)}`
                         : '—'}
                     </td>
                     <td className="px-4 py-2 text-xs">
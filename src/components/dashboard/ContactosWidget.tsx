@@ -1,6 +1,6 @@
 'use client';
 
-import { useEffect, useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import { toast } from 'sonner';
 import { Phone, Users, Loader2, Filter, CheckCircle, XCircle, Search } from 'lucide-react';
 import Link from 'next/link';
@@ -57,6 +57,8 @@ export default function ContactosWidget({
   
   const [agents, setAgents] = useState<RetellAgent[]>([]);
   const [selectedAgentId, setSelectedAgentId] = useState<string | null>(null);
+  // Idempotency-Key del envío en curso: se reutiliza al reintentar la misma selección
+  const batchKeyRef = useRef<{ body: string; key: string } | null>(null);
   const [searchTerm, setSearchTerm] = useState('');
 
   const LINE_CONFIG = {
@@ -217,19 +219,28 @@ export default function ContactosWidget({
         };
       });
 
+      const body = JSON.stringify({
+        contacts: selectedContacts,
+        from_number: lineConfig.fromNumber,
+        agent_id: selectedAgentId ?? undefined,
+      });
+      if (batchKeyRef.current?.body !== body) {
+        batchKeyRef.current = { body, key: crypto.randomUUID() };
+      }
+
       const res = await fetch('/api/cola/iniciar', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          contacts: selectedContacts,
-          from_number: lineConfig.fromNumber,
-          agent_id: selectedAgentId ?? undefined,
-        }),
+        headers: {
+          'Content-Type': 'application/json',
+          'Idempotency-Key': batchKeyRef.current.key,
+        },
+        body,
       });
 
       const data = await res.json();
 
       if (res.ok) {
+        batchKeyRef.current = null;
         toast.success('Llamadas iniciadas');
         setSelected(new Set());
         loadContactos();
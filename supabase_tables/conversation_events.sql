@@ -0,0 +1,77 @@
+-- Historial de conversaciones append-only (una fila por evento).
+-- Reemplaza el append sobre customers.conversations / out_customers.conversations:
+-- cada webhook inserta una fila de tamaño constante en lugar de reescribir el JSONB
+-- completo (y reindexar idx_our_customers_conversations).
+create table if not exists public.conversation_events (
+  id bigserial not null,
+  customer_kind text not null, -- 'in' (customers) | 'out' (out_customers)
+  phone text not null,
+  ts timestamp with time zone not null default now(),
+  call_id text null,
+  event text null,
+  summary text null,
+  sentiment text null,
+  created_at timestamp with time zone null default now(),
+  constraint conversation_events_pkey primary key (id),
+  constraint conversation_events_kind_check check (customer_kind = any (array['in'::text, 'out'::text]))
+) TABLESPACE pg_default;
+
+create index IF not exists idx_conversation_events_phone_ts on public.conversation_events using btree (customer_kind, phone, ts desc) TABLESPACE pg_default;
+
+create index IF not exists idx_conversation_events_call_id on public.conversation_events using btree (call_id) TABLESPACE pg_default;
+
+-- Ventana de migración: historial completo = array legado + eventos nuevos.
+-- El array `conversations` ya no se escribe pero sigue legible.
+create or replace view public.out_customer_conversations as
+  select
+    c.user_number as phone,
+    (e.value->>'ts')::timestamptz as ts,
+    e.value->>'call_id' as call_id,
+    e.value->>'event' as event,
+    e.value->>'summary' as summary,
+    e.value->>'sentiment' as sentiment,
+    'legacy'::text as source
+  from public.out_customers c
+  cross join lateral jsonb_array_elements(coalesce(c.conversations, '[]'::jsonb)) e
+  union all
+  select phone, ts, call_id, event, summary, sentiment, 'events'::text as source
+  from public.conversation_events
+  where customer_kind = 'out';
+
+-- Conteo por número para el listado de clientes (sin traer el historial)
+create or replace view public.out_customer_conversation_counts as
+  select phone, count(*)::int as conversations
+  from public.out_customer_conversations
+  group by phone;
+
+-- Webhook CRM en un solo statement: crea o actualiza out_customers por
+-- user_number (clave única) y agrega el evento de conversación.
+-- Atómico frente a eventos concurrentes del mismo número (sin insert duplicado).
+create or replace function public.upsert_out_customer_event(
+  p_user_number text,
+  p_name text default null,
+  p_call_id text default null,
+  p_event text default null,
+  p_summary text default null,
+  p_sentiment text default null,
+  p_ts timestamptz default now()
+)
+returns table (id bigint, user_number text, user_name text)
+language sql
+as $$
+  with customer as (
+    insert into public.out_customers as c (user_number, user_name, last_call_id, last_interaction_ts)
+    values (p_user_number, nullif(btrim(p_name), ''), p_call_id, p_ts)
+    on conflict (user_number) do update set
+      -- Solo se guarda el nombre si aún no existe
+      user_name = coalesce(c.user_name, excluded.user_name),
+      last_call_id = excluded.last_call_id,
+      last_interaction_ts = excluded.last_interaction_ts
+    returning c.id, c.user_number, c.user_name
+  ), conversation as (
+    insert into public.conversation_events (customer_kind, phone, ts, call_id, event, summary, sentiment)
+    values ('out', p_user_number, p_ts, p_call_id, p_event,
+            coalesce(p_summary, 'Sin resumen'), coalesce(p_sentiment, 'Neutral'))
+  )
+  select customer.id, customer.user_number, customer.user_name from customer;
+$$;
@@ -0,0 +1,37 @@
+-- Aplica en una sola llamada un lote de cambios de estado de outbound_call_queue.
+-- Usado por el write-behind de voice-ai-service (status_writer.py).
+-- Cada elemento trae job_id + phone (transiciones del worker) o solo
+-- retell_call_id (AMD / webhooks). Se aplican en orden, uno por uno, para
+-- que dos cambios sobre la misma fila respeten el orden de llegada.
+create or replace function public.apply_outbound_queue_updates(updates jsonb)
+returns integer
+language plpgsql
+as $$
+declare
+  u jsonb;
+  affected integer := 0;
+  n integer;
+begin
+  for u in select value from jsonb_array_elements(updates) loop
+    update public.outbound_call_queue q set
+      status = coalesce(u->>'status', q.status),
+      retell_call_id = coalesce(u->>'retell_call_id', q.retell_call_id),
+      active = case
+        when q.active = false then false
+        else coalesce((u->>'active')::boolean, q.active)
+      end,
+      call_duration_seconds = coalesce((u->>'call_duration_seconds')::integer, q.call_duration_seconds),
+      end_reason = coalesce(u->>'end_reason', q.end_reason),
+      updated_at = coalesce((u->>'updated_at')::timestamp, now())
+    where case
+      when u ? 'job_id' then q.job_id = u->>'job_id' and q.phone = u->>'phone'
+      else q.retell_call_id = u->>'retell_call_id'
+    end;
+
+    get diagnostics n = row_count;
+    affected := affected + n;
+  end loop;
+
+  return affected;
+end;
+$$;
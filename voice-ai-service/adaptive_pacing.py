@@ -0,0 +1,312 @@
+# Pacing adaptativo (modo predictivo) por campaña y troncal.
+#
+# Con ~30% de contestadas, marcar una llamada por cupo libre deja a Retell
+# ocioso. Aquí cada clave (campaña|troncal) tiene una meta de conversaciones
+# vivas y se permiten tantos originates en vuelo como hagan falta para
+# llegar a ella según la tasa HUMAN / resultados AMD de la ventana reciente:
+#
+#   permitidos = min(tope, ceil((meta - vivas) * sobremarcado))
+#   sobremarcado = 1 / tasa_humana (acotado); baja a 1 si los abandonos
+#   (HUMAN con las vivas ya en el tope) se acercan al límite
+#
+# Todo el estado vive en Redis, así que todos los nodos ven lo mismo:
+#   pacing:dialing:{clave}  ZSET job_id → ts   originates esperando AMD
+#   pacing:live:{clave}     ZSET job_id → ts   conversaciones vivas (HUMAN → call_ended)
+#   pacing:w:{clave}:{min}  HASH resolved/human/abandon por minuto
+
+import os
+import math
+import time
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from pacing import route_for_number, _parse_limits
+
+logger = logging.getLogger(__name__)
+
+# "fixed" (solo workers + CPS) o "adaptive"
+QUEUE_PACING_MODE = os.getenv("QUEUE_PACING_MODE", "fixed")
+PACING_TARGET_LIVE = float(os.getenv("PACING_TARGET_LIVE", 10))
+# Metas por campaña: "campana_a=20,agent_xyz=5"
+PACING_TARGETS = _parse_limits(os.getenv("PACING_TARGETS", ""))
+PACING_MAX_LIVE = int(os.getenv("PACING_MAX_LIVE", 20))
+PACING_MAX_DIALS = int(os.getenv("PACING_MAX_DIALS", 30))
+PACING_MAX_OVERDIAL = float(os.getenv("PACING_MAX_OVERDIAL", 3))
+PACING_ABANDON_LIMIT = float(os.getenv("PACING_ABANDON_LIMIT", 0.03))
+PACING_WINDOW_MINUTES = int(os.getenv("PACING_WINDOW_MINUTES", 10))
+PACING_MIN_SAMPLES = int(os.getenv("PACING_MIN_SAMPLES", 20))
+# Un originate sin resultado AMD en este tiempo deja de contar
+PACING_DIAL_TTL = int(os.getenv("PACING_DIAL_TTL", 90))
+# Una conversación sin call_ended en este tiempo deja de contar
+PACING_LIVE_TTL = int(os.getenv("PACING_LIVE_TTL", 1800))
+
+PREFIX = "pacing:"
+KEYS_SET = "pacing:keys"
+_STATE_TTL = 1.0
+
+# KEYS = dialing; ARGV = ahora_ms, ttl_ms, permitidos, job_id
+_TRY_DIAL_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[1]) - tonumber(ARGV[2]))
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+  redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+  redis.call('PEXPIRE', KEYS[1], ARGV[2])
+  return 1
+end
+return 0
+"""
+
+
+def pacing_key(agent_id: str, from_number: str, variables: Optional[dict] = None) -> str:
+    """campaign_id de las variables (o el agente) + troncal de salida"""
+    campaign = (variables or {}).get("campaign_id") or agent_id or "default"
+    return f"{campaign}|{route_for_number(from_number)}"
+
+
+class AdaptivePacer:
+    def __init__(self, client, async_client=None, mode: str = QUEUE_PACING_MODE,
+                 target_live: float = PACING_TARGET_LIVE, targets: Dict[str, float] = PACING_TARGETS,
+                 max_live: int = PACING_MAX_LIVE, max_dials: int = PACING_MAX_DIALS,
+                 max_overdial: float = PACING_MAX_OVERDIAL, abandon_limit: float = PACING_ABANDON_LIMIT,
+                 window_minutes: int = PACING_WINDOW_MINUTES, min_samples: int = PACING_MIN_SAMPLES):
+        self.redis = client
+        self.async_redis = async_client
+        self.enabled = mode == "adaptive"
+        self.target_live = target_live
+        self.targets = targets
+        self.max_live = max_live
+        self.max_dials = max_dials
+        self.max_overdial = max_overdial
+        self.abandon_limit = abandon_limit
+        self.window_minutes = window_minutes
+        self.min_samples = min_samples
+
+        self._try = client.register_script(_TRY_DIAL_SCRIPT)
+        self._atry = async_client.register_script(_TRY_DIAL_SCRIPT) if async_client else None
+        # clave → (monotonic, estado): el cálculo se reutiliza _STATE_TTL segundos
+        self._cache: Dict[str, Tuple[float, dict]] = {}
+        self.waits = 0
+
+    # ---------- controlador ----------
+    def _target(self, key: str) -> float:
+        campaign = key.split("|", 1)[0]
+        return min(self.targets.get(campaign, self.target_live), self.max_live)
+
+    def _window_keys(self, key: str):
+        minute = int(time.time() // 60)
+        return [f"{PREFIX}w:{key}:{m}" for m in range(minute - self.window_minutes + 1, minute + 1)]
+
+    def _compute(self, key: str, live: int, dialing: int, buckets: list) -> dict:
+        resolved = sum(int(b.get("resolved", 0)) for b in buckets)
+        human = sum(int(b.get("human", 0)) for b in buckets)
+        abandon = sum(int(b.get("abandon", 0)) for b in buckets)
+        human_rate = human / resolved if resolved else None
+        abandon_rate = abandon / human if human else 0.0
+
+        # Sin muestras suficientes no se sobremarca
+        overdial = 1.0
+        if human_rate is not None and resolved >= self.min_samples:
+            overdial = min(self.max_overdial, 1 / max(human_rate, 1 / self.max_overdial))
+            if abandon_rate >= self.abandon_limit:
+                overdial = 1.0
+            elif abandon_rate > self.abandon_limit / 2:
+                # Reducción lineal entre la mitad del límite y el límite
+                overdial = 1 + (overdial - 1) * (self.abandon_limit - abandon_rate) / (self.abandon_limit / 2)
+
+        target = self._target(key)
+        needed = max(0.0, target - live)
+        allowed = min(self.max_dials, math.ceil(needed * overdial)) if live < self.max_live else 0
+        return {
+            "target_live": target,
+            "live": live,
+            "dialing": dialing,
+            "allowed_dials": allowed,
+            "overdial": round(overdial, 2),
+            "human_rate": round(human_rate, 3) if human_rate is not None else None,
+            "abandon_rate": round(abandon_rate, 4),
+            "resolved": resolved,
+            "human": human,
+            "abandoned": abandon,
+        }
+
+    def _read_pipe(self, pipe, key: str, now_ms: int):
+        pipe.zcount(f"{PREFIX}live:{key}", now_ms - PACING_LIVE_TTL * 1000, "+inf")
+        pipe.zcount(f"{PREFIX}dialing:{key}", now_ms - PACING_DIAL_TTL * 1000, "+inf")
+        for wkey in self._window_keys(key):
+            pipe.hgetall(wkey)
+
+    def state(self, key: str, fresh: bool = False) -> dict:
+        cached = self._cache.get(key)
+        if cached and not fresh and time.monotonic() - cached[0] < _STATE_TTL:
+            return cached[1]
+        pipe = self.redis.pipeline(transaction=False)
+        self._read_pipe(pipe, key, int(time.time() * 1000))
+        live, dialing, *buckets = pipe.execute()
+        state = self._compute(key, int(live), int(dialing), buckets)
+        self._cache[key] = (time.monotonic(), state)
+        return state
+
+    async def astate(self, key: str) -> dict:
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < _STATE_TTL:
+            return cached[1]
+        pipe = self.async_redis.pipeline(transaction=False)
+        self._read_pipe(pipe, key, int(time.time() * 1000))
+        live, dialing, *buckets = await pipe.execute()
+        state = self._compute(key, int(live), int(dialing), buckets)
+        self._cache[key] = (time.monotonic(), state)
+        return state
+
+    # ---------- compuerta antes de originar ----------
+    def _try_args(self, state: dict, job_id: str) -> list:
+        return [int(time.time() * 1000), PACING_DIAL_TTL * 1000, state["allowed_dials"], job_id]
+
+    @staticmethod
+    def _lost(job_id: str) -> bool:
+        logger.warning(f"⚠️ Job {job_id[:8]}... lost its claim while waiting for pacing")
+        return False
+
+    def acquire(self, key: str, job_id: str, keepalive: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        Bloquea hasta que la clave admita otro originate. El trabajo ya está
+        reclamado (call_state): keepalive() renueva el claim mientras espera y
+        False indica que se perdió. Si Redis falla, deja pasar.
+        """
+        if not self.enabled:
+            return True
+        try:
+            self.redis.sadd(KEYS_SET, key)
+            while True:
+                state = self.state(key)
+                if self._try(keys=[f"{PREFIX}dialing:{key}"], args=self._try_args(state, job_id)):
+                    self.redis.hset(f"call:{job_id}", "pace_key", key)
+                    return True
+                if keepalive and not keepalive():
+                    return self._lost(job_id)
+                self.waits += 1
+                time.sleep(0.25 + random.uniform(0, 0.25))
+        except Exception as e:
+            logger.error(f"❌ Adaptive pacing error (allowing call): {e}")
+        return True
+
+    async def aacquire(self, key: str, job_id: str,
+                       keepalive: Optional[Callable[[], Awaitable[bool]]] = None) -> bool:
+        if not self.enabled:
+            return True
+        if self._atry is None:
+            return await asyncio.to_thread(self.acquire, key, job_id)
+        try:
+            await self.async_redis.sadd(KEYS_SET, key)
+            while True:
+                state = await self.astate(key)
+                if await self._atry(keys=[f"{PREFIX}dialing:{key}"], args=self._try_args(state, job_id)):
+                    await self.async_redis.hset(f"call:{job_id}", "pace_key", key)
+                    return True
+                if keepalive and not await keepalive():
+                    return self._lost(job_id)
+                self.waits += 1
+                await asyncio.sleep(0.25 + random.uniform(0, 0.25))
+        except Exception as e:
+            logger.error(f"❌ Adaptive pacing error (allowing call): {e}")
+        return True
+
+    def release(self, key: str, job_id: str):
+        """El originate falló: libera el cupo sin esperar AMD"""
+        if not self.enabled:
+            return
+        try:
+            self.redis.zrem(f"{PREFIX}dialing:{key}", job_id)
+        except Exception as e:
+            logger.error(f"Redis error (pacing release): {e}")
+
+    async def arelease(self, key: str, job_id: str):
+        if not self.enabled:
+            return
+        if self.async_redis is None:
+            return self.release(key, job_id)
+        try:
+            await self.async_redis.zrem(f"{PREFIX}dialing:{key}", job_id)
+        except Exception as e:
+            logger.error(f"Redis error (pacing release): {e}")
+
+    # ---------- resultados ----------
+    async def on_amd(self, job_id: Optional[str], result: str):
+        """Resultado del dialplan: cierra el originate y alimenta la ventana (una vez por trabajo)"""
+        if not self.enabled or not job_id:
+            return
+        try:
+            key = await self.async_redis.hget(f"call:{job_id}", "pace_key")
+            if not key:
+                return
+            # El dialplan puede repetir el aviso: solo el primero cuenta en la ventana
+            if not await self.async_redis.hsetnx(f"call:{job_id}", "pace_amd", result.upper()):
+                logger.info(f"⏭️ Pacing {key}: AMD for job {job_id[:8]}... already counted")
+                return
+            now_ms = int(time.time() * 1000)
+            human = result.upper() == "HUMAN"
+            bucket = self._window_keys(key)[-1]
+
+            abandoned = False
+            if human:
+                live = await self.async_redis.zcount(f"{PREFIX}live:{key}", now_ms - PACING_LIVE_TTL * 1000, "+inf")
+                abandoned = live >= self.max_live
+
+            pipe = self.async_redis.pipeline(transaction=False)
+            pipe.zrem(f"{PREFIX}dialing:{key}", job_id)
+            pipe.hincrby(bucket, "resolved", 1)
+            if human:
+                pipe.hincrby(bucket, "human", 1)
+                pipe.zadd(f"{PREFIX}live:{key}", {job_id: now_ms})
+                pipe.expire(f"{PREFIX}live:{key}", PACING_LIVE_TTL)
+            if abandoned:
+                pipe.hincrby(bucket, "abandon", 1)
+            pipe.expire(bucket, (self.window_minutes + 1) * 60)
+            await pipe.execute()
+            self._cache.pop(key, None)
+            if abandoned:
+                logger.warning(f"⚠️ Pacing {key}: HUMAN answered with {live} live calls (abandon)")
+        except Exception as e:
+            logger.error(f"Redis error (pacing AMD): {e}")
+
+    def on_call_ended(self, job_id: Optional[str]):
+        """call_ended de Retell: la conversación deja de contar como viva"""
+        if not self.enabled or not job_id:
+            return
+        try:
+            key = self.redis.hget(f"call:{job_id}", "pace_key")
+            if key:
+                self.redis.zrem(f"{PREFIX}live:{key}", job_id)
+                self._cache.pop(key, None)
+        except Exception as e:
+            logger.error(f"Redis error (pacing call_ended): {e}")
+
+    # ---------- estado ----------
+    def stats(self) -> dict:
+        out = {
+            "mode": "adaptive" if self.enabled else "fixed",
+            "caps": {
+                "target_live": self.target_live,
+                "targets": dict(self.targets),
+                "max_live": self.max_live,
+                "max_dials": self.max_dials,
+                "max_overdial": self.max_overdial,
+                "abandon_limit": self.abandon_limit,
+                "window_minutes": self.window_minutes,
+            },
+            "waits": self.waits,
+            "keys": {},
+        }
+        if not self.enabled:
+            return out
+        try:
+            for key in sorted(self.redis.smembers(KEYS_SET)):
+                state = self.state(key, fresh=True)
+                if not (state["live"] or state["dialing"] or state["resolved"]):
+                    # Sin actividad en toda la ventana: se olvida la clave
+                    self.redis.srem(KEYS_SET, key)
+                    continue
+                out["keys"][key] = state
+        except Exception as e:
+            logger.error(f"❌ Adaptive pacing stats error: {e}")
+        return out
@@ -0,0 +1,254 @@
+# Pool de sesiones AMI autenticadas y reutilizables.
+# Evita el connect + login + logoff por cada Originate/Getvar.
+
+import threading
+import time
+import uuid
+import logging
+from queue import LifoQueue, Empty
+from typing import Optional, Dict
+
+import asterisk.manager
+
+from metrics import AMI_ACTION_SECONDS, AMI_ACTION_ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+class AMIPoolError(Exception):
+    """No se pudo obtener o usar una sesión AMI del pool"""
+
+
+# ========== ESTADÍSTICAS POR ACCIÓN ==========
+class _ActionStats:
+    __slots__ = ("count", "errors", "total_ms", "max_ms", "last_ms")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+
+    def record(self, elapsed_ms: float, ok: bool):
+        self.count += 1
+        if not ok:
+            self.errors += 1
+        self.total_ms += elapsed_ms
+        self.last_ms = elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "last_ms": round(self.last_ms, 2),
+        }
+
+
+# ========== POOL ==========
+class AMIConnectionPool:
+    """
+    Mantiene hasta `size` sesiones AMI logueadas.
+    Cada sesión se presta a un solo hilo a la vez, así la respuesta que
+    llega por la sesión corresponde a la acción enviada (se valida ActionID).
+    """
+
+    def __init__(self, host: str, port: int, username: str, secret: str,
+                 size: int = 4, acquire_timeout: float = 10.0,
+                 health_interval: float = 30.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.secret = secret
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.health_interval = health_interval
+
+        self._idle: LifoQueue = LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _ActionStats] = {}
+        self._stats_lock = threading.Lock()
+        self._reconnects = 0
+        self._closed = False
+        self._health_thread: Optional[threading.Thread] = None
+
+    # ---------- ciclo de vida ----------
+    def start(self):
+        """Arranca el hilo de health check (idempotente)"""
+        if self._health_thread and self._health_thread.is_alive():
+            return
+        self._closed = False
+        self._health_thread = threading.Thread(
+            target=self._health_loop, daemon=True, name="AMI-Health"
+        )
+        self._health_thread.start()
+        logger.info(f"✅ AMI pool ready ({self.host}:{self.port}, size={self.size})")
+
+    def close(self):
+        """Cierra todas las sesiones ociosas (logoff)"""
+        self._closed = True
+        while True:
+            try:
+                manager = self._idle.get_nowait()
+            except Empty:
+                break
+            self._discard(manager)
+        logger.info("🔌 AMI pool closed")
+
+    # ---------- sesiones ----------
+    def _connect(self) -> asterisk.manager.Manager:
+        manager = asterisk.manager.Manager()
+        manager.connect(self.host, self.port)
+        manager.login(self.username, self.secret)
+        return manager
+
+    def _discard(self, manager: asterisk.manager.Manager):
+        with self._lock:
+            self._created -= 1
+        try:
+            manager.close()
+        except Exception:
+            pass
+
+    def _acquire(self) -> asterisk.manager.Manager:
+        if self._closed:
+            raise AMIPoolError("AMI pool is closed")
+
+        try:
+            manager = self._idle.get_nowait()
+        except Empty:
+            manager = None
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._connect()
+                except Exception as e:
+                    with self._lock:
+                        self._created -= 1
+                    raise AMIPoolError(f"AMI connect failed: {e}") from e
+            try:
+                manager = self._idle.get(timeout=self.acquire_timeout)
+            except Empty:
+                raise AMIPoolError("Timeout waiting for an AMI session")
+
+        # Sesión caída mientras estaba ociosa → reconectar en su lugar
+        if not manager.connected():
+            try:
+                manager.close()
+            except Exception:
+                pass
+            try:
+                manager = self._connect()
+                self._reconnects += 1
+                logger.info("🔄 AMI session reconnected")
+            except Exception as e:
+                with self._lock:
+                    self._created -= 1
+                raise AMIPoolError(f"AMI reconnect failed: {e}") from e
+        return manager
+
+    def _release(self, manager: asterisk.manager.Manager, broken: bool = False):
+        if broken or self._closed or not manager.connected():
+            self._discard(manager)
+        else:
+            self._idle.put(manager)
+
+    # ---------- acciones ----------
+    def send_action(self, action: dict) -> asterisk.manager.ManagerMsg:
+        """Envía una acción AMI por una sesión del pool y devuelve la respuesta"""
+        name = action.get("Action", "Unknown")
+        action_id = action.setdefault("ActionID", uuid.uuid4().hex)
+
+        manager = self._acquire()
+        broken = False
+        ok = False
+        start = time.perf_counter()
+        try:
+            response = manager.send_action(action)
+            if response.get_header("ActionID") not in (None, action_id):
+                # Respuesta de otra acción: la sesión quedó desincronizada
+                broken = True
+                raise AMIPoolError(
+                    f"ActionID mismatch: sent {action_id}, got {response.get_header('ActionID')}"
+                )
+            ok = response.get_header("Response") != "Error"
+            return response
+        except asterisk.manager.ManagerSocketException:
+            broken = True
+            raise
+        finally:
+            self._record(name, (time.perf_counter() - start) * 1000, ok)
+            self._release(manager, broken=broken)
+
+    def originate(self, **fields) -> asterisk.manager.ManagerMsg:
+        action = {"Action": "Originate"}
+        action.update(fields)
+        return self.send_action(action)
+
+    def getvar(self, channel: str, variable: str) -> Optional[str]:
+        response = self.send_action({
+            "Action": "Getvar",
+            "Channel": channel,
+            "Variable": variable,
+        })
+        return response.get_header("Value")
+
+    def command(self, command: str) -> asterisk.manager.ManagerMsg:
+        return self.send_action({"Action": "Command", "Command": command})
+
+    # ---------- health check ----------
+    def _health_loop(self):
+        while not self._closed:
+            time.sleep(self.health_interval)
+            self._check_idle()
+
+    def _check_idle(self):
+        """Hace Ping a las sesiones ociosas y descarta las que no responden"""
+        checked = []
+        while True:
+            try:
+                checked.append(self._idle.get_nowait())
+            except Empty:
+                break
+
+        for manager in checked:
+            try:
+                if not manager.connected():
+                    raise AMIPoolError("disconnected")
+                manager.ping()
+                self._idle.put(manager)
+            except Exception as e:
+                logger.warning(f"⚠️ AMI idle session dropped: {e}")
+                self._discard(manager)
+
+    # ---------- métricas ----------
+    def _record(self, action: str, elapsed_ms: float, ok: bool):
+        AMI_ACTION_SECONDS.labels(action).observe(elapsed_ms / 1000)
+        if not ok:
+            AMI_ACTION_ERRORS.labels(action).inc()
+        with self._stats_lock:
+            stats = self._stats.get(action)
+            if stats is None:
+                stats = self._stats[action] = _ActionStats()
+            stats.record(elapsed_ms, ok)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            actions = {name: s.to_dict() for name, s in self._stats.items()}
+        idle = self._idle.qsize()
+        return {
+            "size": self.size,
+            "open": self._created,
+            "idle": idle,
+            "in_use": max(self._created - idle, 0),
+            "reconnects": self._reconnects,
+            "actions": actions,
+        }
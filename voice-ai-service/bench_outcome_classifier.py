@@ -0,0 +1,73 @@
+# Precisión y latencia del clasificador de resultados sobre el corpus
+# etiquetado (fixtures/outcome_corpus.jsonl).
+#
+#   python bench_outcome_classifier.py [--iterations 20000] [--verbose]
+
+import os
+import sys
+import json
+import time
+import argparse
+from collections import Counter
+
+from outcome_classifier import OutcomeClassifier
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "outcome_corpus.jsonl")
+
+
+def load_corpus(path: str = CORPUS_PATH) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(classifier: OutcomeClassifier, corpus: list, verbose: bool = False) -> float:
+    errors = Counter()
+    correct = 0
+    for case in corpus:
+        result = classifier.classify(case["summary"], case.get("custom"), case.get("locale"))
+        if result.outcome == case["expected"]:
+            correct += 1
+        else:
+            errors[(case["expected"], result.outcome)] += 1
+            print(f"❌ expected={case['expected']} got={result!r}\n   {case['summary']}")
+        if verbose:
+            print(f"   {result.outcome:<15} {result.confidence:.2f} {result.source:<20} {case['summary'][:60]}")
+
+    accuracy = correct / len(corpus) if corpus else 0.0
+    print(f"Accuracy: {correct}/{len(corpus)} ({accuracy:.1%})")
+    for (expected, got), count in errors.most_common():
+        print(f"  {expected} → {got}: {count}")
+    return accuracy
+
+
+def benchmark(classifier: OutcomeClassifier, corpus: list, iterations: int):
+    start = time.perf_counter()
+    compiled = OutcomeClassifier()
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    summaries = [(c["summary"], c.get("custom"), c.get("locale")) for c in corpus]
+    start = time.perf_counter()
+    for i in range(iterations):
+        summary, custom, locale = summaries[i % len(summaries)]
+        classifier.classify(summary, custom, locale)
+    elapsed = time.perf_counter() - start
+
+    print(f"Compile: {compile_ms:.2f}ms ({len(compiled._groups)} phrases)")
+    print(f"Classify: {elapsed / iterations * 1e6:.1f}µs/call over {iterations} calls")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    classifier = OutcomeClassifier()
+    accuracy = evaluate(classifier, corpus, args.verbose)
+    benchmark(classifier, corpus, args.iterations)
+    sys.exit(0 if accuracy == 1.0 else 1)
+
+
+if __name__ == "__main__":
+    main()
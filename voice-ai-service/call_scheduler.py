@@ -0,0 +1,334 @@
+# Trabajos diferidos: callbacks pedidos por el cliente y reintentos de
+# NO_ANSWER/BUSY con backoff exponencial.
+#
+# calls:scheduled      ZSET sched_id → vencimiento (epoch ms)
+# calls:scheduled:run  ZSET sched_id → fin del lease (reclamados, sin confirmar)
+# calls:sched:payload  HASH sched_id → JSON del trabajo
+# calls:sched:phone    HASH teléfono → sched_id (uno pendiente por número)
+#
+# Cualquier nodo reclama lo vencido con un script atómico; si muere antes de
+# reencolar, el lease vence y el trabajo vuelve a la cola (al-menos-una-vez).
+# Solo se reclama lo que cabe bajo SCHEDULER_MAX_BACKLOG: los reintentos
+# llenan la capacidad ociosa del dialer sin desplazar lotes nuevos.
+
+import os
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Optional, List
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+SCHEDULED_KEY = "calls:scheduled"
+RUNNING_KEY = "calls:scheduled:run"
+PAYLOAD_KEY = "calls:sched:payload"
+PHONE_KEY = "calls:sched:phone"
+
+SCHEDULER_POLL_INTERVAL = float(os.getenv("SCHEDULER_POLL_INTERVAL", 1))
+SCHEDULER_BATCH = int(os.getenv("SCHEDULER_BATCH", 50))
+SCHEDULER_MAX_BACKLOG = int(os.getenv("SCHEDULER_MAX_BACKLOG", 200))
+SCHEDULER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", 60))
+
+RETRY_RESULTS = {r.strip().upper() for r in os.getenv("RETRY_RESULTS", "NO_ANSWER,BUSY").split(",") if r.strip()}
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 3))
+RETRY_BASE_MINUTES = float(os.getenv("RETRY_BASE_MINUTES", 30))
+RETRY_MAX_MINUTES = float(os.getenv("RETRY_MAX_MINUTES", 24 * 60))
+CALLBACK_DEFAULT_MINUTES = float(os.getenv("CALLBACK_DEFAULT_MINUTES", 120))
+CALLBACK_MAX_DAYS = float(os.getenv("CALLBACK_MAX_DAYS", 30))
+# Zona horaria de las horas de callback sin offset que extrae el agente
+CALLBACK_TIMEZONE = ZoneInfo(os.getenv("CALLBACK_TIMEZONE", "America/Costa_Rica"))
+# Campos de custom_analysis_data con la hora pedida por el cliente
+CALLBACK_TIME_FIELDS = ("callback_time", "callback_at", "callback_datetime")
+
+# KEYS = scheduled, payload, phone; ARGV = id, due_ms, payload, phone
+# Reemplaza el pendiente anterior del mismo número
+_SCHEDULE_SCRIPT = """
+local old = redis.call('HGET', KEYS[3], ARGV[4])
+if old then
+  redis.call('ZREM', KEYS[1], old)
+  redis.call('HDEL', KEYS[2], old)
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('HSET', KEYS[3], ARGV[4], ARGV[1])
+return old or ''
+"""
+
+# KEYS = scheduled, running, payload; ARGV = now_ms, n, lease_ms
+# Devuelve [id1, payload1, id2, payload2, ...]
+_CLAIM_SCRIPT = """
+local now = tonumber(ARGV[1])
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now, 'LIMIT', 0, 100)
+for _, id in ipairs(expired) do
+  redis.call('ZREM', KEYS[2], id)
+  redis.call('ZADD', KEYS[1], now, id)
+end
+local n = tonumber(ARGV[2])
+if n <= 0 then return {} end
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, n)
+local out = {}
+for _, id in ipairs(due) do
+  redis.call('ZREM', KEYS[1], id)
+  redis.call('ZADD', KEYS[2], now + tonumber(ARGV[3]), id)
+  out[#out + 1] = id
+  out[#out + 1] = redis.call('HGET', KEYS[3], id) or ''
+end
+return out
+"""
+
+# KEYS = zset (scheduled o running), payload, phone; ARGV = id, phone
+# Quita el trabajo solo si sigue en ese zset
+_REMOVE_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then return 0 end
+redis.call('HDEL', KEYS[2], ARGV[1])
+if redis.call('HGET', KEYS[3], ARGV[2]) == ARGV[1] then
+  redis.call('HDEL', KEYS[3], ARGV[2])
+end
+return 1
+"""
+
+
+def parse_callback_time(custom_data: dict, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Hora pedida por el cliente (UTC) o None si no vino o no es válida"""
+    now = now or datetime.now(timezone.utc)
+    for field in CALLBACK_TIME_FIELDS:
+        raw = (custom_data or {}).get(field)
+        if not raw:
+            continue
+        try:
+            when = datetime.fromisoformat(str(raw).strip().replace("Z", "+00:00"))
+        except ValueError:
+            logger.warning(f"⚠️ Unparseable {field}: {raw!r}")
+            continue
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=CALLBACK_TIMEZONE)
+        when = when.astimezone(timezone.utc)
+        if now < when <= now + timedelta(days=CALLBACK_MAX_DAYS):
+            return when
+    return None
+
+
+def retry_delay_seconds(attempt: int) -> float:
+    """Backoff para el intento siguiente al número `attempt` (1, 2, ...), con ±10% de jitter"""
+    minutes = min(RETRY_MAX_MINUTES, RETRY_BASE_MINUTES * (2 ** (attempt - 1)))
+    return minutes * 60 * random.uniform(0.9, 1.1)
+
+
+class CallScheduler:
+    """
+    submit(item) → job_id reencola un trabajo vencido (None si se descartó).
+    backlog() → trabajos esperando en la cola principal.
+    """
+
+    def __init__(self, client, submit: Callable[[dict], Optional[str]], backlog: Callable[[], int],
+                 poll_interval: float = SCHEDULER_POLL_INTERVAL, batch: int = SCHEDULER_BATCH,
+                 max_backlog: int = SCHEDULER_MAX_BACKLOG, lease_seconds: int = SCHEDULER_LEASE_SECONDS):
+        self.redis = client
+        self.submit = submit
+        self.backlog = backlog
+        self.poll_interval = poll_interval
+        self.batch = batch
+        self.max_backlog = max_backlog
+        self.lease_ms = lease_seconds * 1000
+
+        self._schedule = client.register_script(_SCHEDULE_SCRIPT)
+        self._claim = client.register_script(_CLAIM_SCRIPT)
+        self._remove = client.register_script(_REMOVE_SCRIPT)
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Métricas
+        self.scheduled = 0
+        self.requeued = 0
+        self.dropped = 0
+        self.cancelled = 0
+        self.exhausted = 0
+        self.errors = 0
+
+    # ---------- programar ----------
+    def schedule(self, item: dict, due: datetime) -> str:
+        """Programa un trabajo; reemplaza el pendiente anterior del mismo número"""
+        sched_id = uuid.uuid4().hex
+        item = {**item, "sched_id": sched_id, "due_at": due.isoformat()}
+        due_ms = int(due.timestamp() * 1000)
+        self._schedule(keys=[SCHEDULED_KEY, PAYLOAD_KEY, PHONE_KEY],
+                       args=[sched_id, due_ms, json.dumps(item), item["to_number"]])
+        self.scheduled += 1
+        self._wakeup.set()
+        logger.info(f"⏰ Scheduled {item.get('reason')} for {item['to_number']} at {due.isoformat()} "
+                    f"(attempt {item.get('attempt')})")
+        return sched_id
+
+    @staticmethod
+    def _item_from_job(job: dict, attempt: int, reason: str) -> dict:
+        try:
+            variables = json.loads(job.get("variables") or "{}")
+        except ValueError:
+            variables = {}
+        return {
+            "to_number": job["to_number"],
+            "from_number": job.get("from_number"),
+            "agent_id": job.get("agent_id"),
+            "variables": variables,
+            "attempt": attempt,
+            "reason": reason,
+            "previous_job_id": job.get("id"),
+            "campaign_id": job.get("campaign_id"),
+        }
+
+    def _job(self, job_id: Optional[str]) -> Optional[dict]:
+        if not job_id:
+            return None
+        try:
+            return self.redis.hgetall(f"call:{job_id}") or None
+        except Exception as e:
+            logger.error(f"Redis error (scheduler job lookup): {e}")
+            return None
+
+    def retry_job(self, job_id: Optional[str], result: str) -> Optional[str]:
+        """NO_ANSWER/BUSY: reintento con backoff si quedan intentos"""
+        if result.upper() not in RETRY_RESULTS:
+            return None
+        job = self._job(job_id)
+        if not job:
+            return None
+        attempt = int(job.get("attempt") or 1)
+        if attempt >= RETRY_MAX_ATTEMPTS:
+            self.exhausted += 1
+            logger.info(f"🛑 {job.get('to_number')}: {result} after {attempt} attempts, no more retries")
+            return None
+        due = datetime.now(timezone.utc) + timedelta(seconds=retry_delay_seconds(attempt))
+        return self.schedule(self._item_from_job(job, attempt + 1, result.lower()), due)
+
+    def callback_job(self, job_id: Optional[str], custom_data: dict, call: Optional[dict] = None) -> Optional[str]:
+        """
+        Callback pedido: a la hora indicada o CALLBACK_DEFAULT_MINUTES después.
+        Si el trabajo ya expiró de Redis se usa el objeto call de Retell.
+        """
+        job = self._job(job_id)
+        if not job and call and call.get("to_number"):
+            job = {
+                "to_number": call["to_number"],
+                "from_number": call.get("from_number"),
+                "agent_id": call.get("agent_id"),
+                "variables": json.dumps(call.get("retell_llm_dynamic_variables") or {}),
+            }
+        if not job:
+            return None
+        due = parse_callback_time(custom_data) or (
+            datetime.now(timezone.utc) + timedelta(minutes=CALLBACK_DEFAULT_MINUTES))
+        # Un callback no consume intentos de no_answer/busy
+        return self.schedule(self._item_from_job(job, 1, "callback"), due)
+
+    # ---------- cancelar / consultar ----------
+    def _payload(self, sched_id: str) -> Optional[dict]:
+        raw = self.redis.hget(PAYLOAD_KEY, sched_id)
+        return json.loads(raw) if raw else None
+
+    def cancel(self, sched_id: str) -> bool:
+        item = self._payload(sched_id)
+        if not item:
+            return False
+        removed = bool(self._remove(keys=[SCHEDULED_KEY, PAYLOAD_KEY, PHONE_KEY],
+                                    args=[sched_id, item["to_number"]]))
+        if removed:
+            self.cancelled += 1
+        return removed
+
+    def cancel_phone(self, phone: str) -> bool:
+        sched_id = self.redis.hget(PHONE_KEY, phone)
+        return self.cancel(sched_id) if sched_id else False
+
+    def upcoming(self, limit: int = 50) -> List[dict]:
+        entries = self.redis.zrange(SCHEDULED_KEY, 0, limit - 1, withscores=True)
+        if not entries:
+            return []
+        payloads = self.redis.hmget(PAYLOAD_KEY, [sched_id for sched_id, _ in entries])
+        return [json.loads(raw) for raw in payloads if raw]
+
+    # ---------- sondeo ----------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="CallScheduler")
+        self._thread.start()
+        logger.info("✅ Call scheduler started")
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self.poll_once()
+                if claimed >= self.batch:
+                    continue
+                delay = self._until_next_due()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"❌ Call scheduler error: {e}")
+                delay = self.poll_interval
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+    def _until_next_due(self) -> float:
+        head = self.redis.zrange(SCHEDULED_KEY, 0, 0, withscores=True)
+        if not head:
+            return self.poll_interval
+        return max(0.05, min(self.poll_interval, head[0][1] / 1000 - time.time()))
+
+    def poll_once(self) -> int:
+        """Reencola lo vencido que quepa en la cola principal; devuelve cuántos reclamó"""
+        room = min(self.batch, self.max_backlog - self.backlog())
+        flat = self._claim(keys=[SCHEDULED_KEY, RUNNING_KEY, PAYLOAD_KEY],
+                           args=[int(time.time() * 1000), max(room, 0), self.lease_ms])
+        for sched_id, raw in zip(flat[::2], flat[1::2]):
+            if not raw:
+                self.redis.zrem(RUNNING_KEY, sched_id)
+                continue
+            item = json.loads(raw)
+            try:
+                job_id = self.submit(item)
+            except Exception as e:
+                # El lease vence y el trabajo vuelve a calls:scheduled
+                self.errors += 1
+                logger.error(f"❌ Requeue failed for {item.get('to_number')}: {e}")
+                continue
+            self._remove(keys=[RUNNING_KEY, PAYLOAD_KEY, PHONE_KEY], args=[sched_id, item["to_number"]])
+            if not job_id:
+                self.dropped += 1
+                continue
+            self.requeued += 1
+            logger.info(f"🔁 Requeued {item.get('reason')} for {item['to_number']} → job {job_id[:8]}...")
+        return len(flat) // 2
+
+    def stats(self) -> dict:
+        try:
+            pending = self.redis.zcard(SCHEDULED_KEY)
+            running = self.redis.zcard(RUNNING_KEY)
+            head = self.redis.zrange(SCHEDULED_KEY, 0, 0, withscores=True)
+        except Exception as e:
+            logger.error(f"Redis error (scheduler stats): {e}")
+            pending = running = None
+            head = []
+        return {
+            "pending": pending,
+            "claimed": running,
+            "next_due_in_s": round(head[0][1] / 1000 - time.time(), 1) if head else None,
+            "scheduled": self.scheduled,
+            "requeued": self.requeued,
+            "dropped": self.dropped,
+            "cancelled": self.cancelled,
+            "exhausted": self.exhausted,
+            "errors": self.errors,
+        }
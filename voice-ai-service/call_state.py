@@ -0,0 +1,252 @@
+# Estado del trabajo en call:{job_id} y conteo por estado.
+#
+# Antes de cualquier espera (pacing adaptativo, cupo de llamadas vivas) el
+# worker reclama el trabajo con un compare-and-set queued → claimed. Si la
+# entrada de la cola se vuelve a entregar mientras tanto, el segundo worker
+# pierde el claim y no marca. El claim es un lease (claim_until): si el
+# worker muere, otro lo toma cuando vence, igual que la entrada pendiente.
+#
+# Conteo por estado sin recorrer las claves call:*:
+#   - queued/claimed/calling/active son niveles actuales: un ZSET por estado
+#     (job_id → ms de entrada). Solo cuentan las entradas más nuevas que
+#     JOB_TTL, lo mismo que vive call:{job_id}; un trabajo que nunca recibe
+#     su evento terminal deja de contarse solo, sin decremento.
+#   - voicemail/completed/failed son acumulados (HASH calls:states).
+# Las transiciones solo avanzan (STATE_RANK): un webhook atrasado no
+# devuelve el trabajo a un estado anterior.
+#
+#   call:{job_id}          state, claimed_by, claim_until (epoch ms)
+#   calls:level:{estado}   ZSET job_id → ms de entrada al estado
+#   calls:states           HASH estado terminal → acumulado
+
+import time
+import logging
+from typing import Awaitable, Callable, Optional, Tuple
+
+from job_queue import JOB_CLAIM_IDLE_MS
+from call_timeline import JOB_TTL
+
+logger = logging.getLogger(__name__)
+
+STATE_COUNTS_KEY = "calls:states"
+LEVEL_PREFIX = "calls:level:"
+
+STATE_RANK = {
+    "queued": 0,
+    "claimed": 1,
+    "calling": 2,
+    "active": 3,
+    "voicemail": 4,
+    "completed": 4,
+    "failed": 4,
+}
+LEVEL_STATES = ["queued", "claimed", "calling", "active"]
+TERMINAL_STATES = [state for state in STATE_RANK if state not in LEVEL_STATES]
+
+# Tablas Lua: rango por estado y posición en KEYS del ZSET de cada nivel
+_LUA_TABLES = "local rank = {%s}\nlocal level = {%s}\n" % (
+    ", ".join(f"{state}={rank}" for state, rank in STATE_RANK.items()),
+    ", ".join(f"{state}={i + 3}" for i, state in enumerate(LEVEL_STATES)),
+)
+
+# Resultado de claim()
+CLAIMED = "claimed"
+HELD = "held"          # otro worker lo tiene con el lease vigente
+DONE = "done"          # ya salió de queued (redelivery de un trabajo atendido)
+MISSING = "missing"
+
+# KEYS = call:{job_id}, STATE_COUNTS_KEY, un ZSET por estado de LEVEL_STATES
+# ARGV = dueño ('' = cualquiera), ahora_ms, ttl_ms, job_id, estado, campo1, valor1, ...
+# Devuelve {cambió, hash}; false si el trabajo no existe o ya no es de ese worker
+_SET_STATE_SCRIPT = _LUA_TABLES + """
+if ARGV[1] ~= '' and redis.call('HGET', KEYS[1], 'claimed_by') ~= ARGV[1] then return false end
+local prev = redis.call('HGET', KEYS[1], 'state')
+if not prev then return false end
+local new = ARGV[5]
+if (rank[new] or 0) <= (rank[prev] or 0) then
+  return {0, redis.call('HGETALL', KEYS[1])}
+end
+redis.call('HSET', KEYS[1], 'state', new, unpack(ARGV, 6))
+if level[prev] then redis.call('ZREM', KEYS[level[prev]], ARGV[4]) end
+if level[new] then
+  redis.call('ZADD', KEYS[level[new]], ARGV[2], ARGV[4])
+  redis.call('ZREMRANGEBYSCORE', KEYS[level[new]], '-inf', tonumber(ARGV[2]) - tonumber(ARGV[3]))
+else
+  redis.call('HINCRBY', KEYS[2], new, 1)
+end
+return {1, redis.call('HGETALL', KEYS[1])}
+"""
+
+# Mismas KEYS; ARGV = dueño, ahora_ms, lease_ms, job_id
+# Devuelve {resultado, estado anterior}
+_CLAIM_SCRIPT = _LUA_TABLES + """
+local state = redis.call('HGET', KEYS[1], 'state')
+if not state then return {'missing', ''} end
+if state == 'claimed' then
+  if tonumber(redis.call('HGET', KEYS[1], 'claim_until') or '0') > tonumber(ARGV[2]) then
+    return {'held', state}
+  end
+elseif state ~= 'queued' then
+  return {'done', state}
+end
+redis.call('HSET', KEYS[1], 'state', 'claimed', 'claimed_by', ARGV[1],
+           'claim_until', tonumber(ARGV[2]) + tonumber(ARGV[3]))
+redis.call('ZREM', KEYS[level[state]], ARGV[4])
+redis.call('ZADD', KEYS[level['claimed']], ARGV[2], ARGV[4])
+return {'claimed', state}
+"""
+
+# KEYS = call:{job_id}; ARGV = dueño, vencimiento_ms
+_RENEW_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'state') ~= 'claimed'
+   or redis.call('HGET', KEYS[1], 'claimed_by') ~= ARGV[1] then return 0 end
+redis.call('HSET', KEYS[1], 'claim_until', ARGV[2])
+return 1
+"""
+
+
+def _as_dict(flat: list) -> dict:
+    return dict(zip(flat[::2], flat[1::2]))
+
+
+class CallStateStore:
+    """claim() antes de esperar; set() para cada transición del dispatcher"""
+
+    def __init__(self, client, async_client=None, counts_key: str = STATE_COUNTS_KEY,
+                 level_prefix: str = LEVEL_PREFIX, job_ttl: int = JOB_TTL,
+                 claim_lease_ms: int = JOB_CLAIM_IDLE_MS):
+        self.redis = client
+        self.async_redis = async_client
+        self.counts_key = counts_key
+        self.level_keys = [f"{level_prefix}{state}" for state in LEVEL_STATES]
+        self.job_ttl_ms = job_ttl * 1000
+        self.claim_lease_ms = claim_lease_ms
+
+        self._set = client.register_script(_SET_STATE_SCRIPT)
+        self._claim = client.register_script(_CLAIM_SCRIPT)
+        self._renew = client.register_script(_RENEW_SCRIPT)
+        self._aset = async_client.register_script(_SET_STATE_SCRIPT) if async_client else None
+        self._aclaim = async_client.register_script(_CLAIM_SCRIPT) if async_client else None
+        self._arenew = async_client.register_script(_RENEW_SCRIPT) if async_client else None
+
+        # Métricas
+        self.held = 0
+
+    def _keys(self, job_id: str) -> list:
+        return [f"call:{job_id}", self.counts_key] + self.level_keys
+
+    def add_queued(self, pipe, job_id: str):
+        """Dentro del pipeline de submit_call: el trabajo entra al nivel queued"""
+        pipe.zadd(self.level_keys[0], {job_id: int(time.time() * 1000)})
+
+    # ---------- transiciones ----------
+    def _set_args(self, job_id: str, state: str, fields: dict, owner: Optional[str]):
+        args = [owner or "", int(time.time() * 1000), self.job_ttl_ms, job_id, state]
+        for field, value in fields.items():
+            args.extend([field, value])
+        return self._keys(job_id), args
+
+    @staticmethod
+    def _on_set(res) -> Optional[Tuple[bool, dict]]:
+        if res is None:
+            return None
+        return bool(int(res[0])), _as_dict(res[1])
+
+    def set(self, job_id: str, state: str, fields: Optional[dict] = None,
+            owner: Optional[str] = None) -> Optional[Tuple[bool, dict]]:
+        """
+        (cambió, hash). Un estado que no avanza no cambia nada. None si el
+        trabajo ya no existe o `owner` ya no tiene el claim.
+        """
+        keys, args = self._set_args(job_id, state, fields or {}, owner)
+        return self._on_set(self._set(keys=keys, args=args))
+
+    async def aset(self, job_id: str, state: str, fields: Optional[dict] = None,
+                   owner: Optional[str] = None) -> Optional[Tuple[bool, dict]]:
+        if self._aset is None:
+            return self.set(job_id, state, fields, owner)
+        keys, args = self._set_args(job_id, state, fields or {}, owner)
+        return self._on_set(await self._aset(keys=keys, args=args))
+
+    # ---------- claim ----------
+    def _claim_args(self, job_id: str, owner: str):
+        return self._keys(job_id), [owner, int(time.time() * 1000), self.claim_lease_ms, job_id]
+
+    def _on_claim(self, res) -> Tuple[str, str]:
+        outcome, prev = res[0], res[1]
+        if outcome == HELD:
+            self.held += 1
+        return outcome, prev
+
+    def claim(self, job_id: str, owner: str) -> Tuple[str, str]:
+        """(CLAIMED|HELD|DONE|MISSING, estado anterior)"""
+        keys, args = self._claim_args(job_id, owner)
+        return self._on_claim(self._claim(keys=keys, args=args))
+
+    async def aclaim(self, job_id: str, owner: str) -> Tuple[str, str]:
+        if self._aclaim is None:
+            return self.claim(job_id, owner)
+        keys, args = self._claim_args(job_id, owner)
+        return self._on_claim(await self._aclaim(keys=keys, args=args))
+
+    def renew(self, job_id: str, owner: str) -> bool:
+        """Extiende el lease; False si el claim ya no es de `owner`"""
+        return bool(self._renew(keys=[f"call:{job_id}"],
+                                args=[owner, int(time.time() * 1000) + self.claim_lease_ms]))
+
+    async def arenew(self, job_id: str, owner: str) -> bool:
+        if self._arenew is None:
+            return self.renew(job_id, owner)
+        return bool(await self._arenew(keys=[f"call:{job_id}"],
+                                       args=[owner, int(time.time() * 1000) + self.claim_lease_ms]))
+
+    def _renew_interval(self, interval: Optional[float]) -> float:
+        return self.claim_lease_ms / 4000 if interval is None else interval
+
+    def keepalive(self, job_queue, entry_id: str, job_id: str, owner: str,
+                  interval: Optional[float] = None) -> Callable[[], bool]:
+        """
+        Para las esperas antes de marcar: cada `interval` s renueva el claim y
+        el lease de la entrada en la cola, así no se vuelve a entregar mientras
+        el worker sigue vivo. Devuelve False si el claim se perdió.
+        """
+        interval = self._renew_interval(interval)
+        last = time.monotonic()
+
+        def keepalive() -> bool:
+            nonlocal last
+            if time.monotonic() - last < interval:
+                return True
+            last = time.monotonic()
+            job_queue.touch(entry_id)
+            return self.renew(job_id, owner)
+
+        return keepalive
+
+    def akeepalive(self, job_queue, entry_id: str, job_id: str, owner: str,
+                   interval: Optional[float] = None) -> Callable[[], Awaitable[bool]]:
+        interval = self._renew_interval(interval)
+        last = time.monotonic()
+
+        async def keepalive() -> bool:
+            nonlocal last
+            if time.monotonic() - last < interval:
+                return True
+            last = time.monotonic()
+            await job_queue.atouch(entry_id)
+            return await self.arenew(job_id, owner)
+
+        return keepalive
+
+    # ---------- conteo ----------
+    def counts(self) -> dict:
+        """Niveles actuales (queued..active) y acumulados terminales"""
+        since = int(time.time() * 1000) - self.job_ttl_ms
+        pipe = self.redis.pipeline(transaction=False)
+        for key in self.level_keys:
+            pipe.zcount(key, since, "+inf")
+        pipe.hgetall(self.counts_key)
+        *levels, totals = pipe.execute()
+        out = dict(zip(LEVEL_STATES, levels))
+        out.update({state: int(totals.get(state, 0)) for state in TERMINAL_STATES})
+        return out
@@ -0,0 +1,223 @@
+# Línea de tiempo por llamada: cada etapa se marca una vez (t_<etapa>, epoch
+# ms) en el hash call:{job_id}. AMD y webhooks solo conocen el retell_call_id,
+# así que al registrar se guarda el índice inverso retell_job:{id} → job_id.
+# Cada intervalo entre etapas se guarda como muestra en una lista acotada
+# en Redis (compartida entre nodos) para sacar p50/p95/p99 por ventana.
+
+import os
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from metrics import CALL_STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Orden del ciclo de vida
+STAGES = [
+    "submitted",      # submit_call
+    "picked_up",      # un worker toma el trabajo
+    "registered",     # Retell devolvió call_id
+    "originated",     # Originate aceptado por Asterisk
+    "amd",            # el dialplan reportó AMD
+    "call_started",   # webhook de Retell
+    "call_ended",
+    "call_analyzed",
+]
+
+# Intervalos medidos: nombre → (desde, hasta)
+GAPS: Dict[str, Tuple[str, str]] = {
+    "queue_wait": ("submitted", "picked_up"),
+    "register": ("picked_up", "registered"),
+    "originate": ("registered", "originated"),
+    "answer_amd": ("originated", "amd"),
+    "to_call_started": ("originated", "call_started"),
+    "time_to_talk": ("submitted", "call_started"),
+    "talk": ("call_started", "call_ended"),
+    "analysis": ("call_ended", "call_analyzed"),
+}
+# Qué intervalos cierra cada etapa
+_GAPS_ENDING_AT: Dict[str, List[Tuple[str, str]]] = {}
+for _gap, (_start, _end) in GAPS.items():
+    _GAPS_ENDING_AT.setdefault(_end, []).append((_gap, _start))
+
+REVERSE_PREFIX = "retell_job:"
+SAMPLES_PREFIX = "timeline:gap:"
+TIMELINE_SAMPLES = int(os.getenv("TIMELINE_SAMPLES", 2000))
+JOB_TTL = 7200
+
+# KEYS = call:{job_id}; ARGV = campo, ahora_ms, campos de inicio...
+# Marca la etapa solo si el trabajo existe y la etapa no estaba marcada;
+# devuelve los timestamps de las etapas de inicio (o nil si no marcó).
+_MARK_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return nil end
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 0 then return nil end
+if #ARGV < 3 then return {} end
+return redis.call('HMGET', KEYS[1], unpack(ARGV, 3))
+"""
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class CallTimeline:
+    """mark()/amark() por job_id; mark_by_call() para AMD y webhooks"""
+
+    def __init__(self, client, async_client=None, samples: int = TIMELINE_SAMPLES):
+        self.redis = client
+        self.async_redis = async_client
+        self.samples = samples
+        self._mark = client.register_script(_MARK_SCRIPT)
+        self._amark = async_client.register_script(_MARK_SCRIPT) if async_client else None
+
+    @staticmethod
+    def _script_args(stage: str, ts: int) -> Tuple[list, List[Tuple[str, str]]]:
+        gaps = _GAPS_ENDING_AT.get(stage, [])
+        return [f"t_{stage}", ts] + [f"t_{start}" for _gap, start in gaps], gaps
+
+    def _samples(self, gaps, starts, ts: int) -> List[Tuple[str, str]]:
+        out = []
+        for (gap, _start), start_ts in zip(gaps, starts or []):
+            if start_ts is None:
+                continue
+            elapsed_ms = ts - int(start_ts)
+            CALL_STAGE_SECONDS.labels(gap).observe(max(elapsed_ms, 0) / 1000)
+            out.append((f"{SAMPLES_PREFIX}{gap}", f"{ts}:{elapsed_ms}"))
+        return out
+
+    def _push(self, pipe, samples: List[Tuple[str, str]]):
+        for key, sample in samples:
+            pipe.lpush(key, sample)
+            pipe.ltrim(key, 0, self.samples - 1)
+
+    # ---------- marcas (hilos) ----------
+    def mark(self, job_id: str, stage: str, ts: Optional[int] = None):
+        """Marca una etapa del trabajo; nunca interrumpe la llamada si Redis falla"""
+        ts = int(ts) if ts else now_ms()
+        args, gaps = self._script_args(stage, ts)
+        try:
+            starts = self._mark(keys=[f"call:{job_id}"], args=args)
+            if starts is None:
+                return
+            samples = self._samples(gaps, starts, ts)
+            if samples:
+                pipe = self.redis.pipeline(transaction=False)
+                self._push(pipe, samples)
+                pipe.execute()
+        except Exception as e:
+            logger.error(f"Redis error (timeline {stage}): {e}")
+
+    def link(self, retell_call_id: str, job_id: str):
+        """Índice inverso retell_call_id → job_id"""
+        try:
+            self.redis.set(f"{REVERSE_PREFIX}{retell_call_id}", job_id, ex=JOB_TTL)
+        except Exception as e:
+            logger.error(f"Redis error (timeline link): {e}")
+
+    def job_for_call(self, retell_call_id: str) -> Optional[str]:
+        if not retell_call_id:
+            return None
+        try:
+            return self.redis.get(f"{REVERSE_PREFIX}{retell_call_id}")
+        except Exception as e:
+            logger.error(f"Redis error (timeline lookup): {e}")
+            return None
+
+    def mark_by_call(self, retell_call_id: str, stage: str, ts: Optional[int] = None):
+        """Para AMD y webhooks; no hace nada si la llamada no salió de la cola"""
+        job_id = self.job_for_call(retell_call_id)
+        if job_id:
+            self.mark(job_id, stage, ts)
+
+    # ---------- marcas (asyncio) ----------
+    async def amark(self, job_id: str, stage: str, ts: Optional[int] = None):
+        if self._amark is None:
+            return self.mark(job_id, stage, ts)
+        ts = int(ts) if ts else now_ms()
+        args, gaps = self._script_args(stage, ts)
+        try:
+            starts = await self._amark(keys=[f"call:{job_id}"], args=args)
+            if starts is None:
+                return
+            samples = self._samples(gaps, starts, ts)
+            if samples:
+                pipe = self.async_redis.pipeline(transaction=False)
+                self._push(pipe, samples)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Redis error (timeline {stage}): {e}")
+
+    async def alink(self, retell_call_id: str, job_id: str):
+        if self.async_redis is None:
+            return self.link(retell_call_id, job_id)
+        try:
+            await self.async_redis.set(f"{REVERSE_PREFIX}{retell_call_id}", job_id, ex=JOB_TTL)
+        except Exception as e:
+            logger.error(f"Redis error (timeline link): {e}")
+
+    async def ajob_for_call(self, retell_call_id: str) -> Optional[str]:
+        if not retell_call_id:
+            return None
+        if self.async_redis is None:
+            return self.job_for_call(retell_call_id)
+        try:
+            return await self.async_redis.get(f"{REVERSE_PREFIX}{retell_call_id}")
+        except Exception as e:
+            logger.error(f"Redis error (timeline lookup): {e}")
+            return None
+
+    async def amark_by_call(self, retell_call_id: str, stage: str, ts: Optional[int] = None):
+        job_id = await self.ajob_for_call(retell_call_id)
+        if job_id:
+            await self.amark(job_id, stage, ts)
+
+    # ---------- consulta ----------
+    def timeline(self, job_id: str) -> Optional[dict]:
+        """Etapas marcadas del trabajo con su desfase desde submitted (ms)"""
+        data = self.redis.hgetall(f"call:{job_id}")
+        if not data:
+            return None
+        stamps = {s: int(data[f"t_{s}"]) for s in STAGES if data.get(f"t_{s}")}
+        origin = stamps.get("submitted") or min(stamps.values(), default=0)
+        return {
+            "job_id": job_id,
+            "retell_call_id": data.get("retell_call_id"),
+            "stages": [{"stage": s, "ts": ts, "offset_ms": ts - origin} for s, ts in stamps.items()],
+            "gaps_ms": {
+                gap: stamps[end] - stamps[start]
+                for gap, (start, end) in GAPS.items() if start in stamps and end in stamps
+            },
+        }
+
+    def percentiles(self, window_s: float = 900) -> dict:
+        """p50/p95/p99 por intervalo con las muestras de los últimos window_s segundos"""
+        cutoff = now_ms() - int(window_s * 1000)
+        pipe = self.redis.pipeline(transaction=False)
+        for gap in GAPS:
+            pipe.lrange(f"{SAMPLES_PREFIX}{gap}", 0, -1)
+        out = {}
+        for gap, raw in zip(GAPS, pipe.execute()):
+            values = []
+            for sample in raw:
+                ts, _, elapsed = sample.partition(":")
+                if int(ts) >= cutoff:
+                    values.append(int(elapsed))
+            values.sort()
+            out[gap] = {
+                "from": GAPS[gap][0],
+                "to": GAPS[gap][1],
+                "count": len(values),
+                "p50_ms": _percentile(values, 50),
+                "p95_ms": _percentile(values, 95),
+                "p99_ms": _percentile(values, 99),
+                "max_ms": values[-1] if values else 0,
+            }
+        return out
@@ -0,0 +1,133 @@
+# Campañas: cada batch_call crea (o amplía) una campaña y cada trabajo sabe a
+# cuál pertenece. El hash campaign:{id} guarda cuántos trabajos hay en cada
+# estado de outbound_call_queue; cada transición mueve un trabajo de un
+# contador a otro con un script atómico, así el progreso se lee en O(1) sin
+# recorrer filas.
+#
+#   campaign:{id}  HASH  name, agent_id, created_at, total, retries, <estado> → n
+#   call:{job_id}        campaign_id, campaign_status, campaign_rank
+
+import os
+import uuid
+import logging
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "campaign:"
+CAMPAIGN_TTL = int(float(os.getenv("CAMPAIGN_TTL_DAYS", 7)) * 86400)
+
+# Estados de outbound_call_queue que se cuentan, con su orden en el ciclo de
+# vida: un evento atrasado no devuelve el trabajo a un estado anterior
+STATUS_RANK = {
+    "queued": 0,
+    "calling": 1,
+    "active": 2,
+    "finished": 3,
+    "voicemail": 3,
+    "no_answer": 3,
+    "busy": 3,
+    "failed": 3,
+    "short_call": 3,
+    "callback": 3,
+}
+TERMINAL = [status for status, rank in STATUS_RANK.items() if rank == 3]
+
+# KEYS = call:{job_id}; ARGV = estado, rango, prefijo, ttl
+# Devuelve 1 si movió el contador
+_TRANSITION_SCRIPT = """
+local cid = redis.call('HGET', KEYS[1], 'campaign_id')
+if not cid then return 0 end
+local prev = redis.call('HGET', KEYS[1], 'campaign_status')
+if prev == ARGV[1] then return 0 end
+if tonumber(redis.call('HGET', KEYS[1], 'campaign_rank') or '0') > tonumber(ARGV[2]) then return 0 end
+local key = ARGV[3] .. cid
+if prev then redis.call('HINCRBY', key, prev, -1) end
+redis.call('HINCRBY', key, ARGV[1], 1)
+redis.call('EXPIRE', key, ARGV[4])
+redis.call('HSET', KEYS[1], 'campaign_status', ARGV[1], 'campaign_rank', ARGV[2])
+return 1
+"""
+
+
+class CampaignTracker:
+    def __init__(self, client, async_client=None, ttl: int = CAMPAIGN_TTL):
+        self.redis = client
+        self.async_redis = async_client
+        self.ttl = ttl
+        self._transition = client.register_script(_TRANSITION_SCRIPT)
+        self._atransition = async_client.register_script(_TRANSITION_SCRIPT) if async_client else None
+
+    # ---------- alta ----------
+    def create(self, campaign_id: Optional[str] = None, name: Optional[str] = None,
+               agent_id: Optional[str] = None) -> str:
+        """Crea la campaña si no existe (un campaign_id repetido suma trabajos a la misma)"""
+        campaign_id = campaign_id or uuid.uuid4().hex
+        key = f"{PREFIX}{campaign_id}"
+        pipe = self.redis.pipeline()
+        pipe.hsetnx(key, "created_at", datetime.utcnow().isoformat())
+        pipe.hsetnx(key, "name", name or campaign_id)
+        if agent_id:
+            pipe.hsetnx(key, "agent_id", agent_id)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+        return campaign_id
+
+    def add_job(self, pipe, campaign_id: str, job_id: str, retry: bool = False):
+        """Dentro del pipeline de submit_call: el trabajo entra como queued"""
+        pipe.hset(f"call:{job_id}", mapping={
+            "campaign_id": campaign_id,
+            "campaign_status": "queued",
+            "campaign_rank": STATUS_RANK["queued"],
+        })
+        key = f"{PREFIX}{campaign_id}"
+        pipe.hincrby(key, "total", 1)
+        pipe.hincrby(key, "queued", 1)
+        if retry:
+            pipe.hincrby(key, "retries", 1)
+        pipe.expire(key, self.ttl)
+
+    # ---------- transiciones ----------
+    def _args(self, status: str) -> list:
+        return [status, STATUS_RANK[status], PREFIX, self.ttl]
+
+    def transition(self, job_id: Optional[str], status: str):
+        """Mueve el trabajo al contador de `status`; nunca interrumpe la llamada si Redis falla"""
+        if not job_id or status not in STATUS_RANK:
+            return
+        try:
+            self._transition(keys=[f"call:{job_id}"], args=self._args(status))
+        except Exception as e:
+            logger.error(f"Redis error (campaign {status}): {e}")
+
+    async def atransition(self, job_id: Optional[str], status: str):
+        if not job_id or status not in STATUS_RANK:
+            return
+        if self._atransition is None:
+            return self.transition(job_id, status)
+        try:
+            await self._atransition(keys=[f"call:{job_id}"], args=self._args(status))
+        except Exception as e:
+            logger.error(f"Redis error (campaign {status}): {e}")
+
+    # ---------- consulta ----------
+    def get(self, campaign_id: str) -> Optional[dict]:
+        data = self.redis.hgetall(f"{PREFIX}{campaign_id}")
+        if not data:
+            return None
+        counts = {status: max(int(data.get(status, 0)), 0) for status in STATUS_RANK}
+        total = int(data.get("total", 0))
+        done = sum(counts[status] for status in TERMINAL)
+        return {
+            "campaign_id": campaign_id,
+            "name": data.get("name"),
+            "agent_id": data.get("agent_id"),
+            "created_at": data.get("created_at"),
+            "total": total,
+            "retries": int(data.get("retries", 0)),
+            "counts": counts,
+            "pending": total - done,
+            "done": done,
+            "progress": round(done / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,254 @@
+# Índice RETELL_CALL_ID → canal de Asterisk alimentado por eventos AMI.
+# Las transferencias resuelven el canal sin consultar AMI.
+#
+# Mientras la sesión de eventos está caída se pierden Hangup y VarSet: al
+# desconectar se vacía el índice y al reconectar se reconstruye con
+# CoreShowChannels + Getvar antes de volver a declararlo vivo.
+
+import threading
+import time
+import logging
+from typing import Optional, Dict, Set
+
+import asterisk.manager
+
+logger = logging.getLogger(__name__)
+
+INDEXED_VARIABLE = "RETELL_CALL_ID"
+REDIS_KEY_PREFIX = "chan:"
+REDIS_TTL_SECONDS = 7200
+RESYNC_TIMEOUT_SECONDS = 10
+
+
+def _is_trunk_channel(channel: str) -> bool:
+    """Mismo criterio que la búsqueda por 'core show channels': solo PJSIP/SIP"""
+    return channel.startswith("PJSIP/") or channel.startswith("SIP/")
+
+
+class ChannelIndex:
+    """
+    Mantiene call_id → canal en memoria y lo refleja en Redis para que
+    otros nodos puedan resolverlo. Se alimenta de Newchannel/VarSet/Hangup
+    en una sesión AMI dedicada (no sale del pool, vive todo el proceso).
+    """
+
+    def __init__(self, host: str, port: int, username: str, secret: str,
+                 redis_client=None, reconnect_delay: float = 5.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.secret = secret
+        self.redis = redis_client
+        self.reconnect_delay = reconnect_delay
+
+        self._by_call: Dict[str, str] = {}
+        self._by_channel: Dict[str, str] = {}
+        self._live_channels = set()
+        # call_ids indexados antes de una desconexión: su clave en Redis se
+        # borra si el resync no los encuentra
+        self._stale_calls: Set[str] = set()
+        # Canales colgados mientras corre el resync (no se reinsertan)
+        self._hung_up: Optional[Set[str]] = None
+        self._synced = False
+        self._lock = threading.Lock()
+        self._manager: Optional[asterisk.manager.Manager] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._events = 0
+        self._resyncs = 0
+
+    # ---------- ciclo de vida ----------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="AMI-Events")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        manager = self._manager
+        if manager:
+            try:
+                manager.close()
+            except Exception:
+                pass
+
+    def is_live(self) -> bool:
+        """True si la suscripción a eventos está conectada y el índice ya se resincronizó"""
+        manager = self._manager
+        return bool(self._synced and manager and manager.connected())
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                manager = asterisk.manager.Manager()
+                manager.register_event("Newchannel", self._on_newchannel)
+                manager.register_event("VarSet", self._on_varset)
+                manager.register_event("Hangup", self._on_hangup)
+                manager.connect(self.host, self.port)
+                manager.login(self.username, self.secret)
+                self._manager = manager
+                self._resync(manager)
+                logger.info("✅ AMI event subscriber connected")
+
+                while manager.connected() and not self._stop.is_set():
+                    time.sleep(1)
+
+                logger.warning("⚠️ AMI event subscriber disconnected")
+            except Exception as e:
+                logger.error(f"❌ AMI event subscriber error: {e}")
+            finally:
+                self._on_disconnect()
+
+            self._stop.wait(self.reconnect_delay)
+
+    def _on_disconnect(self):
+        """Sin eventos el índice deja de ser confiable: se reconstruye al reconectar"""
+        self._manager = None
+        self._synced = False
+        with self._lock:
+            self._stale_calls.update(self._by_call)
+            self._by_call.clear()
+            self._by_channel.clear()
+            self._live_channels.clear()
+            self._hung_up = None
+
+    # ---------- resync ----------
+    def _list_channels(self, manager) -> list:
+        channels, done = [], threading.Event()
+
+        def on_channel(event, _manager):
+            channels.append(event.get_header("Channel", ""))
+
+        def on_complete(event, _manager):
+            done.set()
+
+        manager.register_event("CoreShowChannel", on_channel)
+        manager.register_event("CoreShowChannelsComplete", on_complete)
+        try:
+            manager.send_action({"Action": "CoreShowChannels"})
+            if not done.wait(RESYNC_TIMEOUT_SECONDS):
+                raise TimeoutError("CoreShowChannels did not complete")
+        finally:
+            manager.unregister_event("CoreShowChannel", on_channel)
+            manager.unregister_event("CoreShowChannelsComplete", on_complete)
+        return [channel for channel in channels if _is_trunk_channel(channel)]
+
+    def _resync(self, manager):
+        """Reconstruye el índice con los canales vivos (los eventos siguen llegando mientras tanto)"""
+        with self._lock:
+            self._hung_up = set()
+        found: Dict[str, str] = {}
+        for channel in self._list_channels(manager):
+            try:
+                response = manager.send_action({
+                    "Action": "Getvar", "Channel": channel, "Variable": INDEXED_VARIABLE,
+                })
+            except asterisk.manager.ManagerException:
+                continue
+            call_id = response.get_header("Value")
+            if call_id:
+                found[call_id] = channel
+
+        with self._lock:
+            for call_id, channel in found.items():
+                if channel in self._hung_up or channel in self._by_channel:
+                    # Colgó durante el escaneo, o un evento ya lo indexó
+                    continue
+                self._live_channels.add(channel)
+                self._by_call[call_id] = channel
+                self._by_channel[channel] = call_id
+            indexed = dict(self._by_call)
+            gone = self._stale_calls - set(indexed)
+            self._stale_calls = set()
+            self._hung_up = None
+
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for call_id, channel in indexed.items():
+                    pipe.set(f"{REDIS_KEY_PREFIX}{call_id}", channel, ex=REDIS_TTL_SECONDS)
+                for call_id in gone:
+                    pipe.delete(f"{REDIS_KEY_PREFIX}{call_id}")
+                pipe.execute()
+            except Exception as e:
+                logger.error(f"Redis error (channel index resync): {e}")
+
+        self._synced = True
+        self._resyncs += 1
+        logger.info(f"🔄 Channel index resynced: {len(indexed)} calls, {len(gone)} stale removed")
+
+    # ---------- eventos ----------
+    def _on_newchannel(self, event, manager):
+        channel = event.get_header("Channel", "")
+        if _is_trunk_channel(channel):
+            with self._lock:
+                self._live_channels.add(channel)
+        self._events += 1
+
+    def _on_varset(self, event, manager):
+        self._events += 1
+        if event.get_header("Variable") != INDEXED_VARIABLE:
+            return
+        channel = event.get_header("Channel", "")
+        call_id = event.get_header("Value", "")
+        if not call_id or not _is_trunk_channel(channel):
+            return
+
+        with self._lock:
+            self._live_channels.add(channel)
+            self._by_call[call_id] = channel
+            self._by_channel[channel] = call_id
+
+        if self.redis is not None:
+            try:
+                self.redis.set(f"{REDIS_KEY_PREFIX}{call_id}", channel, ex=REDIS_TTL_SECONDS)
+            except Exception as e:
+                logger.error(f"Redis error (channel index): {e}")
+
+    def _on_hangup(self, event, manager):
+        self._events += 1
+        channel = event.get_header("Channel", "")
+        with self._lock:
+            self._live_channels.discard(channel)
+            if self._hung_up is not None:
+                self._hung_up.add(channel)
+            call_id = self._by_channel.pop(channel, None)
+            if call_id and self._by_call.get(call_id) == channel:
+                del self._by_call[call_id]
+            else:
+                call_id = None
+
+        if call_id and self.redis is not None:
+            try:
+                self.redis.delete(f"{REDIS_KEY_PREFIX}{call_id}")
+            except Exception as e:
+                logger.error(f"Redis error (channel index): {e}")
+
+    # ---------- consultas ----------
+    def lookup(self, call_id: str) -> Optional[str]:
+        """Canal vivo para el call_id: memoria primero, luego Redis (otro nodo)"""
+        with self._lock:
+            channel = self._by_call.get(call_id)
+        if channel:
+            return channel
+
+        if self.redis is not None:
+            try:
+                return self.redis.get(f"{REDIS_KEY_PREFIX}{call_id}")
+            except Exception as e:
+                logger.error(f"Redis error (channel index): {e}")
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            indexed = len(self._by_call)
+            live = len(self._live_channels)
+        return {
+            "connected": self.is_live(),
+            "indexed_calls": indexed,
+            "live_channels": live,
+            "events": self._events,
+            "resyncs": self._resyncs,
+        }
@@ -0,0 +1,274 @@
+# Importador masivo de contactos (CSV / NDJSON) hacia outbound_call_contacts.
+# Lee el archivo en streaming por bloques, normaliza los teléfonos del bloque
+# con phone_normalizer y hace upsert por lotes; la memoria queda acotada por
+# el tamaño de bloque y los lotes en vuelo, no por el tamaño del archivo.
+#
+#   python contact_importer.py contactos.csv --default-cc +506 --rejects rechazos.csv
+
+import os
+import io
+import csv
+import sys
+import json
+import time
+import logging
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Iterator, List, Optional, TextIO, Tuple
+
+from phone_normalizer import normalize_many
+from metrics import SUPABASE_WRITE_SECONDS, SUPABASE_WRITE_ROWS, SUPABASE_WRITE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 5000))
+IMPORT_WRITERS = int(os.getenv("IMPORT_WRITERS", 2))
+IMPORT_MAX_RETRIES = int(os.getenv("IMPORT_MAX_RETRIES", 3))
+CONTACTS_TABLE = "outbound_call_contacts"
+LOCALES = ("es", "en")
+DEFAULT_LOCALE = "es"
+
+# Encabezados aceptados (minúsculas) para cada columna
+_PHONE_FIELDS = ("phone", "telefono", "teléfono", "number", "to_number", "user_number", "celular")
+_NAME_FIELDS = ("user_name", "name", "nombre", "customer_name")
+_LOCALE_FIELDS = ("locale", "idioma", "language")
+
+# Motivos de rechazo propios del importador (los de formato vienen de phone_normalizer)
+DUPLICATE = "duplicate"
+DB_ERROR = "db_error"
+BAD_RECORD = "bad_record"
+
+def _pick(record: dict, fields: Tuple[str, ...]) -> Optional[str]:
+    for field in fields:
+        value = record.get(field)
+        if value not in (None, ""):
+            return str(value).strip()
+    return None
+
+
+def _iter_csv(fh: TextIO) -> Iterator[Tuple[int, Optional[dict]]]:
+    reader = csv.DictReader(fh)
+    if reader.fieldnames:
+        reader.fieldnames = [(f or "").strip().lower() for f in reader.fieldnames]
+        if not any(f in reader.fieldnames for f in _PHONE_FIELDS):
+            raise ValueError(f"CSV sin columna de teléfono (se esperaba una de {', '.join(_PHONE_FIELDS)})")
+    for record in reader:
+        # Fila 1 = encabezado
+        yield reader.line_num, record
+
+
+def _iter_ndjson(fh: TextIO) -> Iterator[Tuple[int, Optional[dict]]]:
+    for line_num, line in enumerate(fh, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if record is not None and not isinstance(record, dict):
+            record = None
+        if record is not None:
+            record = {str(k).lower(): v for k, v in record.items()}
+        yield line_num, record
+
+
+def iter_records(fh: TextIO, fmt: str) -> Iterator[Tuple[int, Optional[dict]]]:
+    """(número de fila, registro) en streaming; registro None = línea ilegible"""
+    if fmt == "csv":
+        return _iter_csv(fh)
+    if fmt in ("ndjson", "jsonl"):
+        return _iter_ndjson(fh)
+    raise ValueError(f"Formato no soportado: {fmt}")
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str] = None) -> str:
+    name = (filename or "").lower()
+    ctype = (content_type or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in ctype or "jsonl" in ctype:
+        return "ndjson"
+    return "csv"
+
+
+class ContactImporter:
+    """
+    Importa contactos en bloques de chunk_size filas.
+
+    - Un solo normalizador (phone_normalizer.normalize_many) por bloque.
+    - Teléfonos repetidos dentro de un bloque se rechazan como 'duplicate'.
+    - Upserts por lote con on_conflict=phone; por defecto no pisa contactos
+      existentes (igual que /api/contactos/importar), con update_existing=True
+      actualiza nombre y locale.
+    - Hasta `writers` lotes en vuelo mientras se lee el siguiente bloque.
+    """
+
+    def __init__(self, supabase, chunk_size: int = IMPORT_CHUNK_SIZE,
+                 default_cc: Optional[str] = "+506", update_existing: bool = False,
+                 writers: int = IMPORT_WRITERS, max_retries: int = IMPORT_MAX_RETRIES,
+                 table: str = CONTACTS_TABLE):
+        self.supabase = supabase
+        self.chunk_size = chunk_size
+        self.default_cc = default_cc
+        self.update_existing = update_existing
+        self.writers = max(1, writers)
+        self.max_retries = max_retries
+        self.table = table
+
+    # ---------- escritura ----------
+    def _upsert(self, rows: List[dict]):
+        attempt = 0
+        while True:
+            attempt += 1
+            start = time.perf_counter()
+            try:
+                self.supabase.table(self.table).upsert(
+                    rows,
+                    on_conflict="phone",
+                    ignore_duplicates=not self.update_existing,
+                    returning="minimal",
+                ).execute()
+                SUPABASE_WRITE_SECONDS.labels("contacts_upsert").observe(time.perf_counter() - start)
+                SUPABASE_WRITE_ROWS.labels("contacts_upsert").inc(len(rows))
+                return
+            except Exception as e:
+                SUPABASE_WRITE_SECONDS.labels("contacts_upsert").observe(time.perf_counter() - start)
+                SUPABASE_WRITE_ERRORS.labels("contacts_upsert").inc()
+                if attempt > self.max_retries:
+                    raise
+                delay = 0.5 * (2 ** (attempt - 1))
+                logger.warning(f"🔁 Contact upsert failed ({len(rows)} rows): {e}, retry in {delay:.1f}s")
+                time.sleep(delay)
+
+    # ---------- importación ----------
+    def _build_rows(self, chunk: List[Tuple[int, Optional[dict]]],
+                    on_reject: Callable[[int, str, str], None]) -> List[Tuple[int, dict]]:
+        records = [(line, rec) for line, rec in chunk if rec is not None]
+        for line, rec in chunk:
+            if rec is None:
+                on_reject(line, "", BAD_RECORD)
+
+        raw_phones = [_pick(rec, _PHONE_FIELDS) for _line, rec in records]
+        normalized = normalize_many(raw_phones, self.default_cc)
+
+        # Repetidos dentro del bloque (un upsert no puede tocar la misma fila dos
+        # veces); entre bloques los resuelve on_conflict sin guardar estado
+        seen_phones = set()
+        rows = []
+        for (line, rec), raw, (phone, reason) in zip(records, raw_phones, normalized):
+            if reason:
+                on_reject(line, raw or "", reason)
+                continue
+            if phone in seen_phones:
+                on_reject(line, raw or "", DUPLICATE)
+                continue
+            seen_phones.add(phone)
+
+            locale = (_pick(rec, _LOCALE_FIELDS) or DEFAULT_LOCALE).lower()[:2]
+            rows.append((line, {
+                "phone": phone,
+                "user_name": _pick(rec, _NAME_FIELDS),
+                "locale": locale if locale in LOCALES else DEFAULT_LOCALE,
+            }))
+        return rows
+
+    def run(self, fh: TextIO, fmt: str = "csv",
+            on_reject: Optional[Callable[[int, str, str], None]] = None) -> dict:
+        """Importa todo el archivo; devuelve el resumen. on_reject recibe cada fila rechazada."""
+        start = time.perf_counter()
+        reasons: Counter = Counter()
+        report = {"rows": 0, "upserted": 0, "rejected": 0}
+
+        def reject(line: int, value: str, reason: str):
+            report["rejected"] += 1
+            reasons[reason] += 1
+            if on_reject:
+                on_reject(line, value, reason)
+
+        in_flight: List[Tuple[Future, List[Tuple[int, dict]]]] = []
+
+        def settle(block: bool):
+            while in_flight and (block or in_flight[0][0].done() or len(in_flight) >= self.writers):
+                future, rows = in_flight.pop(0)
+                try:
+                    future.result()
+                    report["upserted"] += len(rows)
+                except Exception as e:
+                    logger.error(f"❌ Contact upsert failed, rejecting {len(rows)} rows: {e}")
+                    for line, row in rows:
+                        reject(line, row["phone"], DB_ERROR)
+
+        with ThreadPoolExecutor(max_workers=self.writers, thread_name_prefix="Contact-Import") as pool:
+            chunk: List[Tuple[int, Optional[dict]]] = []
+            for item in iter_records(fh, fmt):
+                chunk.append(item)
+                if len(chunk) >= self.chunk_size:
+                    report["rows"] += len(chunk)
+                    self._submit(pool, in_flight, self._build_rows(chunk, reject))
+                    chunk = []
+                    settle(block=False)
+            if chunk:
+                report["rows"] += len(chunk)
+                self._submit(pool, in_flight, self._build_rows(chunk, reject))
+            settle(block=True)
+
+        elapsed = time.perf_counter() - start
+        report["reasons"] = dict(reasons)
+        report["elapsed_s"] = round(elapsed, 2)
+        report["rows_per_s"] = round(report["rows"] / elapsed) if elapsed else 0
+        logger.info(f"✅ Contacts import: {report['upserted']} upserted, "
+                    f"{report['rejected']} rejected in {report['elapsed_s']}s")
+        return report
+
+    def _submit(self, pool: ThreadPoolExecutor, in_flight: list, rows: List[Tuple[int, dict]]):
+        if rows:
+            in_flight.append((pool.submit(self._upsert, [row for _line, row in rows]), rows))
+
+
+def _rejects_writer(path: str):
+    """on_reject que escribe cada rechazo en un CSV (fila, valor, motivo)"""
+    fh = open(path, "w", newline="", encoding="utf-8")
+    writer = csv.writer(fh)
+    writer.writerow(["row", "value", "reason"])
+    return fh, lambda line, value, reason: writer.writerow([line, value, reason])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa contactos a outbound_call_contacts")
+    parser.add_argument("path", help="Archivo CSV o NDJSON ('-' para stdin)")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="Por defecto según la extensión")
+    parser.add_argument("--default-cc", default="+506", help="Código de país para números nacionales")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    parser.add_argument("--writers", type=int, default=IMPORT_WRITERS)
+    parser.add_argument("--update", action="store_true", help="Actualizar nombre/locale de contactos existentes")
+    parser.add_argument("--rejects", help="CSV donde escribir las filas rechazadas")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from dotenv import load_dotenv
+    from supabase import create_client
+    load_dotenv()
+    supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+
+    importer = ContactImporter(supabase, chunk_size=args.chunk_size, default_cc=args.default_cc or None,
+                               update_existing=args.update, writers=args.writers)
+    fmt = args.format or detect_format(args.path)
+
+    rejects_fh, on_reject = _rejects_writer(args.rejects) if args.rejects else (None, None)
+    try:
+        if args.path == "-":
+            fh = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+            report = importer.run(fh, fmt, on_reject)
+        else:
+            with open(args.path, encoding="utf-8-sig", newline="") as fh:
+                report = importer.run(fh, fmt, on_reject)
+    finally:
+        if rejects_fh:
+            rejects_fh.close()
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
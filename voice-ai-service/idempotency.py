@@ -0,0 +1,167 @@
+# Claves de idempotencia para batch-call y make-call.
+#
+#   idem:req:{scope}:{clave}  JSON {state, fingerprint, response}
+#       'pending' mientras se procesa (TTL corto que se renueva mientras el
+#       handler corre: si el nodo muere, la clave se libera sola) y 'done' con
+#       la respuesta original durante IDEMPOTENCY_TTL. Un reintento recibe esa
+#       respuesta sin reencolar. 'partial' si el pedido falló después de
+#       encolar algo: el reintento vuelve a correr y reutiliza lo encolado.
+#   idem:req:{scope}:{clave}:jobs  HASH índice del lote → job_id ya encolado
+#       (y 'campaign' → campaign_id del primer intento)
+#   idem:item:{clave}         job_id de un elemento del lote
+#
+# La huella (sha256 del cuerpo) evita que la misma clave devuelva la
+# respuesta de otro pedido.
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 86400))
+IDEMPOTENCY_PENDING_TTL = int(os.getenv("IDEMPOTENCY_PENDING_TTL", 120))
+PREFIX = "idem:"
+
+# Resultado de begin()
+NEW = "new"
+REPLAY = "replay"
+IN_PROGRESS = "in_progress"
+MISMATCH = "mismatch"
+
+# KEYS = idem:req:...; ARGV = pending (JSON), huella, pending_ttl
+# Devuelve {resultado, registro}
+_BEGIN_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+  redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+  return {'new', ''}
+end
+local record = cjson.decode(raw)
+if record.fingerprint ~= ARGV[2] then return {'mismatch', ''} end
+if record.state == 'done' then return {'replay', raw} end
+if record.state == 'partial' then
+  redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+  return {'new', ''}
+end
+return {'in_progress', ''}
+"""
+
+# KEYS = idem:req:...; ARGV = pending_ttl. Solo mientras siga 'pending'
+_RENEW_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw or cjson.decode(raw).state ~= 'pending' then return 0 end
+return redis.call('EXPIRE', KEYS[1], ARGV[1])
+"""
+
+
+def fingerprint(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class RequestProgress:
+    """job_ids encolados por un pedido con clave, por índice del lote"""
+
+    def __init__(self, async_client, key: str, ttl: int):
+        self.redis = async_client
+        self.key = key
+        self.ttl = ttl
+        self.recorded = 0
+
+    async def load(self) -> Dict[int, str]:
+        """Lo que encoló un intento anterior que falló a mitad de camino"""
+        submitted = {int(index): job_id for index, job_id in (await self.redis.hgetall(self.key)).items()
+                     if index.isdigit()}
+        self.recorded += len(submitted)
+        return submitted
+
+    async def campaign(self, campaign_id: str) -> str:
+        """campaign_id del primer intento (los reintentos no crean otra campaña)"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hsetnx(self.key, "campaign", campaign_id)
+        pipe.hget(self.key, "campaign")
+        pipe.expire(self.key, self.ttl)
+        _, stored, _ = await pipe.execute()
+        return stored
+
+    async def record(self, index: int, job_id: str):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(self.key, str(index), job_id)
+        pipe.expire(self.key, self.ttl)
+        await pipe.execute()
+        self.recorded += 1
+
+
+class IdempotencyStore:
+    def __init__(self, async_client, ttl: int = IDEMPOTENCY_TTL, pending_ttl: int = IDEMPOTENCY_PENDING_TTL):
+        self.redis = async_client
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.replays = 0
+        self._begin = async_client.register_script(_BEGIN_SCRIPT)
+        self._renew = async_client.register_script(_RENEW_SCRIPT)
+
+    # ---------- por pedido ----------
+    async def begin(self, scope: str, key: str, fp: str) -> Tuple[str, Optional[dict]]:
+        """(NEW, None) reserva la clave; (REPLAY, respuesta); (IN_PROGRESS|MISMATCH, None)"""
+        pending = json.dumps({"state": "pending", "fingerprint": fp})
+        state, raw = await self._begin(keys=[f"{PREFIX}req:{scope}:{key}"],
+                                       args=[pending, fp, self.pending_ttl])
+        if state != REPLAY:
+            return state, None
+        self.replays += 1
+        return REPLAY, json.loads(raw).get("response")
+
+    def progress(self, scope: str, key: str) -> RequestProgress:
+        return RequestProgress(self.redis, f"{PREFIX}req:{scope}:{key}:jobs", self.ttl)
+
+    async def keep_pending(self, scope: str, key: str):
+        """Renueva el TTL de 'pending' mientras el handler corre (cancelar al terminar)"""
+        while True:
+            await asyncio.sleep(self.pending_ttl / 3)
+            try:
+                await self._renew(keys=[f"{PREFIX}req:{scope}:{key}"], args=[self.pending_ttl])
+            except Exception as e:
+                logger.error(f"Redis error (idempotency renew): {e}")
+
+    async def complete(self, scope: str, key: str, fp: str, response: dict):
+        record = {"state": "done", "fingerprint": fp, "response": response}
+        try:
+            await self.redis.set(f"{PREFIX}req:{scope}:{key}", json.dumps(record, default=str), ex=self.ttl)
+        except Exception as e:
+            logger.error(f"Redis error (idempotency complete): {e}")
+
+    async def abort(self, scope: str, key: str, fp: str, progress: Optional[RequestProgress] = None):
+        """
+        El pedido falló: la clave queda libre para el reintento. Si ya había
+        encolado algo queda 'partial' (con la huella) y el reintento reutiliza
+        esos job_ids en lugar de volver a encolarlos.
+        """
+        rkey = f"{PREFIX}req:{scope}:{key}"
+        try:
+            if progress is not None and progress.recorded:
+                await self.redis.set(rkey, json.dumps({"state": "partial", "fingerprint": fp}), ex=self.ttl)
+            else:
+                await self.redis.delete(rkey)
+        except Exception as e:
+            logger.error(f"Redis error (idempotency abort): {e}")
+
+    # ---------- por elemento ----------
+    async def item_job(self, key: str) -> Optional[str]:
+        return await self.redis.get(f"{PREFIX}item:{key}")
+
+    async def claim_item(self, key: str, job_id: str) -> Optional[str]:
+        """Asocia la clave al job_id nuevo; si ya tenía uno, lo devuelve"""
+        ikey = f"{PREFIX}item:{key}"
+        if await self.redis.set(ikey, job_id, nx=True, ex=self.ttl):
+            return None
+        return await self.redis.get(ikey)
+
+    async def release_item(self, key: str):
+        try:
+            await self.redis.delete(f"{PREFIX}item:{key}")
+        except Exception as e:
+            logger.error(f"Redis error (idempotency release): {e}")
@@ -0,0 +1,658 @@
+# Cola de trabajos de llamadas.
+# Backend "stream": Redis Streams + consumer group (durable, multi-nodo,
+# entrega al-menos-una-vez, reclamo de pendientes de workers caídos).
+# Backend "fair": sub-colas por campaña/agente/caller ID en Redis con
+# encolado justo ponderado y clases de prioridad (ver FairJobQueue).
+# Backend "memory": queue.Queue en proceso (comportamiento anterior).
+
+import os
+import re
+import json
+import time
+import uuid
+import socket
+import asyncio
+import threading
+import logging
+from collections import deque
+from queue import Queue, Empty
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+from pacing import _parse_limits
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "stream")
+JOB_STREAM_KEY = os.getenv("JOB_STREAM_KEY", "calls:stream")
+JOB_STREAM_GROUP = os.getenv("JOB_STREAM_GROUP", "dialers")
+# Un trabajo pendiente sin ACK por más de esto se considera de un worker caído
+JOB_CLAIM_IDLE_MS = int(os.getenv("JOB_CLAIM_IDLE_MS", 120000))
+JOB_CLAIM_INTERVAL = float(os.getenv("JOB_CLAIM_INTERVAL", 15))
+# Entradas por XAUTOCLAIM; mientras queden pendientes viejos se sigue reclamando sin esperar el intervalo
+JOB_CLAIM_BATCH = int(os.getenv("JOB_CLAIM_BATCH", 100))
+
+# Los scripts arman dentro de Lua las claves de cada sub-cola (q:<clase>:<sub>,
+# que no se conocen antes de elegirla): todas las claves del backend tienen que
+# caer en el mismo slot. El hash tag {...} del prefijo lo garantiza en Redis Cluster.
+JOB_FAIR_PREFIX = os.getenv("JOB_FAIR_PREFIX", "{calls:fair}:")
+# Sub-cola por "campaign" (campaign_id o agent_id), "agent" o "from_number"
+JOB_FAIR_KEY = os.getenv("JOB_FAIR_KEY", "campaign")
+# Peso por sub-cola: "campana_a=3,agent_xyz=2" (por defecto 1)
+JOB_FAIR_WEIGHTS = _parse_limits(os.getenv("JOB_FAIR_WEIGHTS", ""))
+# Clases en orden estricto de prioridad
+JOB_PRIORITIES = [p.strip() for p in os.getenv("JOB_PRIORITIES", "high,normal,low").split(",") if p.strip()]
+JOB_DEFAULT_PRIORITY = os.getenv("JOB_DEFAULT_PRIORITY", "normal")
+
+# (entry_id, job_id, variables)
+QueueItem = Tuple[str, str, dict]
+
+
+class InMemoryJobQueue:
+    """queue.Queue con la misma interfaz que RedisStreamJobQueue"""
+
+    def __init__(self):
+        self._queue: Queue = Queue()
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def put(self, job_id: str, variables: dict, queue_key: Optional[str] = None,
+            priority: Optional[str] = None) -> str:
+        with self._lock:
+            self._seq += 1
+            entry_id = str(self._seq)
+        self._queue.put((entry_id, job_id, variables))
+        return entry_id
+
+    def get(self, block_ms: int = 2000) -> Optional[QueueItem]:
+        try:
+            return self._queue.get(timeout=block_ms / 1000)
+        except Empty:
+            return None
+
+    async def aget(self, block_ms: int = 2000) -> Optional[QueueItem]:
+        return await asyncio.to_thread(self.get, block_ms)
+
+    def ack(self, entry_id: str):
+        self._queue.task_done()
+
+    async def aack(self, entry_id: str):
+        self.ack(entry_id)
+
+    def release(self, entry_id: str):
+        """Sin redelivery en memoria: nada que soltar"""
+
+    async def arelease(self, entry_id: str):
+        """Sin redelivery en memoria: nada que soltar"""
+
+    def touch(self, entry_id: str):
+        """Sin leases en memoria"""
+
+    async def atouch(self, entry_id: str):
+        """Sin leases en memoria"""
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "waiting": self.qsize()}
+
+
+class RedisStreamJobQueue:
+    """
+    XADD al encolar, XREADGROUP para consumir, XACK+XDEL al terminar.
+    Las entradas entregadas a un consumer que no hizo ACK en JOB_CLAIM_IDLE_MS
+    se reclaman con XAUTOCLAIM, así un reinicio no pierde trabajos.
+
+    Todos los workers del proceso comparten el consumer: las entradas que
+    siguen en proceso aquí (_inflight) no se devuelven al reclamar.
+
+    El reclamo toma hasta claim_batch entradas a la vez y las reparte entre
+    los workers antes de leer entradas nuevas; si XAUTOCLAIM indica que
+    quedan más, el siguiente get() vuelve a reclamar sin esperar el intervalo.
+    """
+
+    def __init__(self, client: redis.Redis, async_client=None,
+                 stream: str = JOB_STREAM_KEY, group: str = JOB_STREAM_GROUP,
+                 consumer: Optional[str] = None,
+                 claim_idle_ms: int = JOB_CLAIM_IDLE_MS,
+                 claim_interval: float = JOB_CLAIM_INTERVAL,
+                 claim_batch: int = JOB_CLAIM_BATCH):
+        self.redis = client
+        self.async_redis = async_client
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_interval = claim_interval
+        self.claim_batch = claim_batch
+
+        self._last_claim = 0.0
+        # Reclamadas con XAUTOCLAIM y aún sin entregar a un worker
+        self._claimed = deque()
+        self._claim_cursor = "0-0"
+        self._claim_more = False
+        self._claim_lock = threading.Lock()
+        self._group_ready = False
+        self._reclaimed = 0
+        # entry_id entregados a un worker de este proceso y aún sin ACK
+        self._inflight = set()
+
+    # ---------- grupo ----------
+    def _ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            logger.info(f"✅ Consumer group '{self.group}' created on {self.stream}")
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    # ---------- parseo ----------
+    @staticmethod
+    def _parse(entry_id: str, fields: Optional[dict]) -> Optional[QueueItem]:
+        if not fields:
+            # Entrada borrada (XDEL) mientras estaba pendiente
+            return None
+        try:
+            variables = json.loads(fields.get("variables") or "{}")
+        except ValueError:
+            variables = {}
+        return entry_id, fields.get("job_id"), variables
+
+    def _claim_due(self) -> bool:
+        now = time.monotonic()
+        with self._claim_lock:
+            if self._claimed:
+                return False
+            if not self._claim_more and now - self._last_claim < self.claim_interval:
+                return False
+            self._claim_more = False
+            self._last_claim = now
+            return True
+
+    def _claim_args(self) -> dict:
+        return {"min_idle_time": self.claim_idle_ms, "start_id": self._claim_cursor, "count": self.claim_batch}
+
+    def _on_autoclaim(self, result) -> List[str]:
+        """Guarda las entradas reclamadas; devuelve las borradas (para ACK)"""
+        if not result:
+            return []
+        cursor, entries = result[0], result[1]
+        stale = []
+        items = []
+        for entry_id, fields in entries:
+            item = self._parse(entry_id, fields)
+            if item:
+                items.append(item)
+            else:
+                stale.append(entry_id)
+        with self._claim_lock:
+            self._claimed.extend(items)
+            self._claim_cursor = cursor
+            # Cursor distinto de 0-0: quedan pendientes por revisar
+            self._claim_more = cursor != "0-0"
+        return stale
+
+    def _next_claimed(self) -> Optional[QueueItem]:
+        while True:
+            with self._claim_lock:
+                if not self._claimed:
+                    return None
+                item = self._claimed.popleft()
+            item = self._deliver(item, reclaimed=True)
+            if item:
+                return item
+
+    def _deliver(self, item: QueueItem, reclaimed: bool = False) -> Optional[QueueItem]:
+        """Registra la entrega; None si la entrada ya la tiene un worker de este proceso"""
+        with self._claim_lock:
+            if item[0] in self._inflight:
+                # XAUTOCLAIM solo le reinició el idle: sigue siendo de ese worker
+                return None
+            self._inflight.add(item[0])
+        if reclaimed:
+            self._reclaimed += 1
+            logger.warning(f"♻️ Reclaimed stale job entry {item[0]}")
+        return item
+
+    def _done(self, entry_id: str):
+        with self._claim_lock:
+            self._inflight.discard(entry_id)
+
+    # ---------- productor ----------
+    def put(self, job_id: str, variables: dict, queue_key: Optional[str] = None,
+            priority: Optional[str] = None) -> str:
+        self._ensure_group()
+        return self.redis.xadd(self.stream, {
+            "job_id": job_id,
+            "variables": json.dumps(variables or {}),
+        })
+
+    # ---------- consumidor (hilos) ----------
+    def get(self, block_ms: int = 2000) -> Optional[QueueItem]:
+        self._ensure_group()
+
+        if self._claim_due():
+            result = self.redis.xautoclaim(self.stream, self.group, self.consumer, **self._claim_args())
+            for entry_id in self._on_autoclaim(result):
+                self.redis.xack(self.stream, self.group, entry_id)
+        item = self._next_claimed()
+        if item:
+            return item
+
+        response = self.redis.xreadgroup(
+            self.group, self.consumer, {self.stream: ">"}, count=1, block=block_ms
+        )
+        for _stream, entries in response or []:
+            for entry_id, fields in entries:
+                item = self._parse(entry_id, fields)
+                if item:
+                    return self._deliver(item)
+                self.ack(entry_id)
+        return None
+
+    def ack(self, entry_id: str):
+        self._done(entry_id)
+        pipe = self.redis.pipeline()
+        pipe.xack(self.stream, self.group, entry_id)
+        pipe.xdel(self.stream, entry_id)
+        pipe.execute()
+
+    # ---------- consumidor (asyncio) ----------
+    async def aget(self, block_ms: int = 2000) -> Optional[QueueItem]:
+        if self.async_redis is None:
+            return await asyncio.to_thread(self.get, block_ms)
+
+        self._ensure_group()
+
+        if self._claim_due():
+            result = await self.async_redis.xautoclaim(self.stream, self.group, self.consumer,
+                                                       **self._claim_args())
+            for entry_id in self._on_autoclaim(result):
+                await self.async_redis.xack(self.stream, self.group, entry_id)
+        item = self._next_claimed()
+        if item:
+            return item
+
+        response = await self.async_redis.xreadgroup(
+            self.group, self.consumer, {self.stream: ">"}, count=1, block=block_ms
+        )
+        for _stream, entries in response or []:
+            for entry_id, fields in entries:
+                item = self._parse(entry_id, fields)
+                if item:
+                    return self._deliver(item)
+                await self.aack(entry_id)
+        return None
+
+    async def aack(self, entry_id: str):
+        if self.async_redis is None:
+            return await asyncio.to_thread(self.ack, entry_id)
+        self._done(entry_id)
+        pipe = self.async_redis.pipeline()
+        pipe.xack(self.stream, self.group, entry_id)
+        pipe.xdel(self.stream, entry_id)
+        await pipe.execute()
+
+    def release(self, entry_id: str):
+        """El worker la deja sin ACK (otro tiene el trabajo): queda pendiente en el grupo"""
+        self._done(entry_id)
+
+    async def arelease(self, entry_id: str):
+        # Solo olvida la entrada en _inflight (memoria local): no hay I/O que esperar
+        self._done(entry_id)
+
+    def touch(self, entry_id: str):
+        """El worker sigue con la entrada (esperando cupo): XCLAIM a sí mismo reinicia el idle"""
+        self.redis.xclaim(self.stream, self.group, self.consumer, min_idle_time=0,
+                          message_ids=[entry_id], justid=True)
+
+    async def atouch(self, entry_id: str):
+        if self.async_redis is None:
+            return await asyncio.to_thread(self.touch, entry_id)
+        await self.async_redis.xclaim(self.stream, self.group, self.consumer, min_idle_time=0,
+                                      message_ids=[entry_id], justid=True)
+
+    # ---------- métricas ----------
+    def qsize(self) -> int:
+        """Entradas aún no entregadas a ningún worker (todo el cluster)"""
+        try:
+            self._ensure_group()
+            for info in self.redis.xinfo_groups(self.stream):
+                if info.get("name") == self.group:
+                    lag = info.get("lag")
+                    if lag is not None:
+                        return int(lag)
+                    return max(self.redis.xlen(self.stream) - int(info.get("pending", 0)), 0)
+        except Exception as e:
+            logger.error(f"Redis error (queue size): {e}")
+        return 0
+
+    def stats(self) -> dict:
+        pending = 0
+        try:
+            self._ensure_group()
+            summary = self.redis.xpending(self.stream, self.group)
+            pending = int(summary.get("pending", 0)) if summary else 0
+        except Exception as e:
+            logger.error(f"Redis error (queue stats): {e}")
+        return {
+            "backend": "stream",
+            "stream": self.stream,
+            "group": self.group,
+            "consumer": self.consumer,
+            "waiting": self.qsize(),
+            "pending": pending,
+            "reclaimed": self._reclaimed,
+        }
+
+
+def fair_queue_key(agent_id: str, from_number: str, variables: Optional[dict] = None,
+                   mode: str = JOB_FAIR_KEY) -> str:
+    """Sub-cola del trabajo según JOB_FAIR_KEY"""
+    if mode == "from_number":
+        return from_number or "default"
+    if mode == "agent":
+        return agent_id or "default"
+    return (variables or {}).get("campaign_id") or agent_id or "default"
+
+
+# KEYS = entries, routes, list, active, vtime, weights, waiting, wake
+# ARGV = entry_id, payload, route, sub-cola, peso
+# Una sub-cola que se activa entra con el tiempo virtual actual: no acumula
+# crédito mientras estuvo vacía y tampoco espera detrás de un lote grande.
+_FAIR_PUT_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('RPUSH', KEYS[3], ARGV[1])
+redis.call('HSET', KEYS[6], ARGV[4], ARGV[5])
+if not redis.call('ZSCORE', KEYS[4], ARGV[4]) then
+  redis.call('ZADD', KEYS[4], redis.call('GET', KEYS[5]) or 0, ARGV[4])
+end
+redis.call('INCR', KEYS[7])
+redis.call('RPUSH', KEYS[8], 1)
+redis.call('LTRIM', KEYS[8], -1000, -1)
+return 1
+"""
+
+# KEYS = entries, inflight, waiting, weights, (active, vtime) por clase
+# ARGV = ahora_ms, lease_ms, prefijo, clases... (el prefijo arma q:<clase>:<sub>)
+# Toma la sub-cola con menor tiempo virtual de la primera clase con trabajos
+# y avanza su tiempo en 1/peso: O(log n) por sub-colas activas.
+_FAIR_POP_SCRIPT = """
+local now = tonumber(ARGV[1])
+for i = 4, #ARGV do
+  local class = ARGV[i]
+  local active = KEYS[2 * i - 3]
+  local vtime = KEYS[2 * i - 2]
+  while true do
+    local head = redis.call('ZRANGE', active, 0, 0, 'WITHSCORES')
+    if not head[1] then break end
+    local sub, v = head[1], tonumber(head[2])
+    local list = ARGV[3] .. 'q:' .. class .. ':' .. sub
+    local eid = redis.call('LPOP', list)
+    if eid then
+      redis.call('SET', vtime, head[2])
+      if redis.call('LLEN', list) > 0 then
+        local w = tonumber(redis.call('HGET', KEYS[4], sub)) or 1
+        if w <= 0 then w = 1 end
+        redis.call('ZADD', active, v + 1 / w, sub)
+      else
+        redis.call('ZREM', active, sub)
+      end
+      redis.call('DECR', KEYS[3])
+      redis.call('ZADD', KEYS[2], now + tonumber(ARGV[2]), eid)
+      return {eid, redis.call('HGET', KEYS[1], eid) or ''}
+    end
+    redis.call('ZREM', active, sub)
+  end
+end
+return false
+"""
+
+# KEYS = routes, inflight, waiting, wake; ARGV = ahora_ms, prefijo, máximo
+# (la ruta de cada entrada decide su sub-cola: active/vtime/q se arman con el prefijo)
+# Devuelve a la cabeza de su sub-cola los trabajos con lease vencido
+_FAIR_RECLAIM_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[3]))
+local n = 0
+for _, eid in ipairs(expired) do
+  redis.call('ZREM', KEYS[2], eid)
+  local route = redis.call('HGET', KEYS[1], eid)
+  if route then
+    local class, sub = string.match(route, '^([^:]*):(.*)$')
+    local active = ARGV[2] .. 'active:' .. class
+    redis.call('LPUSH', ARGV[2] .. 'q:' .. class .. ':' .. sub, eid)
+    if not redis.call('ZSCORE', active, sub) then
+      redis.call('ZADD', active, redis.call('GET', ARGV[2] .. 'vtime:' .. class) or 0, sub)
+    end
+    redis.call('INCR', KEYS[3])
+    redis.call('RPUSH', KEYS[4], 1)
+    n = n + 1
+  end
+end
+return n
+"""
+
+
+class FairJobQueue:
+    """
+    Encolado justo ponderado (start-time fair queuing) sobre Redis.
+
+    Cada sub-cola (campaña, agente o caller ID según JOB_FAIR_KEY) es una
+    lista; un ZSET por clase de prioridad ordena las sub-colas activas por
+    tiempo virtual. Un lote de 100 llamadas de un agente ya no retrasa a un
+    lote chico de otro: se alternan, con JOB_FAIR_WEIGHTS como proporción.
+    Las clases (JOB_PRIORITIES) se atienden en orden estricto.
+
+    Entrega al-menos-una-vez como el backend stream: el trabajo tomado queda
+    en un ZSET con lease y vuelve a su sub-cola si no hay ACK a tiempo.
+
+    Todas las claves comparten el prefijo y los scripts arman las de cada
+    sub-cola: en Redis Cluster el prefijo necesita un hash tag ({...}).
+    """
+
+    def __init__(self, client: redis.Redis, async_client=None, prefix: str = JOB_FAIR_PREFIX,
+                 weights: Dict[str, float] = JOB_FAIR_WEIGHTS, priorities: Optional[List[str]] = None,
+                 default_priority: str = JOB_DEFAULT_PRIORITY,
+                 claim_idle_ms: int = JOB_CLAIM_IDLE_MS, claim_interval: float = JOB_CLAIM_INTERVAL):
+        self.redis = client
+        self.async_redis = async_client
+        self.prefix = prefix
+        self.weights = weights
+        self.priorities = priorities or JOB_PRIORITIES
+        self.default_priority = default_priority if default_priority in self.priorities else self.priorities[-1]
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_interval = claim_interval
+
+        self.entries_key = f"{prefix}entries"
+        self.routes_key = f"{prefix}routes"
+        self.inflight_key = f"{prefix}inflight"
+        self.waiting_key = f"{prefix}waiting"
+        self.weights_key = f"{prefix}weights"
+        self.wake_key = f"{prefix}wake"
+        if not re.search(r"\{[^}]+\}", prefix):
+            logger.warning(f"⚠️ JOB_FAIR_PREFIX '{prefix}' has no hash tag: the fair queue needs a single slot")
+
+        self._put = client.register_script(_FAIR_PUT_SCRIPT)
+        self._pop = client.register_script(_FAIR_POP_SCRIPT)
+        self._reclaim = client.register_script(_FAIR_RECLAIM_SCRIPT)
+        self._apop = async_client.register_script(_FAIR_POP_SCRIPT) if async_client else None
+        self._areclaim = async_client.register_script(_FAIR_RECLAIM_SCRIPT) if async_client else None
+
+        self._last_claim = 0.0
+        self._claim_lock = threading.Lock()
+        self._reclaimed = 0
+
+    def _claim_due(self) -> bool:
+        now = time.monotonic()
+        with self._claim_lock:
+            if now - self._last_claim < self.claim_interval:
+                return False
+            self._last_claim = now
+            return True
+
+    # ---------- productor ----------
+    def put(self, job_id: str, variables: dict, queue_key: Optional[str] = None,
+            priority: Optional[str] = None) -> str:
+        sub = (queue_key or "default").replace(":", "_")
+        if priority not in self.priorities:
+            priority = self.default_priority
+        entry_id = uuid.uuid4().hex
+        self._put(
+            keys=[self.entries_key, self.routes_key, f"{self.prefix}q:{priority}:{sub}",
+                  f"{self.prefix}active:{priority}", f"{self.prefix}vtime:{priority}",
+                  self.weights_key, self.waiting_key, self.wake_key],
+            args=[entry_id, json.dumps({"job_id": job_id, "variables": variables or {}}),
+                  f"{priority}:{sub}", sub, self.weights.get(sub, 1)],
+        )
+        return entry_id
+
+    # ---------- consumidor ----------
+    def _pop_args(self) -> Tuple[list, list]:
+        keys = [self.entries_key, self.inflight_key, self.waiting_key, self.weights_key]
+        for priority in self.priorities:
+            keys += [f"{self.prefix}active:{priority}", f"{self.prefix}vtime:{priority}"]
+        args = [int(time.time() * 1000), self.claim_idle_ms, self.prefix] + self.priorities
+        return keys, args
+
+    def _reclaim_args(self) -> Tuple[list, list]:
+        keys = [self.routes_key, self.inflight_key, self.waiting_key, self.wake_key]
+        return keys, [int(time.time() * 1000), self.prefix, 100]
+
+    def _parse(self, result) -> Optional[QueueItem]:
+        if not result:
+            return None
+        entry_id, raw = result
+        try:
+            payload = json.loads(raw)
+        except ValueError:
+            # Entrada sin datos (ACK concurrente): se descarta
+            self.ack(entry_id)
+            return None
+        return entry_id, payload.get("job_id"), payload.get("variables") or {}
+
+    def _on_reclaimed(self, n: int):
+        if n:
+            self._reclaimed += n
+            logger.warning(f"♻️ Reclaimed {n} stale fair-queue job(s)")
+
+    def get(self, block_ms: int = 2000) -> Optional[QueueItem]:
+        if self._claim_due():
+            keys, args = self._reclaim_args()
+            self._on_reclaimed(int(self._reclaim(keys=keys, args=args)))
+
+        # Sin trabajos se espera un aviso de put(); los avisos sobrantes solo
+        # provocan otro intento
+        deadline = time.monotonic() + block_ms / 1000
+        while True:
+            keys, args = self._pop_args()
+            item = self._parse(self._pop(keys=keys, args=args))
+            remaining = deadline - time.monotonic()
+            if item or remaining < 0.01:
+                return item
+            self.redis.blpop([self.wake_key], timeout=remaining)
+
+    def ack(self, entry_id: str):
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.inflight_key, entry_id)
+        pipe.hdel(self.entries_key, entry_id)
+        pipe.hdel(self.routes_key, entry_id)
+        pipe.execute()
+
+    async def aget(self, block_ms: int = 2000) -> Optional[QueueItem]:
+        if self.async_redis is None:
+            return await asyncio.to_thread(self.get, block_ms)
+
+        if self._claim_due():
+            keys, args = self._reclaim_args()
+            self._on_reclaimed(int(await self._areclaim(keys=keys, args=args)))
+
+        deadline = time.monotonic() + block_ms / 1000
+        while True:
+            keys, args = self._pop_args()
+            item = self._parse(await self._apop(keys=keys, args=args))
+            remaining = deadline - time.monotonic()
+            if item or remaining < 0.01:
+                return item
+            await self.async_redis.blpop([self.wake_key], timeout=remaining)
+
+    async def aack(self, entry_id: str):
+        if self.async_redis is None:
+            return await asyncio.to_thread(self.ack, entry_id)
+        pipe = self.async_redis.pipeline()
+        pipe.zrem(self.inflight_key, entry_id)
+        pipe.hdel(self.entries_key, entry_id)
+        pipe.hdel(self.routes_key, entry_id)
+        await pipe.execute()
+
+    def release(self, entry_id: str):
+        """Sin ACK: el lease en inflight vence y la entrada vuelve a su sub-cola"""
+
+    async def arelease(self, entry_id: str):
+        """Sin ACK: el lease en inflight vence y la entrada vuelve a su sub-cola"""
+
+    def touch(self, entry_id: str):
+        """El worker sigue con la entrada: renueva su lease en inflight"""
+        self.redis.zadd(self.inflight_key, {entry_id: int(time.time() * 1000) + self.claim_idle_ms}, xx=True)
+
+    async def atouch(self, entry_id: str):
+        if self.async_redis is None:
+            return await asyncio.to_thread(self.touch, entry_id)
+        await self.async_redis.zadd(self.inflight_key,
+                                    {entry_id: int(time.time() * 1000) + self.claim_idle_ms}, xx=True)
+
+    # ---------- métricas ----------
+    def qsize(self) -> int:
+        """Trabajos esperando en todas las sub-colas (todo el cluster)"""
+        try:
+            return max(int(self.redis.get(self.waiting_key) or 0), 0)
+        except Exception as e:
+            logger.error(f"Redis error (queue size): {e}")
+        return 0
+
+    def depths(self, limit: int = 200) -> Dict[str, Dict[str, dict]]:
+        """Profundidad, peso y tiempo virtual por sub-cola activa, por clase"""
+        out: Dict[str, Dict[str, dict]] = {}
+        for priority in self.priorities:
+            subs = self.redis.zrange(f"{self.prefix}active:{priority}", 0, limit - 1, withscores=True)
+            if not subs:
+                continue
+            pipe = self.redis.pipeline(transaction=False)
+            for sub, _ in subs:
+                pipe.llen(f"{self.prefix}q:{priority}:{sub}")
+            out[priority] = {
+                sub: {"depth": depth, "weight": self.weights.get(sub, 1), "vtime": round(vtime, 3)}
+                for (sub, vtime), depth in zip(subs, pipe.execute())
+            }
+        return out
+
+    def stats(self) -> dict:
+        inflight = 0
+        subqueues = {}
+        try:
+            inflight = self.redis.zcard(self.inflight_key)
+            subqueues = self.depths()
+        except Exception as e:
+            logger.error(f"Redis error (queue stats): {e}")
+        return {
+            "backend": "fair",
+            "key": JOB_FAIR_KEY,
+            "priorities": self.priorities,
+            "waiting": self.qsize(),
+            "pending": inflight,
+            "reclaimed": self._reclaimed,
+            "subqueues": subqueues,
+        }
+
+
+def create_job_queue(client: redis.Redis, async_client=None):
+    if JOB_QUEUE_BACKEND == "memory":
+        return InMemoryJobQueue()
+    if JOB_QUEUE_BACKEND == "fair":
+        return FairJobQueue(client, async_client)
+    return RedisStreamJobQueue(client, async_client)
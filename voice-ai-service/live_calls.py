@@ -0,0 +1,264 @@
+# Límite de llamadas vivas por agente y por troncal, para todo el cluster.
+#
+# El originate es Async: el worker se libera en cuanto Asterisk acepta, así
+# que QUEUE_MAX_CONCURRENT solo limita pedidos AMI en vuelo. Aquí el cupo se
+# toma antes de registrar en Retell y se mantiene hasta un evento terminal:
+# AMD distinto de HUMAN, call_ended o fallo del originate.
+#
+#   slots:agent:{agent_id}  ZSET job_id → vencimiento del lease (epoch ms)
+#   slots:trunk:{troncal}   ZSET job_id → vencimiento del lease
+#   call:{job_id}           live_slots = claves ocupadas (para liberar por job_id)
+#
+# Cada cupo es un lease: si se pierde el webhook, vence solo y no se fuga
+# capacidad. HUMAN/call_started lo extienden a la duración máxima de llamada.
+#
+# El worker ya tiene el claim del trabajo (call_state) cuando espera aquí: un
+# job_id que ya ocupa el cupo solo puede ser el mismo trabajo retomado por
+# otro worker tras vencer el claim, y entra sin volver a contar.
+
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pacing import route_for_number, _parse_limits
+
+logger = logging.getLogger(__name__)
+
+# 0 = sin límite
+LIVE_MAX_PER_AGENT = int(os.getenv("LIVE_MAX_PER_AGENT", 20))
+LIVE_MAX_PER_TRUNK = int(os.getenv("LIVE_MAX_PER_TRUNK", 0))
+# Excepciones: "agent_xyz=5" / "didww-out=30,metrocom-out=10"
+LIVE_AGENT_LIMITS = _parse_limits(os.getenv("LIVE_AGENT_LIMITS", ""))
+LIVE_TRUNK_LIMITS = _parse_limits(os.getenv("LIVE_TRUNK_LIMITS", ""))
+# Lease desde el originate hasta AMD; luego hasta call_ended
+LIVE_DIAL_LEASE = int(os.getenv("LIVE_DIAL_LEASE", 120))
+LIVE_CALL_LEASE = int(os.getenv("LIVE_CALL_LEASE", 3600))
+
+PREFIX = "slots:"
+KEYS_SET = "slots:keys"
+
+# KEYS = zsets de cupo..., call:{job_id}; ARGV = ahora_ms, lease_ms, job_id, límite1, límite2...
+# Devuelve {tomado, leases_vencidos, índice de la clave llena}
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local n = #KEYS - 1
+local expired = 0
+for i = 1, n do
+  expired = expired + redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now)
+  local limit = tonumber(ARGV[3 + i])
+  if limit > 0 and redis.call('ZSCORE', KEYS[i], ARGV[3]) == false
+     and redis.call('ZCARD', KEYS[i]) >= limit then
+    return {0, expired, i}
+  end
+end
+local slots = {}
+for i = 1, n do
+  redis.call('ZADD', KEYS[i], now + tonumber(ARGV[2]), ARGV[3])
+  slots[i] = KEYS[i]
+end
+redis.call('HSET', KEYS[n + 1], 'live_slots', table.concat(slots, ','))
+return {1, expired, 0}
+"""
+
+# KEYS = call:{job_id}; ARGV = job_id
+_RELEASE_SCRIPT = """
+local slots = redis.call('HGET', KEYS[1], 'live_slots')
+if not slots then return 0 end
+for key in string.gmatch(slots, '[^,]+') do
+  redis.call('ZREM', key, ARGV[1])
+end
+redis.call('HDEL', KEYS[1], 'live_slots')
+return 1
+"""
+
+# KEYS = call:{job_id}; ARGV = job_id, vencimiento_ms
+_EXTEND_SCRIPT = """
+local slots = redis.call('HGET', KEYS[1], 'live_slots')
+if not slots then return 0 end
+for key in string.gmatch(slots, '[^,]+') do
+  redis.call('ZADD', key, 'XX', ARGV[2], ARGV[1])
+end
+return 1
+"""
+
+
+class LiveCallLimiter:
+    """acquire() antes de registrar; release() en el evento terminal; extend() al contestar"""
+
+    def __init__(self, client, async_client=None, max_per_agent: int = LIVE_MAX_PER_AGENT,
+                 max_per_trunk: int = LIVE_MAX_PER_TRUNK, agent_limits: Dict[str, float] = LIVE_AGENT_LIMITS,
+                 trunk_limits: Dict[str, float] = LIVE_TRUNK_LIMITS,
+                 dial_lease: int = LIVE_DIAL_LEASE, call_lease: int = LIVE_CALL_LEASE):
+        self.redis = client
+        self.async_redis = async_client
+        self.max_per_agent = max_per_agent
+        self.max_per_trunk = max_per_trunk
+        self.agent_limits = agent_limits
+        self.trunk_limits = trunk_limits
+        self.dial_lease_ms = dial_lease * 1000
+        self.call_lease_ms = call_lease * 1000
+
+        self._acquire = client.register_script(_ACQUIRE_SCRIPT)
+        self._release = client.register_script(_RELEASE_SCRIPT)
+        self._extend = client.register_script(_EXTEND_SCRIPT)
+        self._aacquire = async_client.register_script(_ACQUIRE_SCRIPT) if async_client else None
+        self._arelease = async_client.register_script(_RELEASE_SCRIPT) if async_client else None
+        self._aextend = async_client.register_script(_EXTEND_SCRIPT) if async_client else None
+
+        # Métricas
+        self.waits = 0
+        self.expired = 0
+
+    def _slots(self, agent_id: str, from_number: str) -> List[tuple]:
+        """[(clave, límite)] para el agente y la troncal de salida"""
+        agent = agent_id or "default"
+        trunk = route_for_number(from_number)
+        return [
+            (f"{PREFIX}agent:{agent}", int(self.agent_limits.get(agent, self.max_per_agent))),
+            (f"{PREFIX}trunk:{trunk}", int(self.trunk_limits.get(trunk, self.max_per_trunk))),
+        ]
+
+    def _acquire_args(self, slots: List[tuple], job_id: str):
+        keys = [key for key, _ in slots] + [f"call:{job_id}"]
+        args = [int(time.time() * 1000), self.dial_lease_ms, job_id] + [limit for _, limit in slots]
+        return keys, args
+
+    def _on_result(self, res, slots: List[tuple], job_id: str, waiting: bool) -> bool:
+        taken, expired, full = int(res[0]), int(res[1]), int(res[2])
+        if expired:
+            self.expired += expired
+            logger.warning(f"⚠️ {expired} live-call lease(s) expired without a terminal event")
+        if not taken and not waiting:
+            self.waits += 1
+            key, limit = slots[full - 1]
+            logger.info(f"⏳ Job {job_id[:8]}... waiting for a live slot ({key} at {limit})")
+        return bool(taken)
+
+    @staticmethod
+    def _lost(job_id: str) -> bool:
+        logger.warning(f"⚠️ Job {job_id[:8]}... lost its claim while waiting for a live slot")
+        return False
+
+    # ---------- hilos ----------
+    def acquire(self, agent_id: str, from_number: str, job_id: str,
+                keepalive: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        Bloquea hasta que haya cupo en el agente y en la troncal. Mientras
+        espera llama a keepalive() (renueva el claim del trabajo); False si el
+        claim se perdió y el trabajo no debe marcarse. Si Redis falla, deja pasar.
+        """
+        slots = self._slots(agent_id, from_number)
+        keys, _ = self._acquire_args(slots, job_id)
+        try:
+            self.redis.sadd(KEYS_SET, *keys[:-1])
+            waiting = False
+            while True:
+                _, args = self._acquire_args(slots, job_id)
+                if self._on_result(self._acquire(keys=keys, args=args), slots, job_id, waiting):
+                    return True
+                if keepalive and not keepalive():
+                    return self._lost(job_id)
+                waiting = True
+                time.sleep(0.5 + random.uniform(0, 0.25))
+        except Exception as e:
+            logger.error(f"❌ Live-call limiter error (allowing call): {e}")
+        return True
+
+    def release(self, job_id: Optional[str]):
+        """Evento terminal: libera los cupos del trabajo (idempotente)"""
+        if not job_id:
+            return
+        try:
+            self._release(keys=[f"call:{job_id}"], args=[job_id])
+        except Exception as e:
+            logger.error(f"Redis error (live-call release): {e}")
+
+    def extend(self, job_id: Optional[str]):
+        """La llamada se contestó: el lease pasa a cubrir toda la conversación"""
+        if not job_id:
+            return
+        try:
+            self._extend(keys=[f"call:{job_id}"],
+                         args=[job_id, int(time.time() * 1000) + self.call_lease_ms])
+        except Exception as e:
+            logger.error(f"Redis error (live-call extend): {e}")
+
+    # ---------- asyncio ----------
+    async def aacquire(self, agent_id: str, from_number: str, job_id: str,
+                       keepalive: Optional[Callable[[], Awaitable[bool]]] = None) -> bool:
+        if self._aacquire is None:
+            # keepalive es una corrutina: no se puede llamar desde el hilo
+            return await asyncio.to_thread(self.acquire, agent_id, from_number, job_id)
+        slots = self._slots(agent_id, from_number)
+        keys, _ = self._acquire_args(slots, job_id)
+        try:
+            await self.async_redis.sadd(KEYS_SET, *keys[:-1])
+            waiting = False
+            while True:
+                _, args = self._acquire_args(slots, job_id)
+                if self._on_result(await self._aacquire(keys=keys, args=args), slots, job_id, waiting):
+                    return True
+                if keepalive and not await keepalive():
+                    return self._lost(job_id)
+                waiting = True
+                await asyncio.sleep(0.5 + random.uniform(0, 0.25))
+        except Exception as e:
+            logger.error(f"❌ Live-call limiter error (allowing call): {e}")
+        return True
+
+    async def arelease(self, job_id: Optional[str]):
+        if not job_id:
+            return
+        if self._arelease is None:
+            return self.release(job_id)
+        try:
+            await self._arelease(keys=[f"call:{job_id}"], args=[job_id])
+        except Exception as e:
+            logger.error(f"Redis error (live-call release): {e}")
+
+    async def aextend(self, job_id: Optional[str]):
+        if not job_id:
+            return
+        if self._aextend is None:
+            return self.extend(job_id)
+        try:
+            await self._aextend(keys=[f"call:{job_id}"],
+                                args=[job_id, int(time.time() * 1000) + self.call_lease_ms])
+        except Exception as e:
+            logger.error(f"Redis error (live-call extend): {e}")
+
+    # ---------- estado ----------
+    def _limit_for(self, key: str) -> int:
+        scope, _, name = key[len(PREFIX):].partition(":")
+        if scope == "agent":
+            return int(self.agent_limits.get(name, self.max_per_agent))
+        return int(self.trunk_limits.get(name, self.max_per_trunk))
+
+    def stats(self) -> dict:
+        """Llamadas vivas reales (leases vigentes) por agente y troncal"""
+        out = {"total": 0, "agents": {}, "trunks": {}, "waits": self.waits, "expired_leases": self.expired}
+        try:
+            keys = sorted(self.redis.smembers(KEYS_SET))
+            if not keys:
+                return out
+            now_ms = int(time.time() * 1000)
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.zcount(key, now_ms, "+inf")
+            for key, live in zip(keys, pipe.execute()):
+                scope, _, name = key[len(PREFIX):].partition(":")
+                if not live:
+                    # Sin llamadas: se olvida la clave hasta el próximo acquire
+                    self.redis.srem(KEYS_SET, key)
+                    continue
+                out["agents" if scope == "agent" else "trunks"][name] = {
+                    "live": live, "limit": self._limit_for(key) or None,
+                }
+                if scope == "agent":
+                    out["total"] += live
+        except Exception as e:
+            logger.error(f"❌ Live-call stats error: {e}")
+        return out
@@ -0,0 +1,289 @@
+# Estado de la cola en vivo por Server-Sent Events.
+# En vez de que cada dashboard consulte /queue-status y /pending-transfers
+# cada 3s, un productor publica cambios en Redis pub/sub y cada nodo los
+# reparte a sus clientes SSE: N pantallas cuestan un productor y una
+# suscripción por nodo.
+#
+# - Cada nodo publica su propio nivel (active_calls, max_concurrent).
+# - Un solo nodo del cluster (lock en Redis) publica lo global: profundidad
+#   de la cola, conteo por estado y transferencias pendientes.
+# - Solo se publica si algo cambió (o como latido cada HEARTBEAT segundos).
+
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+LIVE_CHANNEL = "queue:live"
+LIVE_PRODUCER_KEY = "queue:live:producer"
+LIVE_INTERVAL = float(os.getenv("LIVE_STATUS_INTERVAL", 1))
+LIVE_TRANSFER_INTERVAL = float(os.getenv("LIVE_TRANSFER_INTERVAL", 3))
+LIVE_HEARTBEAT = float(os.getenv("LIVE_HEARTBEAT", 10))
+# Un nodo sin latido en este tiempo se quita de la suma
+LIVE_NODE_TTL = 3 * LIVE_HEARTBEAT
+# Eventos encolados por cliente SSE; un cliente lento pierde los más viejos
+LIVE_CLIENT_BUFFER = 100
+
+# Renueva el lock solo si sigue siendo de este nodo
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class LiveStatusHub:
+    """
+    Productor + fan-out local.
+
+    node_stats()        → dict del nodo (síncrono, barato)
+    cluster_stats()     → dict global (síncrono; corre en un hilo)
+    pending_transfers() → lista de transferencias pendientes (síncrono; en un hilo)
+    """
+
+    def __init__(self, async_redis_client, node_stats: Callable[[], dict],
+                 cluster_stats: Callable[[], dict],
+                 pending_transfers: Optional[Callable[[], List[dict]]] = None,
+                 interval: float = LIVE_INTERVAL,
+                 transfer_interval: float = LIVE_TRANSFER_INTERVAL,
+                 heartbeat: float = LIVE_HEARTBEAT):
+        self.redis = async_redis_client
+        self.node_stats = node_stats
+        self.cluster_stats = cluster_stats
+        self.pending_transfers = pending_transfers
+        self.interval = interval
+        self.transfer_interval = transfer_interval
+        self.heartbeat = heartbeat
+        self.node_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+        self._renew = async_redis_client.register_script(_RENEW_SCRIPT)
+        self._tasks: List[asyncio.Task] = []
+        self._clients: Set[asyncio.Queue] = set()
+        self._refresh = asyncio.Event()
+
+        # Último estado conocido (lo que recibe un cliente nuevo)
+        self._cluster: Dict[str, Any] = {}
+        self._nodes: Dict[str, dict] = {}
+        self._transfers: Dict[str, dict] = {}
+
+        # Métricas
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.is_producer = False
+
+    # ---------- ciclo de vida ----------
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._subscribe()),
+            asyncio.create_task(self._produce_node()),
+            asyncio.create_task(self._produce_cluster()),
+        ]
+        logger.info(f"✅ Live status hub started ({self.node_id})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.is_producer:
+            try:
+                await self.redis.delete(LIVE_PRODUCER_KEY)
+            except Exception:
+                pass
+        for queue in list(self._clients):
+            queue.put_nowait(None)
+
+    # ---------- productores ----------
+    async def _publish(self, event: str, data: dict):
+        message = json.dumps({"event": event, "data": data}, default=str)
+        await self.redis.publish(LIVE_CHANNEL, message)
+        self.published += 1
+
+    async def _produce_node(self):
+        last, last_sent = None, 0.0
+        while True:
+            try:
+                stats = self.node_stats()
+                now = time.monotonic()
+                if stats != last or now - last_sent >= self.heartbeat:
+                    await self._publish("node", {"node": self.node_id, **stats})
+                    last, last_sent = stats, now
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Live status node error: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _elect(self) -> bool:
+        ttl_ms = int(max(self.interval, self.transfer_interval) * 3 * 1000)
+        if self.is_producer:
+            self.is_producer = bool(await self._renew(keys=[LIVE_PRODUCER_KEY], args=[self.node_id, ttl_ms]))
+        if not self.is_producer:
+            self.is_producer = bool(await self.redis.set(LIVE_PRODUCER_KEY, self.node_id, nx=True, px=ttl_ms))
+            if self.is_producer:
+                logger.info(f"📡 Live status producer: {self.node_id}")
+        return self.is_producer
+
+    async def _produce_cluster(self):
+        last, last_sent = None, 0.0
+        last_transfers = 0.0
+        while True:
+            refresh = self._refresh.is_set()
+            self._refresh.clear()
+            try:
+                if await self._elect():
+                    now = time.monotonic()
+                    stats = await asyncio.to_thread(self.cluster_stats)
+                    if stats != last or now - last_sent >= self.heartbeat:
+                        await self._publish("cluster", stats)
+                        last, last_sent = stats, now
+
+                    if self.pending_transfers and (refresh or now - last_transfers >= self.transfer_interval):
+                        last_transfers = now
+                        await self._diff_transfers(await asyncio.to_thread(self.pending_transfers))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Live status producer error: {e}")
+            try:
+                await asyncio.wait_for(self._refresh.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _diff_transfers(self, transfers: List[dict]):
+        current = {str(t.get("id")): t for t in transfers}
+        added = [t for tid, t in current.items() if tid not in self._transfers]
+        removed = [tid for tid in self._transfers if tid not in current]
+        if added or removed:
+            await self._publish("transfers", {"added": added, "removed": removed, "count": len(current)})
+        # El estado local se actualiza al recibir el mensaje (igual que en los demás nodos)
+
+    async def request_refresh(self):
+        """Pide al productor (en cualquier nodo) releer las transferencias ya"""
+        try:
+            await self._publish("refresh", {})
+        except Exception as e:
+            logger.error(f"Redis error (live refresh): {e}")
+
+    # ---------- suscripción y fan-out ----------
+    async def _subscribe(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(LIVE_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    self._on_message(message.get("data"))
+            except asyncio.CancelledError:
+                await _close_quietly(pubsub)
+                raise
+            except Exception as e:
+                logger.error(f"❌ Live status subscription error: {e}")
+                await _close_quietly(pubsub)
+                await asyncio.sleep(1)
+
+    def _on_message(self, raw: str):
+        try:
+            message = json.loads(raw)
+        except (TypeError, ValueError):
+            return
+        event, data = message.get("event"), message.get("data") or {}
+        self.received += 1
+
+        if event == "refresh":
+            self._refresh.set()
+            return
+        if event == "cluster":
+            self._cluster = data
+        elif event == "node":
+            data["seen_at"] = time.time()
+            self._nodes[data.get("node")] = data
+        elif event == "transfers":
+            for tid in data.get("removed", []):
+                self._transfers.pop(tid, None)
+            for transfer in data.get("added", []):
+                self._transfers[str(transfer.get("id"))] = transfer
+
+        self._broadcast(event, data)
+        if event == "node":
+            # Los totales cambian con cualquier nodo
+            self._broadcast("totals", self._totals())
+
+    def _broadcast(self, event: str, data: dict):
+        for queue in list(self._clients):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait((event, data))
+
+    def _live_nodes(self) -> Dict[str, dict]:
+        cutoff = time.time() - LIVE_NODE_TTL
+        return {node: stats for node, stats in self._nodes.items() if stats.get("seen_at", 0) >= cutoff}
+
+    def _totals(self) -> dict:
+        nodes = self._live_nodes()
+        return {
+            "active_calls": sum(int(n.get("active_calls", 0)) for n in nodes.values()),
+            "max_concurrent": sum(int(n.get("max_concurrent", 0)) for n in nodes.values()),
+            "nodes": len(nodes),
+        }
+
+    def snapshot(self) -> dict:
+        return {
+            **self._totals(),
+            "cluster": self._cluster,
+            "nodes": self._live_nodes(),
+            "transfers": list(self._transfers.values()),
+        }
+
+    # ---------- clientes ----------
+    async def stream(self, heartbeat: float = 15.0):
+        """Generador SSE para un cliente: snapshot inicial y luego los cambios"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_CLIENT_BUFFER)
+        self._clients.add(queue)
+        try:
+            yield _sse("snapshot", self.snapshot())
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    # Comentario SSE: mantiene viva la conexión a través de proxies
+                    yield ": ping\n\n"
+                    continue
+                if item is None:
+                    return
+                yield _sse(*item)
+        finally:
+            self._clients.discard(queue)
+
+    def stats(self) -> dict:
+        return {
+            "node": self.node_id,
+            "producer": self.is_producer,
+            "clients": len(self._clients),
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+        }
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def _close_quietly(pubsub):
+    try:
+        await pubsub.close()
+    except Exception:
+        pass
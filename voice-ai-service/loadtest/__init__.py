@@ -0,0 +1,2 @@
+# Harness de carga offline: dobles de Retell, AMI, Redis y PostgREST +
+# generador de carga de lazo abierto. Uso: python -m loadtest --help
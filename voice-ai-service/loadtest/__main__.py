@@ -0,0 +1,3 @@
+from loadtest.harness import main
+
+main()
@@ -0,0 +1,367 @@
+# Dobles locales de las dependencias externas para el harness de carga.
+#
+# - RetellStub: POST /v2/register-phone-call
+# - PostgrestStub: tablas en memoria con el subconjunto de PostgREST que usa
+#   supabase-py aquí (filtros eq/neq/in/is/gt/lt, upsert, PATCH, RPC)
+# - AMISimulator: servidor TCP de AMI (Login/Originate/Getvar/...) que emite
+#   Newchannel/VarSet/Hangup y, opcionalmente, llama a /amd-result como el dialplan
+#
+# Cada doble tiene un Fault (latencia, jitter y tasa de error inyectados).
+
+import time
+import random
+import asyncio
+import logging
+import itertools
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Fault:
+    """Latencia (ms) + jitter uniforme (ms) + probabilidad de error por pedido"""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+
+    async def apply(self) -> bool:
+        """Duerme la latencia inyectada; True si este pedido debe fallar"""
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        return random.random() < self.error_rate
+
+
+async def serve_app(app: FastAPI, port: int, host: str = "127.0.0.1") -> uvicorn.Server:
+    """Levanta una app ASGI en el loop actual; devuelve el servidor ya escuchando"""
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning",
+                                           access_log=False, lifespan="off"))
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
+
+
+# ========== RETELL ==========
+class RetellStub:
+    def __init__(self, fault: Optional[Fault] = None):
+        self.fault = fault or Fault()
+        # call_ids emitidos → to_number: los drivers de webhooks/AMD los reutilizan
+        self.calls: Dict[str, str] = {}
+        self.call_ids: List[str] = []
+        self.registered_at: List[float] = []
+        self.registered = 0
+        self.failed = 0
+        self._seq = itertools.count(1)
+        self.app = FastAPI()
+        self.app.add_api_route("/v2/register-phone-call", self._register, methods=["POST"])
+
+    async def _register(self, request: Request):
+        body = await request.json()
+        if await self.fault.apply():
+            self.failed += 1
+            return JSONResponse({"error_message": "injected failure"}, status_code=500)
+        call_id = f"call_lt{next(self._seq):08d}"
+        self.calls[call_id] = body.get("to_number")
+        self.call_ids.append(call_id)
+        self.registered_at.append(time.monotonic())
+        self.registered += 1
+        return {
+            "call_id": call_id,
+            "agent_id": body.get("agent_id"),
+            "from_number": body.get("from_number"),
+            "to_number": body.get("to_number"),
+            "call_status": "registered",
+        }
+
+    def stats(self) -> dict:
+        return {"registered": self.registered, "failed": self.failed}
+
+
+# ========== POSTGREST ==========
+_RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def _text(value) -> str:
+    # Como lo serializa PostgREST: booleanos en minúscula
+    return str(value).lower() if isinstance(value, bool) else str(value)
+
+
+def _match(row: dict, column: str, expr: str) -> bool:
+    negate = expr.startswith("not.")
+    if negate:
+        expr = expr[4:]
+    op, _, value = expr.partition(".")
+    current = row.get(column)
+    if op == "eq":
+        ok = _text(current) == value if current is not None else False
+    elif op == "neq":
+        ok = _text(current) != value
+    elif op == "in":
+        ok = str(current) in [v.strip('"') for v in value.strip("()").split(",")]
+    elif op == "is":
+        ok = current is None if value == "null" else str(current).lower() == value
+    elif op in ("gt", "gte", "lt", "lte"):
+        if current is None:
+            return False
+        a, b = str(current), value
+        if isinstance(current, (int, float)) and not isinstance(current, bool):
+            a, b = current, float(value)
+        ok = {"gt": a > b, "gte": a >= b, "lt": a < b, "lte": a <= b}[op]
+    else:
+        ok = True  # operador no soportado: no filtra
+    return not ok if negate else ok
+
+
+class PostgrestStub:
+    """Tablas en memoria detrás de /rest/v1; suficiente para medir, no para validar SQL"""
+
+    def __init__(self, fault: Optional[Fault] = None):
+        self.fault = fault or Fault()
+        self.tables: Dict[str, List[dict]] = {}
+        self.requests: Counter = Counter()
+        self.failed = 0
+        self._ids = itertools.count(1)
+        self.app = FastAPI()
+        self.app.add_api_route("/rest/v1/rpc/{fn}", self._rpc, methods=["POST"])
+        self.app.add_api_route("/rest/v1/{table}", self._table,
+                               methods=["GET", "POST", "PATCH", "DELETE"])
+
+    def _rows(self, table: str, params) -> List[dict]:
+        filters = [(k, v) for k, v in params.multi_items() if k not in _RESERVED_PARAMS]
+        rows = [r for r in self.tables.get(table, []) if all(_match(r, k, v) for k, v in filters)]
+        if params.get("limit"):
+            rows = rows[int(params.get("offset", 0)):][:int(params["limit"])]
+        return rows
+
+    def _respond(self, request: Request, rows: List[dict], status: int = 200) -> Response:
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(rows) != 1:
+                return JSONResponse({"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned"},
+                                    status_code=406)
+            return JSONResponse(rows[0], status_code=status)
+        return JSONResponse(rows, status_code=status)
+
+    def _insert(self, table: str, record: dict, conflict: List[str]) -> dict:
+        rows = self.tables.setdefault(table, [])
+        if conflict:
+            for row in rows:
+                if all(str(row.get(c)) == str(record.get(c)) for c in conflict):
+                    row.update(record)
+                    return row
+        row = {"id": next(self._ids), **record}
+        rows.append(row)
+        return row
+
+    async def _table(self, table: str, request: Request):
+        self.requests[f"{request.method} {table}"] += 1
+        if await self.fault.apply():
+            self.failed += 1
+            return JSONResponse({"code": "57014", "message": "injected failure"}, status_code=503)
+
+        if request.method == "GET":
+            return self._respond(request, self._rows(table, request.query_params))
+
+        if request.method == "POST":
+            body = await request.json()
+            records = body if isinstance(body, list) else [body]
+            merge = "merge-duplicates" in request.headers.get("prefer", "")
+            conflict = [c for c in request.query_params.get("on_conflict", "").split(",") if c] if merge else []
+            return self._respond(request, [self._insert(table, r, conflict) for r in records], 201)
+
+        rows = self._rows(table, request.query_params)
+        if request.method == "PATCH":
+            changes = await request.json()
+            for row in rows:
+                row.update(changes)
+        else:
+            ids = {id(r) for r in rows}
+            self.tables[table] = [r for r in self.tables.get(table, []) if id(r) not in ids]
+        return self._respond(request, rows)
+
+    async def _rpc(self, fn: str, request: Request):
+        self.requests[f"RPC {fn}"] += 1
+        if await self.fault.apply():
+            self.failed += 1
+            return JSONResponse({"code": "57014", "message": "injected failure"}, status_code=503)
+        params = await request.json()
+        if fn == "apply_outbound_queue_updates":
+            self._apply_queue_updates(params.get("updates") or [])
+        return JSONResponse(None)
+
+    def _apply_queue_updates(self, updates: List[dict]):
+        rows = self.tables.setdefault("outbound_call_queue", [])
+        for update in updates:
+            keys = ("job_id", "phone") if "job_id" in update else ("retell_call_id",)
+            for row in rows:
+                if all(str(row.get(k)) == str(update.get(k)) for k in keys):
+                    row.update(update)
+
+    def stats(self) -> dict:
+        return {
+            "requests": dict(self.requests),
+            "failed": self.failed,
+            "rows": {t: len(r) for t, r in self.tables.items()},
+        }
+
+
+# ========== AMI ==========
+class AMISimulator:
+    """
+    Habla el protocolo de texto de AMI en TCP. Por cada Originate exitoso
+    emite Newchannel + VarSet(RETELL_CALL_ID) en todas las sesiones y, si
+    hay amd_url, reporta un resultado AMD al servicio tras amd_delay_ms.
+    CoreShowChannels y Getvar responden con los canales vivos (resync del
+    índice de canales al reconectar).
+    """
+
+    AMD_RESULTS = (("HUMAN", "HUMAN-500-1000"), ("VOICEMAIL", "LONGGREETING-2000"),
+                   ("NO_ANSWER", "NOANSWER"), ("BUSY", "BUSY"))
+
+    def __init__(self, fault: Optional[Fault] = None, amd_url: Optional[str] = None,
+                 amd_delay_ms: float = 3000, amd_mix: Optional[Dict[str, float]] = None,
+                 hangup_after_ms: float = 30000):
+        self.fault = fault or Fault()
+        self.amd_url = amd_url
+        self.amd_delay_ms = amd_delay_ms
+        self.amd_mix = amd_mix or {"HUMAN": 0.6, "VOICEMAIL": 0.25, "NO_ANSWER": 0.1, "BUSY": 0.05}
+        self.hangup_after_ms = hangup_after_ms
+        self.actions: Counter = Counter()
+        self.failed = 0
+        self.amd_sent = 0
+        self.amd_errors = 0
+        self._writers: set = set()
+        self._channels = itertools.count(1)
+        self._live: Dict[str, str] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._http: Optional[httpx.AsyncClient] = None
+
+    async def start(self, port: int, host: str = "127.0.0.1"):
+        self._server = await asyncio.start_server(self._session, host, port)
+        self._http = httpx.AsyncClient(timeout=10)
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        if self._http:
+            await self._http.aclose()
+
+    @staticmethod
+    def _frame(headers: dict) -> bytes:
+        return ("".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n").encode()
+
+    def _broadcast(self, headers: dict):
+        frame = self._frame(headers)
+        for writer in list(self._writers):
+            try:
+                writer.write(frame)
+            except Exception:
+                self._writers.discard(writer)
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(b"Asterisk Call Manager/5.0.1\r\n")
+        self._writers.add(writer)
+        try:
+            action: dict = {}
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    return
+                line = raw.decode(errors="replace").rstrip("\r\n")
+                if line:
+                    key, _, value = line.partition(":")
+                    action[key.strip()] = value.strip()
+                    continue
+                if action:
+                    asyncio.create_task(self._handle(action, writer))
+                    if action.get("Action", "").lower() == "logoff":
+                        return
+                    action = {}
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _handle(self, action: dict, writer: asyncio.StreamWriter):
+        name = action.get("Action", "")
+        self.actions[name] += 1
+        reply = {"Response": "Success", "ActionID": action.get("ActionID", "")}
+        lname = name.lower()
+
+        if lname not in ("login", "logoff", "ping") and await self.fault.apply():
+            self.failed += 1
+            reply.update({"Response": "Error", "Message": "Injected failure"})
+        elif lname == "login":
+            reply["Message"] = "Authentication accepted"
+        elif lname == "ping":
+            reply.update({"Ping": "Pong", "Timestamp": f"{time.time():.6f}"})
+        elif lname == "getvar":
+            value = self._live.get(action.get("Channel", ""), "") if action.get("Variable") == "RETELL_CALL_ID" else ""
+            reply.update({"Variable": action.get("Variable", ""), "Value": value})
+        elif lname == "coreshowchannels":
+            reply.update({"EventList": "start", "Message": "Channels will follow"})
+        elif lname == "command":
+            reply.update({"Response": "Follows", "Output": ""})
+        elif lname == "originate":
+            reply["Message"] = "Originate successfully queued"
+            self._originated(action)
+        else:
+            reply["Message"] = "OK"
+
+        try:
+            writer.write(self._frame(reply))
+            if lname == "coreshowchannels" and reply["Response"] == "Success":
+                action_id = reply["ActionID"]
+                live = list(self._live)
+                for channel in live:
+                    writer.write(self._frame({"Event": "CoreShowChannel", "ActionID": action_id, "Channel": channel}))
+                writer.write(self._frame({"Event": "CoreShowChannelsComplete", "ActionID": action_id,
+                                          "EventList": "Complete", "ListItems": len(live)}))
+            await writer.drain()
+        except Exception:
+            pass
+
+    def _originated(self, action: dict):
+        variables = dict(v.split("=", 1) for v in action.get("Variable", "").split(",") if "=" in v)
+        call_id = variables.get("RETELL_CALL_ID")
+        channel = f"PJSIP/loadtest-{next(self._channels):08x}"
+        self._live[channel] = call_id or ""
+        self._broadcast({"Event": "Newchannel", "Channel": channel})
+        if call_id:
+            self._broadcast({"Event": "VarSet", "Channel": channel,
+                             "Variable": "RETELL_CALL_ID", "Value": call_id})
+        asyncio.create_task(self._lifecycle(channel, call_id))
+
+    async def _lifecycle(self, channel: str, call_id: Optional[str]):
+        if self.amd_url and call_id:
+            await asyncio.sleep(self.amd_delay_ms * random.uniform(0.5, 1.5) / 1000)
+            result = random.choices(list(self.amd_mix), weights=list(self.amd_mix.values()))[0]
+            cause = dict(self.AMD_RESULTS).get(result, result)
+            try:
+                r = await self._http.post(self.amd_url, params={"call_id": call_id, "result": result, "cause": cause})
+                r.raise_for_status()
+                self.amd_sent += 1
+            except Exception as e:
+                self.amd_errors += 1
+                logger.debug(f"AMD callback error: {e}")
+        await asyncio.sleep(self.hangup_after_ms / 1000)
+        self._live.pop(channel, None)
+        self._broadcast({"Event": "Hangup", "Channel": channel, "Cause": "16"})
+
+    def stats(self) -> dict:
+        return {
+            "actions": dict(self.actions),
+            "failed": self.failed,
+            "sessions": len(self._writers),
+            "amd_callbacks": self.amd_sent,
+            "amd_callback_errors": self.amd_errors,
+        }
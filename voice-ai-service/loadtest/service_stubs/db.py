@@ -0,0 +1,15 @@
+# Sustituto de db.py (no versionado) para el harness de carga: el cliente de
+# Supabase apunta al doble de PostgREST que levanta el harness.
+
+import os
+
+from supabase import create_client, Client
+
+_client = None
+
+
+def get_supabase() -> Client:
+    global _client
+    if _client is None:
+        _client = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_ROLE_KEY"])
+    return _client
@@ -0,0 +1,13 @@
+# Sustituto de whatsapp.py (no versionado) para el harness de carga: el
+# servicio de WhatsApp no participa en la carga, queda inactivo.
+
+
+class WhatsAppService:
+    def __init__(self, supabase):
+        self.supabase = supabase
+
+    async def initialize(self):
+        pass
+
+    def is_ready(self) -> bool:
+        return False
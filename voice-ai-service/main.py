@@ -1,13 +1,12 @@
-import os, re, json
-from typing import Any, Dict, Optional, List
+import os, json
+from typing import Any, Dict, Optional
 from datetime import datetime, timezone
 
 from fastapi import FastAPI, Header, HTTPException, Request
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from dotenv import load_dotenv
 from db import get_supabase
-import phonenumbers
-from phonenumbers import geocoder as pn_geocoder
 
 # Importar lógica de WhatsApp
 from whatsapp import WhatsAppService
@@ -33,7 +32,16 @@ app = FastAPI(
     openapi_url="/api/openapi.json"
 )
 # Integrar el endpoint de llamadas Retell
-from retell import router as retell_router
+from retell import router as retell_router, ami_pool, channel_index, live_status
+from retell_client import retell_client
+from queue_manager import (queue_manager, status_writer, redis_client, async_redis_client, call_timeline,
+                           adaptive_pacer, call_scheduler, live_calls, campaigns, suppression,
+                           record_call_state, CallState)
+from webhook_pipeline import WebhookPipeline, EVENT_RANK
+from webhook_dedup import WebhookDeduplicator
+from outcome_classifier import outcome_classifier, CALLBACK, COMPLETED, OUTCOME_MIN_CONFIDENCE
+from phone_normalizer import normalize_phone
+from metrics import bind_runtime_gauges
 app.include_router(retell_router)
 
 
@@ -45,8 +53,17 @@ whatsapp_service = None
 
 @app.on_event("startup")
 async def startup_event():
-    """Inicializa el servicio de WhatsApp al arrancar"""
+    """Inicializa conexiones compartidas, la cola y WhatsApp al arrancar"""
     global whatsapp_service
+    retell_client.start()
+    ami_pool.start()
+    channel_index.start()
+    suppression.start()
+    queue_manager.start()
+    call_scheduler.start()
+    webhook_pipeline.start()
+    live_status.start()
+    warm_up_spoken_vars()
     try:
         whatsapp_service = WhatsAppService(supabase)
         await whatsapp_service.initialize()
@@ -54,6 +71,19 @@ async def startup_event():
     except Exception as e:
         print(f"⚠️ Error al inicializar WhatsApp: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Libera conexiones compartidas al detener el servicio"""
+    await live_status.stop()
+    await webhook_pipeline.stop()
+    call_scheduler.stop()
+    await queue_manager.stop()
+    suppression.stop()
+    channel_index.stop()
+    ami_pool.close()
+    await retell_client.aclose()
+    status_writer.close()
+
 # ====== UTILS ======
 def require_bearer(auth_header: Optional[str]):
     """Valida el token Bearer"""
@@ -65,105 +95,36 @@ def require_bearer(auth_header: Optional[str]):
 
 def norm_phone(p: Optional[str]) -> Optional[str]:
     """Normaliza teléfono a formato E.164"""
-    if not p:
-        return None
-    p = p.strip()
-    p = re.sub(r"[ \-()]", "", p)
-    if p.startswith("tel:"):
-        p = p[4:]
-    if p and p[0] != "+" and re.fullmatch(r"\d+", p):
-        p = "+" + p
-    return p
+    return normalize_phone(p)
 
 # ====== SPOKEN PHONE NUMBERS ======
-_ES_DIGITS = ["cero","uno","dos","tres","cuatro","cinco","seis","siete","ocho","nueve"]
-_EN_DIGITS = ["zero","one","two","three","four","five","six","seven","eight","nine"]
-
-def _es_0_99(n:int)->str:
-    esp10 = {10:"diez",11:"once",12:"doce",13:"trece",14:"catorce",15:"quince"}
-    tens = {20:"veinte",30:"treinta",40:"cuarenta",50:"cincuenta",
-            60:"sesenta",70:"setenta",80:"ochenta",90:"noventa"}
-    if n < 10: return _ES_DIGITS[n]
-    if n in esp10: return esp10[n]
-    if 16 <= n <= 19: return "dieci" + _ES_DIGITS[n-10]
-    if n == 20: return "veinte"
-    if 21 <= n <= 29: return "veinti" + _ES_DIGITS[n-20]
-    d, r = (n//10)*10, n%10
-    return tens[d] if r == 0 else f"{tens[d]} y {_ES_DIGITS[r]}"
-
-def _en_0_99(n:int)->str:
-    teens = {10:"ten",11:"eleven",12:"twelve",13:"thirteen",14:"fourteen",
-             15:"fifteen",16:"sixteen",17:"seventeen",18:"eighteen",19:"nineteen"}
-    tens = {20:"twenty",30:"thirty",40:"forty",50:"fifty",
-            60:"sixty",70:"seventy",80:"eighty",90:"ninety"}
-    if n < 10: return _EN_DIGITS[n]
-    if n in teens: return teens[n]
-    if n < 20: return "nineteen"
-    if n in tens: return tens[n]
-    d, r = (n//10)*10, n%10
-    return f"{tens[d]} {_EN_DIGITS[r]}"
-
-_COUNTRY_ES = {
-    "CR": "Costa Rica", "PA":"Panamá", "MX":"México", "CA":"Canadá",
-    "US":"Estados Unidos", "GB":"Reino Unido", "ES":"España"
-}
-_COUNTRY_EN = {
-    "CR":"Costa Rica", "PA":"Panama", "MX":"Mexico", "CA":"Canada",
-    "US":"United States", "GB":"United Kingdom", "ES":"Spain"
-}
-
-def _country_name(num: phonenumbers.PhoneNumber, lang: str) -> str:
-    name = pn_geocoder.country_name_for_number(num, lang) or ""
-    if name: return name
-    rc = phonenumbers.region_code_for_number(num) or ""
-    if lang.startswith("es"): return _COUNTRY_ES.get(rc, rc or "Internacional")
-    return _COUNTRY_EN.get(rc, rc or "International")
-
-def _chunk_pairs(s: str) -> List[str]:
-    return [s[i:i+2] for i in range(0, len(s), 2)]
-
-def _speak_group_es(g: str) -> str:
-    if len(g) == 1: return _ES_DIGITS[int(g)]
-    return _es_0_99(int(g))
-
-def _speak_group_en(g: str) -> str:
-    if len(g) == 1: return _EN_DIGITS[int(g)]
-    return _en_0_99(int(g))
-
-def build_spoken_vars(e164: str) -> dict:
-    """Devuelve variables para pronunciar el teléfono correctamente"""
-    out = {"caller_phone_spoken_es": None, "caller_phone_spoken_en": None}
-    if not e164:
-        return out
-
-    try:
-        num = phonenumbers.parse(e164, None)
-        if not phonenumbers.is_valid_number(num):
-            raise ValueError("invalid")
-        nsn = phonenumbers.national_significant_number(num)
-    except Exception:
-        nsn = re.sub(r"\D", "", e164)
-
-    pairs = _chunk_pairs(nsn)
-
-    try:
-        num = phonenumbers.parse(e164, None)
-        country_es = _country_name(num, "es")
-        country_en = _country_name(num, "en")
-    except Exception:
-        country_es = "Internacional"
-        country_en = "International"
-
-    es_parts = [_speak_group_es(p) for p in pairs]
-    en_parts = [_speak_group_en(p) for p in pairs]
-
-    out["caller_phone_spoken_es"] = f"{country_es}, " + ", ".join(es_parts)
-    out["caller_phone_spoken_en"] = f"{country_en}, " + ", ".join(en_parts)
-    return out
+# Tablas, caché y batch en spoken_phone.py
+from spoken_phone import warm_up_spoken_vars
 
 # ====== CUSTOMER DB ======
+# El historial va a conversation_events (una fila por evento). La columna
+# `conversations` ya no se reescribe; queda legible durante la migración
+# (vista out_customer_conversations).
+CONVERSATION_EVENTS_TABLE = "conversation_events"
+
+# Sin `conversations`: no traer el JSONB completo en cada webhook
+CUSTOMER_COLUMNS = "phone, name"
+OUT_CUSTOMER_COLUMNS = "user_number, user_name"
+
+# Upsert + append en un statement (supabase_tables/conversation_events.sql)
+OUT_CUSTOMER_UPSERT_RPC = "upsert_out_customer_event"
+_out_customer_rpc_available = True
+
+def _append_conversation(kind: str, phone: str, entry: Dict[str, Any]):
+    """Inserta un evento de conversación (escritura de tamaño constante)"""
+    supabase.table(CONVERSATION_EVENTS_TABLE).insert({
+        "customer_kind": kind,
+        "phone": phone,
+        **entry,
+    }).execute()
+
 def _get_customer_by_phone(phone: str) -> Optional[Dict[str, Any]]:
-    r = supabase.table("customers").select("*").eq("phone", phone).limit(1).execute()
+    r = supabase.table("customers").select(CUSTOMER_COLUMNS).eq("phone", phone).limit(1).execute()
     return (r.data or [None])[0]
 
 def _ensure_customer(phone: str) -> Dict[str, Any]:
@@ -173,7 +134,6 @@ def _ensure_customer(phone: str) -> Dict[str, Any]:
         supabase.table("customers").insert({
             "phone": phone,
             "name": None,
-            "conversations": []
         }).execute()
         row = _get_customer_by_phone(phone)
     return row
@@ -185,7 +145,6 @@ def _update_customer(phone: str, name: Optional[str] = None,
                      event: Optional[str] = None):
     """Actualiza info del cliente y agrega conversación"""
     cust = _ensure_customer(phone)
-    conversations = cust.get("conversations") or []
 
     new_conv = {
         "ts": datetime.now(timezone.utc).isoformat(),
@@ -194,10 +153,9 @@ def _update_customer(phone: str, name: Optional[str] = None,
         "sentiment": sentiment or "Neutral",
         "event": event,
     }
-    conversations.append(new_conv)
+    _append_conversation("in", phone, new_conv)
 
     updates = {
-        "conversations": conversations,
         "last_ts": new_conv["ts"],
         "last_event": event,
         "last_summary": summary,
@@ -212,7 +170,7 @@ def _update_customer(phone: str, name: Optional[str] = None,
     supabase.table("customers").update(updates).eq("phone", phone).execute()
 
 def _get_out_customer_by_number(user_number: str) -> Optional[Dict[str, Any]]:
-    r = supabase.table("out_customers").select("*").eq("user_number", user_number).limit(1).execute()
+    r = supabase.table("out_customers").select(OUT_CUSTOMER_COLUMNS).eq("user_number", user_number).limit(1).execute()
     return (r.data or [None])[0]
 
 def _ensure_out_customer(user_number: str) -> Dict[str, Any]:
@@ -222,7 +180,6 @@ def _ensure_out_customer(user_number: str) -> Dict[str, Any]:
         supabase.table("out_customers").insert({
             "user_number": user_number,
             "user_name": None,
-            "conversations": []
         }).execute()
         row = _get_out_customer_by_number(user_number)
     return row
@@ -233,10 +190,31 @@ def _update_customer_out(user_number: str, name: Optional[str] = None,
                      call_id: Optional[str] = None,
                      event: Optional[str] = None):
     """Actualiza info del cliente saliente en out_customers y agrega conversación"""
+    global _out_customer_rpc_available
+    ts_iso = datetime.now(timezone.utc).isoformat()
+
+    # Una sola ida y vuelta: upsert por user_number + evento de conversación
+    if _out_customer_rpc_available:
+        try:
+            supabase.rpc(OUT_CUSTOMER_UPSERT_RPC, {
+                "p_user_number": user_number,
+                "p_name": name.strip() if name else None,
+                "p_call_id": call_id,
+                "p_event": event,
+                "p_summary": summary,
+                "p_sentiment": sentiment,
+                "p_ts": ts_iso,
+            }).execute()
+            return
+        except Exception as e:
+            # PGRST202: la función aún no existe (migración pendiente)
+            if "PGRST202" not in str(e):
+                raise
+            logger.warning(f"⚠️ RPC {OUT_CUSTOMER_UPSERT_RPC} not found, using select/insert/update")
+            _out_customer_rpc_available = False
+
     cust = _ensure_out_customer(user_number)
-    conversations = cust.get("conversations") or []
 
-    ts_iso = datetime.now(timezone.utc).isoformat()
     new_conv = {
         "ts": ts_iso,
         "call_id": call_id,
@@ -244,10 +222,9 @@ def _update_customer_out(user_number: str, name: Optional[str] = None,
         "sentiment": sentiment or "Neutral",
         "event": event,
     }
-    conversations.append(new_conv)
+    _append_conversation("out", user_number, new_conv)
 
     updates: Dict[str, Any] = {
-        "conversations": conversations,
         "last_call_id": call_id,
         "last_interaction_ts": ts_iso,
     }
@@ -262,7 +239,7 @@ def _update_customer_out(user_number: str, name: Optional[str] = None,
 #=======  NUEVO WEBHOOK DE RESPALDO ======
 @app.post("/api/retell/webhook-out")
 async def retell_webhook_out(request: Request):
-    """Maneja eventos de Retell con detección de estados avanzados."""
+    """Valida y encola el evento de Retell; responde sin esperar a la DB."""
     try:
         payload = await request.json()
     except Exception:
@@ -271,6 +248,65 @@ async def retell_webhook_out(request: Request):
     event = payload.get("event") or payload.get("type")
     logger.info(f"📞 Webhook: {event}")
 
+    if event not in EVENT_RANK:
+        return PlainTextResponse("", status_code=204)
+
+    call = payload.get("call") or {}
+    order_key = call.get("call_id") or norm_phone(call.get("to_number"))
+    if not order_key:
+        return PlainTextResponse("", status_code=204)
+
+    # Reintento de Retell: se descarta antes de cualquier trabajo en la DB
+    dedup_key = webhook_dedup.make_key(order_key, event, payload)
+    if await webhook_dedup.is_duplicate(dedup_key):
+        logger.info(f"⏭️ Duplicate webhook {event} for {order_key}")
+        return PlainTextResponse("", status_code=204)
+
+    if not webhook_pipeline.submit(payload, event, order_key):
+        # Backpressure: Retell reintenta más tarde; ese reintento no es duplicado
+        await webhook_dedup.release(dedup_key)
+        logger.warning(f"⚠️ Webhook pipeline full, rejecting {event} for {order_key}")
+        return PlainTextResponse("busy", status_code=503)
+
+    return PlainTextResponse("", status_code=204)
+
+
+def _call_locale(call: dict, job_id: Optional[str]) -> Optional[str]:
+    """Locale de la llamada ('es', 'en'): variables de Retell o, si no vienen, las del trabajo"""
+    locale = (call.get("retell_llm_dynamic_variables") or {}).get("locale")
+    if not locale and job_id:
+        try:
+            locale = json.loads(redis_client.hget(f"call:{job_id}", "variables") or "{}").get("locale")
+        except Exception as e:
+            logger.error(f"❌ Error reading locale for job {job_id}: {e}")
+    if not locale:
+        return None
+    return str(locale).replace("_", "-").split("-")[0].lower()
+
+
+# Campo del payload de Retell con la hora del evento
+_TIMELINE_TS = {"call_started": "start_timestamp", "call_ended": "end_timestamp"}
+
+
+def _apply_webhook_out(payload: dict):
+    """Aplica un evento de Retell (corre en el pipeline, fuera del request)"""
+    event = payload.get("event") or payload.get("type")
+
+    # Línea de tiempo del trabajo (si salió de la cola); con la hora de Retell si la trae
+    call = payload.get("call") or {}
+    job_id = call_timeline.job_for_call(call.get("call_id"))
+    if job_id:
+        call_timeline.mark(job_id, event, call.get(_TIMELINE_TS.get(event, "")))
+        if event == "call_started":
+            # Por si el dialplan no reportó HUMAN
+            record_call_state(job_id, CallState.ACTIVE)
+            live_calls.extend(job_id)
+            campaigns.transition(job_id, "active")
+        elif event == "call_ended":
+            record_call_state(job_id, CallState.COMPLETED)
+            adaptive_pacer.on_call_ended(job_id)
+            live_calls.release(job_id)
+
     # ========== CALL STARTED ==========
     if event == "call_started":
         call = payload.get("call") or {}
@@ -279,13 +315,10 @@ async def retell_webhook_out(request: Request):
 
         if call_id:
             try:
-                supabase.table('outbound_call_queue') \
-                    .update({
-                        'status': 'active',
-                        'updated_at': datetime.utcnow().isoformat()
-                    }) \
-                    .eq('retell_call_id', call_id) \
-                    .execute()
+                status_writer.update_by_call(call_id, {
+                    'status': 'active',
+                    'updated_at': datetime.utcnow().isoformat()
+                })
                 logger.info(f"✅ Queue → ACTIVE: {call_id}")
             except Exception as e:
                 logger.error(f"❌ Error updating to active: {e}")
@@ -301,7 +334,7 @@ async def retell_webhook_out(request: Request):
                 sentiment="Neutral",
             )
 
-        return PlainTextResponse("", status_code=204)
+        return
 
     # ========== CALL ENDED ==========
     if event == "call_ended":
@@ -332,19 +365,17 @@ async def retell_webhook_out(request: Request):
 
         if call_id:
             try:
-                supabase.table('outbound_call_queue') \
-                    .update({
-                        'status': final_status,
-                        'active': False,
-                        'call_duration_seconds': duration_seconds,
-                        'end_reason': end_reason,
-                        'updated_at': datetime.utcnow().isoformat()
-                    }) \
-                    .eq('retell_call_id', call_id) \
-                    .execute()
+                status_writer.update_by_call(call_id, {
+                    'status': final_status,
+                    'active': False,
+                    'call_duration_seconds': duration_seconds,
+                    'end_reason': end_reason,
+                    'updated_at': datetime.utcnow().isoformat()
+                })
                 logger.info(f"✅ Queue → {final_status.upper()} ({duration_seconds}s): {call_id}")
             except Exception as e:
                 logger.error(f"❌ Error updating to {final_status}: {e}")
+        campaigns.transition(job_id, final_status)
 
         # Actualizar CRM
         user_number = norm_phone(to_number)
@@ -357,7 +388,7 @@ async def retell_webhook_out(request: Request):
                 sentiment="Neutral",
             )
 
-        return PlainTextResponse("", status_code=204)
+        return
 
     # ========== CALL ANALYZED ==========
     if event == "call_analyzed":
@@ -369,42 +400,36 @@ async def retell_webhook_out(request: Request):
         summary = call_analysis.get("call_summary") or "Sin análisis"
         sentiment = call_analysis.get("user_sentiment") or "Neutral"
 
-        # Buscar si el usuario pidió callback en el análisis
+        # Resultado estructurado: custom_analysis_data primero, luego el resumen
         custom_data = call_analysis.get("custom_analysis_data") or {}
+        result = outcome_classifier.classify(summary, custom_data, _call_locale(call, job_id))
+        logger.info(f"🏷️ Outcome {call_id}: {result.outcome} ({result.confidence}, {result.source})")
 
-        # Retell puede devolver campos personalizados como:
-        # - "callback_requested": true/false
-        # - "call_outcome": "callback" | "completed" | "not_interested"
-        callback_requested = custom_data.get("callback_requested", False)
-        call_outcome = custom_data.get("call_outcome", "").lower()
-
-        # También buscar en el summary palabras clave
-        summary_lower = summary.lower()
-        callback_keywords = [
-            "llamar después", "call back", "callback",
-            "volver a llamar", "no puede hablar",
-            "ocupado", "busy", "later", "otro momento",
-            "reprogramar", "reschedule"
-        ]
-
-        has_callback_keyword = any(kw in summary_lower for kw in callback_keywords)
-
-        # Determinar si es callback
-        is_callback = callback_requested or call_outcome == "callback" or has_callback_keyword
-
-        if is_callback and call_id:
+        # Un callback vuelve a marcar al cliente: solo con confianza suficiente
+        if call_id and result.outcome == CALLBACK and result.confidence >= OUTCOME_MIN_CONFIDENCE:
             try:
-                supabase.table('outbound_call_queue') \
-                    .update({
-                        'status': 'callback',
-                        'end_reason': 'CALLBACK_REQUESTED',
-                        'updated_at': datetime.utcnow().isoformat()
-                    }) \
-                    .eq('retell_call_id', call_id) \
-                    .execute()
+                status_writer.update_by_call(call_id, {
+                    'status': 'callback',
+                    'end_reason': 'CALLBACK_REQUESTED',
+                    'updated_at': datetime.utcnow().isoformat()
+                })
                 logger.info(f"✅ Queue → CALLBACK: {call_id}")
             except Exception as e:
                 logger.error(f"❌ Error updating to callback: {e}")
+            campaigns.transition(job_id, "callback")
+            try:
+                call_scheduler.callback_job(job_id, custom_data, call)
+            except Exception as e:
+                logger.error(f"❌ Error scheduling callback: {e}")
+        elif call_id and result.outcome != COMPLETED and result.confidence >= OUTCOME_MIN_CONFIDENCE:
+            # El status no cambia (el check de la tabla no tiene estos valores)
+            try:
+                status_writer.update_by_call(call_id, {
+                    'end_reason': result.outcome.upper(),
+                    'updated_at': datetime.utcnow().isoformat()
+                })
+            except Exception as e:
+                logger.error(f"❌ Error updating outcome: {e}")
 
         # Extraer nombre si está disponible
         usernamed = custom_data.get("user_name") or custom_data.get("usernamed")
@@ -424,9 +449,28 @@ async def retell_webhook_out(request: Request):
                 sentiment=sentiment,
             )
 
-        return PlainTextResponse("", status_code=204)
+        return
 
-    return PlainTextResponse("", status_code=204)
+
+# Consumidores del webhook-out: orden por llamada, reintentos y dead-letter
+webhook_pipeline = WebhookPipeline(_apply_webhook_out, redis_client=redis_client)
+webhook_dedup = WebhookDeduplicator(async_redis_client)
+bind_runtime_gauges(queue_manager, webhook_pipeline, status_writer)
+
+
+@app.get("/api/retell/webhook-stats")
+async def webhook_stats(authorization: Optional[str] = Header(None)):
+    """Profundidad, latencia, reintentos y duplicados de webhooks"""
+    require_bearer(authorization)
+    stats = webhook_pipeline.stats()
+    stats["dedup"] = webhook_dedup.stats()
+    return stats
+
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas Prometheus (cola, workers, latencias de Retell/AMI/Supabase, webhooks, AMD)"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/mcp/health")
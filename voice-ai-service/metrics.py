@@ -0,0 +1,107 @@
+# Métricas Prometheus del servicio (GET /metrics).
+# Todas las etiquetas tienen cardinalidad acotada (acción AMI, tipo de
+# evento, estado, operación); nada por llamada ni por teléfono. Los niveles
+# (profundidad de cola, workers ocupados) se leen al momento del scrape.
+
+from typing import Callable
+
+from prometheus_client import Counter, Gauge, Histogram, disable_created_metrics
+
+# Sin las series *_created: la mitad de series por contador/histograma
+disable_created_metrics()
+
+# ---------- dependencias ----------
+RETELL_REGISTER_SECONDS = Histogram(
+    "retell_register_seconds", "Latencia de POST /v2/register-phone-call",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+)
+RETELL_REGISTER_ERRORS = Counter("retell_register_errors_total", "Registros en Retell fallidos")
+
+AMI_ACTION_SECONDS = Histogram(
+    "ami_action_seconds", "Latencia de acciones AMI por tipo (Originate, Getvar, ...)",
+    ["action"], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+AMI_ACTION_ERRORS = Counter("ami_action_errors_total", "Acciones AMI fallidas", ["action"])
+
+SUPABASE_WRITE_SECONDS = Histogram(
+    "supabase_write_seconds", "Latencia de escrituras en Supabase por operación",
+    ["operation"], buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+SUPABASE_WRITE_ROWS = Counter("supabase_write_rows_total", "Filas escritas en Supabase", ["operation"])
+SUPABASE_WRITE_ERRORS = Counter("supabase_write_errors_total", "Escrituras fallidas en Supabase", ["operation"])
+
+# ---------- webhooks ----------
+WEBHOOK_SECONDS = Histogram(
+    "webhook_processing_seconds", "Tiempo del handler por tipo de evento de Retell",
+    ["event"], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+WEBHOOK_OUTCOMES = Counter(
+    "webhook_events_total", "Eventos de webhook por resultado",
+    ["outcome"],  # processed | retried | dead_lettered | stale | rejected | duplicate
+)
+
+# ---------- dialer ----------
+CALL_STATE_TRANSITIONS = Counter(
+    "call_state_transitions_total", "Transiciones de CallState (dispatcher, AMD y webhooks de Retell)",
+    ["state"],  # queued | claimed | calling | active | voicemail | completed | failed
+)
+AMD_RESULTS = Counter("amd_results_total", "Resultados AMD del dialplan", ["result", "cause"])
+CALL_STAGE_SECONDS = Histogram(
+    "call_stage_seconds", "Tiempo entre etapas del ciclo de vida de una llamada",
+    ["gap"], buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 900),
+)
+
+QUEUE_DEPTH = Gauge("call_queue_depth", "Trabajos en cola aún no entregados a un worker")
+WORKERS_BUSY = Gauge("call_workers_busy", "Llamadas en proceso en este nodo")
+WORKERS_MAX = Gauge("call_workers_max", "Concurrencia máxima de este nodo")
+WORKER_UTILIZATION = Gauge("call_worker_utilization", "Fracción de workers ocupados (0-1)")
+WEBHOOK_QUEUE_DEPTH = Gauge("webhook_queue_depth", "Eventos de webhook pendientes de aplicar")
+STATUS_WRITER_PENDING = Gauge("status_writer_pending", "Estados de outbound_call_queue sin escribir")
+
+
+# Valores que manda el dialplan: AMDCAUSE de AMD() y DIALSTATUS de Dial()
+AMD_RESULT_LABELS = frozenset({"HUMAN", "VOICEMAIL", "NO_ANSWER", "BUSY", "FAILED"})
+AMD_CAUSE_LABELS = frozenset({
+    "HUMAN", "TOOLONG", "INITIALSILENCE", "LONGGREETING", "MAXWORDS", "MAXWORDLENGTH",
+    "LATE_ANSWER", "LINE_BUSY", "NOANSWER", "BUSY", "CONGESTION", "CHANUNAVAIL", "CANCEL",
+    "DONTCALL", "TORTURE", "INVALIDARGS",
+    "TIMEOUT_NOANSWER", "TIMEOUT_BUSY", "TIMEOUT_CONGESTION", "TIMEOUT_CHANUNAVAIL", "TIMEOUT_CANCEL",
+})
+
+
+def amd_result_label(result: str) -> str:
+    """`result` llega sin autenticar por query param: fuera de la lista → 'OTHER'"""
+    label = (result or "").upper()
+    return label if label in AMD_RESULT_LABELS else "OTHER"
+
+
+def amd_cause_label(cause: str) -> str:
+    """'TOOLONG-5000' → 'TOOLONG'; causas desconocidas → 'OTHER'"""
+    if not cause:
+        return "none"
+    label = cause.split("-", 1)[0].upper()
+    return label if label in AMD_CAUSE_LABELS else "OTHER"
+
+
+def _safe(fn: Callable[[], float]) -> Callable[[], float]:
+    # Un error al leer un nivel no debe romper el scrape completo
+    def wrapped() -> float:
+        try:
+            return float(fn())
+        except Exception:
+            return float("nan")
+    return wrapped
+
+
+def bind_runtime_gauges(queue_manager, webhook_pipeline=None, status_writer=None):
+    """Conecta los niveles a sus fuentes; se evalúan en cada scrape"""
+    QUEUE_DEPTH.set_function(_safe(queue_manager.get_queue_size))
+    WORKERS_BUSY.set_function(_safe(lambda: queue_manager.active_count))
+    WORKERS_MAX.set_function(_safe(lambda: queue_manager.max_concurrent))
+    WORKER_UTILIZATION.set_function(
+        _safe(lambda: queue_manager.active_count / queue_manager.max_concurrent)
+    )
+    if webhook_pipeline is not None:
+        WEBHOOK_QUEUE_DEPTH.set_function(_safe(webhook_pipeline.depth))
+    if status_writer is not None:
+        STATUS_WRITER_PENDING.set_function(_safe(status_writer.pending))
@@ -0,0 +1,216 @@
+# Clasificador de resultado de llamada para eventos call_analyzed.
+# Las frases por locale (es/en) se compilan una sola vez en una regex con
+# límites de palabra y un grupo con nombre por regla; el texto se normaliza
+# (minúsculas, sin tildes) para que "despues" y "después" coincidan.
+# custom_analysis_data de Retell tiene prioridad sobre el resumen; un
+# call_outcome "completed" solo lo pisa una frase con confianza suficiente
+# (OUTCOME_MIN_CONFIDENCE): "pagará mañana" no es un pedido de callback.
+
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+# Confianza mínima para actuar sobre un resultado (y para pisar un "completed" estructurado)
+OUTCOME_MIN_CONFIDENCE = float(os.getenv("OUTCOME_MIN_CONFIDENCE", 0.6))
+
+# Resultados posibles
+CALLBACK = "callback"
+NOT_INTERESTED = "not_interested"
+WRONG_NUMBER = "wrong_number"
+DO_NOT_CALL = "do_not_call"
+COMPLETED = "completed"
+
+# Valores de custom_analysis_data.call_outcome aceptados como sinónimos
+_OUTCOME_ALIASES = {
+    "callback": CALLBACK,
+    "call_back": CALLBACK,
+    "reschedule": CALLBACK,
+    "not_interested": NOT_INTERESTED,
+    "no_interesado": NOT_INTERESTED,
+    "wrong_number": WRONG_NUMBER,
+    "numero_equivocado": WRONG_NUMBER,
+    "do_not_call": DO_NOT_CALL,
+    "dnc": DO_NOT_CALL,
+    "completed": COMPLETED,
+    "finished": COMPLETED,
+}
+
+# locale → resultado → [(frase, peso)]
+# Peso ~ qué tan inequívoca es la frase por sí sola.
+DEFAULT_RULES: Dict[str, Dict[str, List[Tuple[str, float]]]] = {
+    "es": {
+        CALLBACK: [
+            ("llamar despues", 0.8), ("llamar mas tarde", 0.8),
+            ("volver a llamar", 0.8), ("vuelva a llamar", 0.8),
+            ("devolver la llamada", 0.75), ("no puede hablar", 0.7),
+            ("no podia hablar", 0.7), ("otro momento", 0.7),
+            ("mas tarde", 0.55), ("reprogramar", 0.75), ("ocupado", 0.5),
+            ("ocupada", 0.5), ("manana", 0.4),
+        ],
+        NOT_INTERESTED: [
+            ("no esta interesado", 0.85), ("no esta interesada", 0.85),
+            ("no le interesa", 0.85), ("no tiene interes", 0.85),
+            ("sin interes", 0.7), ("no quiere", 0.55), ("rechazo", 0.6),
+        ],
+        WRONG_NUMBER: [
+            ("numero equivocado", 0.9), ("numero incorrecto", 0.85),
+            ("persona equivocada", 0.85), ("no conoce a", 0.6),
+            ("no es la persona", 0.7),
+        ],
+        DO_NOT_CALL: [
+            ("no volver a llamar", 0.95), ("no lo llamen mas", 0.95),
+            ("no la llamen mas", 0.95), ("no llamar mas", 0.9),
+            ("que no lo llamen", 0.9), ("que no la llamen", 0.9),
+            ("eliminar su numero", 0.85), ("sacar de la lista", 0.85),
+        ],
+    },
+    "en": {
+        CALLBACK: [
+            ("call back", 0.8), ("callback", 0.8), ("call later", 0.8),
+            ("call again", 0.7), ("another time", 0.7), ("reschedule", 0.75),
+            ("can't talk", 0.7), ("cannot talk", 0.7), ("not a good time", 0.7),
+            ("busy", 0.5), ("later", 0.45), ("tomorrow", 0.4),
+        ],
+        NOT_INTERESTED: [
+            ("not interested", 0.85), ("no interest", 0.8),
+            ("isn't interested", 0.85), ("wasn't interested", 0.85),
+            ("declined", 0.6), ("doesn't want", 0.55),
+        ],
+        WRONG_NUMBER: [
+            ("wrong number", 0.9), ("wrong person", 0.85),
+            ("does not know", 0.55), ("doesn't know", 0.55),
+            ("not the right person", 0.8),
+        ],
+        DO_NOT_CALL: [
+            ("do not call", 0.95), ("don't call", 0.9), ("stop calling", 0.95),
+            ("remove from list", 0.9), ("remove their number", 0.9),
+            ("remove his number", 0.9), ("remove her number", 0.9),
+            ("never call", 0.9),
+        ],
+    },
+}
+
+# Si coinciden varias reglas, gana la de mayor puntaje; en empate, este orden
+_PRIORITY = [DO_NOT_CALL, WRONG_NUMBER, NOT_INTERESTED, CALLBACK]
+
+# Confianzas de las señales estructuradas
+_CONFIDENCE_OUTCOME_FIELD = 0.95
+_CONFIDENCE_CALLBACK_FLAG = 0.9
+_CONFIDENCE_KEYWORD_CAP = 0.9
+
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin tildes/diacríticos"""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+class OutcomeResult:
+    __slots__ = ("outcome", "confidence", "source", "matches")
+
+    def __init__(self, outcome: str, confidence: float, source: str,
+                 matches: Optional[List[str]] = None):
+        self.outcome = outcome
+        self.confidence = confidence
+        self.source = source
+        self.matches = matches or []
+
+    def to_dict(self) -> dict:
+        return {
+            "outcome": self.outcome,
+            "confidence": self.confidence,
+            "source": self.source,
+            "matches": self.matches,
+        }
+
+    def __repr__(self):
+        return f"OutcomeResult({self.outcome}, {self.confidence}, {self.source}, {self.matches})"
+
+
+class OutcomeClassifier:
+    """
+    classify(summary, custom_data, locale) → OutcomeResult.
+
+    Las reglas se pueden reemplazar o ampliar con add_rules(); la regex se
+    recompila solo al cambiar las reglas, nunca en el camino del webhook.
+    """
+
+    def __init__(self, rules: Optional[Dict[str, Dict[str, List[Tuple[str, float]]]]] = None,
+                 min_confidence: float = OUTCOME_MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+        self._rules: Dict[str, Dict[str, List[Tuple[str, float]]]] = {}
+        self._patterns: Dict[Optional[str], re.Pattern] = {}
+        # nombre de grupo → (resultado, frase, peso)
+        self._groups: Dict[str, Tuple[str, str, float]] = {}
+        self.add_rules(rules if rules is not None else DEFAULT_RULES)
+
+    def add_rules(self, rules: Dict[str, Dict[str, List[Tuple[str, float]]]]):
+        for locale, by_outcome in rules.items():
+            dest = self._rules.setdefault(locale, {})
+            for outcome, phrases in by_outcome.items():
+                dest.setdefault(outcome, []).extend(phrases)
+        self._compile()
+
+    def _compile(self):
+        self._groups = {}
+        alternatives: Dict[str, List[str]] = {}
+        for locale, by_outcome in self._rules.items():
+            for outcome, phrases in by_outcome.items():
+                for phrase, weight in phrases:
+                    name = f"g{len(self._groups)}"
+                    self._groups[name] = (outcome, phrase, weight)
+                    # Espacios flexibles y límites de palabra en ambos extremos
+                    body = r"\s+".join(re.escape(w) for w in normalize(phrase).split())
+                    alternatives.setdefault(locale, []).append(f"(?P<{name}>\\b{body}\\b)")
+
+        # Una regex por locale y una combinada para locale desconocido
+        self._patterns = {
+            locale: re.compile("|".join(alts)) for locale, alts in alternatives.items()
+        }
+        every = [alt for alts in alternatives.values() for alt in alts]
+        self._patterns[None] = re.compile("|".join(every)) if every else re.compile(r"(?!x)x")
+
+    def _from_custom_data(self, custom_data: dict) -> Optional[OutcomeResult]:
+        raw = str(custom_data.get("call_outcome") or "").strip().lower().replace(" ", "_")
+        outcome = _OUTCOME_ALIASES.get(raw)
+        if outcome:
+            return OutcomeResult(outcome, _CONFIDENCE_OUTCOME_FIELD, "custom_analysis_data", [raw])
+        if custom_data.get("callback_requested") is True:
+            return OutcomeResult(CALLBACK, _CONFIDENCE_CALLBACK_FLAG, "custom_analysis_data",
+                                 ["callback_requested"])
+        return None
+
+    def _from_summary(self, summary: str, locale: Optional[str]) -> Optional[OutcomeResult]:
+        pattern = self._patterns.get(locale) or self._patterns[None]
+        scores: Dict[str, float] = {}
+        matches: Dict[str, List[str]] = {}
+        for m in pattern.finditer(normalize(summary)):
+            outcome, phrase, weight = self._groups[m.lastgroup]
+            # Varias frases del mismo resultado se combinan (noisy-or)
+            prev = scores.get(outcome, 0.0)
+            scores[outcome] = 1 - (1 - prev) * (1 - weight)
+            matches.setdefault(outcome, []).append(phrase)
+        if not scores:
+            return None
+
+        rank = {o: i for i, o in enumerate(_PRIORITY)}
+        best = max(scores, key=lambda o: (scores[o], -rank.get(o, len(rank))))
+        confidence = round(min(scores[best], _CONFIDENCE_KEYWORD_CAP), 2)
+        return OutcomeResult(best, confidence, "summary", matches[best])
+
+    def classify(self, summary: str, custom_data: Optional[dict] = None,
+                 locale: Optional[str] = None) -> OutcomeResult:
+        structured = self._from_custom_data(custom_data or {})
+        if structured and structured.outcome != COMPLETED:
+            return structured
+
+        keyword = self._from_summary(summary or "", locale)
+        if keyword and (structured is None or keyword.confidence >= self.min_confidence):
+            return keyword
+        if structured:
+            return structured
+        return OutcomeResult(COMPLETED, 0.5, "default")
+
+
+outcome_classifier = OutcomeClassifier()
@@ -0,0 +1,210 @@
+# Control de llamadas por segundo (CPS) para todo el cluster.
+# Token bucket en Redis por troncal de salida y por caller ID; cada worker
+# toma un token antes de originate_in_asterisk.
+
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Optional, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+BUCKET_PREFIX = "cps:"
+BUCKET_SET = "cps:buckets"
+
+def _parse_limits(raw: str) -> Dict[str, float]:
+    """'didww-out=5,metrocom-out=2' → {'didww-out': 5.0, 'metrocom-out': 2.0}"""
+    limits = {}
+    for part in (raw or "").split(","):
+        if "=" not in part:
+            continue
+        name, value = part.split("=", 1)
+        try:
+            limits[name.strip()] = float(value)
+        except ValueError:
+            logger.warning(f"⚠️ Invalid CPS limit '{part}'")
+    return limits
+
+
+CPS_LIMITS = _parse_limits(os.getenv("CPS_LIMITS", "didww-out=5,metrocom-out=2"))
+CPS_DEFAULT = float(os.getenv("CPS_DEFAULT", 5))
+# 0 = sin límite por caller ID
+CPS_PER_CALLER_ID = float(os.getenv("CPS_PER_CALLER_ID", 0))
+CPS_BURST_SECONDS = float(os.getenv("CPS_BURST_SECONDS", 1))
+
+
+def route_for_number(from_number: str) -> str:
+    """
+    Troncal de salida que usará el dialplan para este caller ID. Mismo
+    criterio que [retell-originate] (por donde salen todas las llamadas del
+    servicio): FROM_NUMBER que empieza con '+506' → Metrocom, el resto → DIDWW.
+    Las reglas por caller ID de [oml-router] (Telnyx) no aplican a este contexto.
+    """
+    if (from_number or "").startswith("+506"):
+        return "metrocom-out"
+    return "didww-out"
+
+
+# KEYS = buckets; ARGV = rate1, burst1, rate2, burst2, ...
+# Devuelve 0 si tomó un token de todos los buckets, o los ms a esperar.
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local wait = 0
+local levels = {}
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[2 * i - 1])
+  local burst = tonumber(ARGV[2 * i])
+  local b = redis.call('HMGET', key, 'tokens', 'ts')
+  local tokens = tonumber(b[1]) or burst
+  local ts = tonumber(b[2]) or now
+  tokens = math.min(burst, tokens + (now - ts) * rate / 1000)
+  levels[i] = tokens
+  if tokens < 1 then
+    local w = math.ceil((1 - tokens) * 1000 / rate)
+    if w > wait then wait = w end
+  end
+end
+if wait == 0 then
+  for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - 1), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst * 1000 / rate) + 60000)
+  end
+end
+return wait
+"""
+
+# Nivel actual de cada bucket sin consumir tokens
+_PEEK_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local out = {}
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[2 * i - 1])
+  local burst = tonumber(ARGV[2 * i])
+  local b = redis.call('HMGET', key, 'tokens', 'ts')
+  local tokens = tonumber(b[1]) or burst
+  local ts = tonumber(b[2]) or now
+  out[i] = tostring(math.min(burst, tokens + (now - ts) * rate / 1000))
+end
+return out
+"""
+
+
+class CallPacer:
+    """Token buckets compartidos en Redis: el límite vale para todos los nodos"""
+
+    def __init__(self, client, async_client=None,
+                 limits: Dict[str, float] = CPS_LIMITS,
+                 default_cps: float = CPS_DEFAULT,
+                 per_caller_id_cps: float = CPS_PER_CALLER_ID,
+                 burst_seconds: float = CPS_BURST_SECONDS):
+        self.redis = client
+        self.async_redis = async_client
+        self.limits = limits
+        self.default_cps = default_cps
+        self.per_caller_id_cps = per_caller_id_cps
+        self.burst_seconds = burst_seconds
+
+        self._acquire = client.register_script(_ACQUIRE_SCRIPT)
+        self._peek = client.register_script(_PEEK_SCRIPT)
+        self._aacquire = async_client.register_script(_ACQUIRE_SCRIPT) if async_client else None
+        self._waits = 0
+        self._waited_ms = 0
+
+    def _buckets(self, from_number: str) -> List[Tuple[str, float, float]]:
+        """[(key, rate, burst)] que debe pasar una llamada con este caller ID"""
+        route = route_for_number(from_number)
+        rate = self.limits.get(route, self.default_cps)
+        buckets = [(f"{BUCKET_PREFIX}route:{route}", rate, max(1.0, rate * self.burst_seconds))]
+        if self.per_caller_id_cps > 0:
+            rate = self.per_caller_id_cps
+            buckets.append((f"{BUCKET_PREFIX}cid:{from_number}", rate,
+                            max(1.0, rate * self.burst_seconds)))
+        return buckets
+
+    @staticmethod
+    def _script_args(buckets) -> Tuple[list, list]:
+        keys = [b[0] for b in buckets]
+        args = []
+        for _key, rate, burst in buckets:
+            args.extend([rate, burst])
+        return keys, args
+
+    def _note_wait(self, wait_ms: int):
+        self._waits += 1
+        self._waited_ms += wait_ms
+
+    def acquire(self, from_number: str, timeout: Optional[float] = None) -> bool:
+        """Bloquea hasta obtener un token (False si vence timeout). Si Redis falla, deja pasar."""
+        buckets = self._buckets(from_number)
+        keys, args = self._script_args(buckets)
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            self.redis.sadd(BUCKET_SET, *keys)
+            while True:
+                wait_ms = int(self._acquire(keys=keys, args=args))
+                if wait_ms <= 0:
+                    return True
+                self._note_wait(wait_ms)
+                if deadline and time.monotonic() + wait_ms / 1000 > deadline:
+                    return False
+                # Jitter para que los workers no despierten todos juntos
+                time.sleep(wait_ms / 1000 + random.uniform(0, 0.05))
+        except Exception as e:
+            logger.error(f"❌ CPS pacer error (allowing call): {e}")
+            return True
+
+    async def aacquire(self, from_number: str, timeout: Optional[float] = None) -> bool:
+        if self._aacquire is None:
+            return await asyncio.to_thread(self.acquire, from_number, timeout)
+
+        buckets = self._buckets(from_number)
+        keys, args = self._script_args(buckets)
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            await self.async_redis.sadd(BUCKET_SET, *keys)
+            while True:
+                wait_ms = int(await self._aacquire(keys=keys, args=args))
+                if wait_ms <= 0:
+                    return True
+                self._note_wait(wait_ms)
+                if deadline and time.monotonic() + wait_ms / 1000 > deadline:
+                    return False
+                await asyncio.sleep(wait_ms / 1000 + random.uniform(0, 0.05))
+        except Exception as e:
+            logger.error(f"❌ CPS pacer error (allowing call): {e}")
+            return True
+
+    def levels(self) -> dict:
+        """Tokens disponibles por bucket (para /queue-status)"""
+        out = {
+            "limits": dict(self.limits),
+            "default_cps": self.default_cps,
+            "per_caller_id_cps": self.per_caller_id_cps,
+            "waits": self._waits,
+            "waited_ms": self._waited_ms,
+            "buckets": {},
+        }
+        try:
+            keys = sorted(self.redis.smembers(BUCKET_SET))
+            if not keys:
+                return out
+            args = []
+            for key in keys:
+                name = key[len(BUCKET_PREFIX):]
+                if name.startswith("route:"):
+                    rate = self.limits.get(name[len("route:"):], self.default_cps)
+                else:
+                    rate = self.per_caller_id_cps or self.default_cps
+                args.extend([rate, max(1.0, rate * self.burst_seconds)])
+            values = self._peek(keys=keys, args=args)
+            for key, value in zip(keys, values):
+                out["buckets"][key[len(BUCKET_PREFIX):]] = round(float(value), 3)
+        except Exception as e:
+            logger.error(f"❌ CPS pacer levels error: {e}")
+        return out
@@ -0,0 +1,131 @@
+# Normalizador único de teléfonos a E.164.
+# Reemplaza la lógica repetida en norm_phone (main.py), normalize_inbound_number
+# y batch_call (retell.py). Las reglas por código de país (longitudes
+# nacionales válidas) salen de la metadata de phonenumbers y se cachean, así
+# validar un lote no requiere un parse completo por número.
+
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import phonenumbers
+from phonenumbers import PhoneMetadata
+
+# Separadores que se eliminan: espacios, guiones, puntos, paréntesis, barras
+_SEPARATORS = re.compile(r"[\s\-().\/]")
+_E164 = re.compile(r"\+\d{7,15}")
+
+# Motivos de rechazo
+EMPTY = "empty"
+NOT_NUMERIC = "not_numeric"
+UNKNOWN_COUNTRY_CODE = "unknown_country_code"
+INVALID_LENGTH = "invalid_length"
+
+
+class _CountryRule:
+    __slots__ = ("cc", "valid_lengths", "dial_lengths")
+
+    def __init__(self, cc: str, valid_lengths: FrozenSet[int], dial_lengths: FrozenSet[int]):
+        self.cc = cc
+        # Longitudes de número nacional aceptadas al validar
+        self.valid_lengths = valid_lengths
+        # Longitudes de fijo/móvil: un número nacional así recibe el código por defecto
+        self.dial_lengths = dial_lengths
+
+
+@lru_cache(maxsize=None)
+def country_rule(cc: str) -> Optional[_CountryRule]:
+    """Regla para un código de país ('506', '1'); None si no existe"""
+    regions = phonenumbers.COUNTRY_CODE_TO_REGION_CODE.get(int(cc))
+    if not regions:
+        return None
+    valid, dial = set(), set()
+    for region in regions:
+        if region == "001":
+            meta = PhoneMetadata.metadata_for_nongeo_region(int(cc))
+        else:
+            meta = PhoneMetadata.metadata_for_region(region)
+        if meta is None:
+            continue
+        valid.update(meta.general_desc.possible_length or ())
+        for desc in (meta.fixed_line, meta.mobile):
+            if desc is not None:
+                dial.update(desc.possible_length or ())
+    return _CountryRule(cc, frozenset(valid), frozenset(dial or valid))
+
+
+def split_country_code(digits: str) -> Optional[str]:
+    """Prefijo de 1 a 3 dígitos que es un código de país (son libres de prefijo)"""
+    for size in (1, 2, 3):
+        if country_rule(digits[:size]) is not None:
+            return digits[:size]
+    return None
+
+
+def normalize_phone(raw: Optional[str], default_cc: Optional[str] = None) -> Optional[str]:
+    """
+    Texto libre → '+<dígitos>' (sin validar la longitud). None si no queda
+    solo dígitos ('anonymous', 'Unknown', '+abc').
+
+    Con default_cc ('+506'), un número nacional con la longitud de fijo/móvil
+    de ese país recibe el código ('88887777' → '+50688887777').
+    """
+    if not raw:
+        return None
+    p = raw.strip()
+    if p.startswith("tel:"):
+        p = p[4:]
+    p = _SEPARATORS.sub("", p)
+
+    if p.startswith("+"):
+        digits = p[1:]
+    elif p.startswith("00"):
+        digits = p[2:]
+    else:
+        digits = p
+        if default_cc and digits.isdigit():
+            cc = default_cc.lstrip("+")
+            rule = country_rule(cc)
+            if rule and len(digits) in rule.dial_lengths and not (
+                digits.startswith(cc) and len(digits) - len(cc) in rule.valid_lengths
+            ):
+                digits = cc + digits
+
+    if not (digits.isascii() and digits.isdigit()):
+        return None
+    return "+" + digits
+
+
+def validate(e164: Optional[str]) -> Optional[str]:
+    """None si el número es E.164 plausible; si no, el motivo de rechazo"""
+    if not e164:
+        return EMPTY
+    if not _E164.fullmatch(e164):
+        return NOT_NUMERIC if not e164[1:].isdigit() else INVALID_LENGTH
+    digits = e164[1:]
+    cc = split_country_code(digits)
+    if cc is None:
+        return UNKNOWN_COUNTRY_CODE
+    rule = country_rule(cc)
+    if rule.valid_lengths and len(digits) - len(cc) not in rule.valid_lengths:
+        return INVALID_LENGTH
+    return None
+
+
+def normalize_many(values: Iterable[Optional[str]],
+                   default_cc: Optional[str] = None) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Normaliza y valida un lote: [(e164, None)] o [(None, motivo)].
+    Los valores repetidos dentro del lote se resuelven una sola vez.
+    """
+    seen: Dict[Optional[str], Tuple[Optional[str], Optional[str]]] = {}
+    out = []
+    for value in values:
+        result = seen.get(value)
+        if result is None:
+            e164 = normalize_phone(value, default_cc)
+            reason = validate(e164) if e164 else (NOT_NUMERIC if (value or "").strip() else EMPTY)
+            result = (None, reason) if reason else (e164, None)
+            seen[value] = result
+        out.append(result)
+    return out
@@ -1,37 +1,90 @@
 # El dialplan notifica AMD via HTTP, no esperamos eventos AMI
 
 import redis
+import redis.asyncio as aioredis
+import asyncio
 import json
 import uuid
+import time
 import threading
-from queue import Queue
 from datetime import datetime
 from enum import Enum
-from typing import Optional
+from typing import Optional, Tuple
 import logging
 import os
 from supabase import create_client, Client
+from job_queue import create_job_queue, fair_queue_key
+from pacing import CallPacer
+from status_writer import SupabaseStatusWriter
+from metrics import CALL_STATE_TRANSITIONS
+from call_timeline import CallTimeline, now_ms, JOB_TTL
+from adaptive_pacing import AdaptivePacer, pacing_key
+from call_scheduler import CallScheduler
+from live_calls import LiveCallLimiter
+from campaigns import CampaignTracker
+from suppression import SuppressionIndex
+from call_state import CallStateStore, HELD, DONE, MISSING
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # ========== CONFIGURACIÓN ==========
+REDIS_HOST = os.getenv("REDIS_HOST", "31.97.210.100")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+
 redis_client = redis.Redis(
-    host="31.97.210.100",
-    port=6379,
+    host=REDIS_HOST,
+    port=REDIS_PORT,
     decode_responses=True,
     socket_timeout=5,
 )
 
+# Cliente async para el dispatcher asyncio (mismo servidor)
+async_redis_client = aioredis.Redis(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    decode_responses=True,
+    socket_timeout=5,
+)
+
+# "threads" (CallQueueManager) o "asyncio" (AsyncCallDispatcher)
+QUEUE_DISPATCH_MODE = os.getenv("QUEUE_DISPATCH_MODE", "threads")
+QUEUE_MAX_CONCURRENT = int(os.getenv("QUEUE_MAX_CONCURRENT", 20))
+
+# Pacing CPS por troncal / caller ID, compartido entre nodos
+call_pacer = CallPacer(redis_client, async_redis_client)
+
+# Timestamps por etapa en call:{job_id} + índice retell_call_id → job_id
+call_timeline = CallTimeline(redis_client, async_redis_client)
+
+# Modo predictivo (QUEUE_PACING_MODE=adaptive): originates en vuelo según la tasa HUMAN
+adaptive_pacer = AdaptivePacer(redis_client, async_redis_client)
+
+# Llamadas vivas por agente/troncal: cupo desde el originate hasta el evento terminal
+live_calls = LiveCallLimiter(redis_client, async_redis_client)
+
+# Progreso por campaña (contadores por estado en campaign:{id})
+campaigns = CampaignTracker(redis_client, async_redis_client)
+
+# Estado en call:{job_id}: claim atómico antes de esperar y conteo por estado
+call_states = CallStateStore(redis_client, async_redis_client)
+
 # Supabase Client
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
+# Write-behind de estados hacia outbound_call_queue (flush en bloque)
+status_writer = SupabaseStatusWriter(supabase)
+
+# DNC / inactivos / marcados recientemente, en memoria (se consulta al encolar)
+suppression = SuppressionIndex(supabase)
+
 
 # ========== ENUMS ==========
 class CallState(str, Enum):
     QUEUED = "queued"
+    CLAIMED = "claimed"
     CALLING = "calling"
     ACTIVE = "active"
     VOICEMAIL = "voicemail"
@@ -39,17 +92,86 @@ class CallState(str, Enum):
     FAILED = "failed"
 
 
+# Contadores ya resueltos por estado: sin .labels() en cada transición
+_TRANSITIONS = {state: CALL_STATE_TRANSITIONS.labels(state.value) for state in CallState}
+
+# Estado del dispatcher → estado de outbound_call_queue en los contadores de campaña
+_CAMPAIGN_STATUS = {
+    CallState.CALLING: "calling",
+    CallState.ACTIVE: "active",
+    CallState.VOICEMAIL: "voicemail",
+    CallState.COMPLETED: "finished",
+    CallState.FAILED: "failed",
+}
+
+
+# ========== CONTEO POR ESTADO ==========
+def get_state_counts() -> dict:
+    """Trabajos por estado del dispatcher: niveles actuales y acumulados terminales"""
+    return call_states.counts()
+
+
+def _state_fields(state: CallState, **kwargs) -> dict:
+    fields = {key: kwargs[key] for key in ("error", "amd_result") if key in kwargs}
+    if state == CallState.COMPLETED:
+        fields['completed_at'] = datetime.utcnow().isoformat()
+    return fields
+
+
+# ========== EVENTOS DE LA LLAMADA ==========
+# Después del originate el estado lo mueven el dialplan (AMD) y los webhooks
+# de Retell. Solo avanza call:{job_id} y el conteo: outbound_call_queue y las
+# campañas las actualizan esos mismos handlers con su propio mapeo.
+_AMD_STATES = {"HUMAN": CallState.ACTIVE, "VOICEMAIL": CallState.VOICEMAIL}
+
+
+def amd_call_state(result: str) -> CallState:
+    """HUMAN → ACTIVE, VOICEMAIL → VOICEMAIL; NO_ANSWER/BUSY/FAILED → FAILED"""
+    return _AMD_STATES.get((result or "").upper(), CallState.FAILED)
+
+
+def _on_recorded(state: CallState, res) -> bool:
+    # Solo cuenta la transición que avanzó (un webhook repetido no suma)
+    if res and res[0]:
+        _TRANSITIONS[state].inc()
+        return True
+    return False
+
+
+def record_call_state(job_id: Optional[str], state: CallState, **kwargs) -> bool:
+    """False si no cambió (evento repetido, atrasado o trabajo vencido)"""
+    if not job_id:
+        return False
+    try:
+        res = call_states.set(job_id, state.value, _state_fields(state, **kwargs))
+    except Exception as e:
+        logger.error(f"Redis error (call state {state.value}): {e}")
+        return False
+    return _on_recorded(state, res)
+
+
+async def arecord_call_state(job_id: Optional[str], state: CallState, **kwargs) -> bool:
+    if not job_id:
+        return False
+    try:
+        res = await call_states.aset(job_id, state.value, _state_fields(state, **kwargs))
+    except Exception as e:
+        logger.error(f"Redis error (call state {state.value}): {e}")
+        return False
+    return _on_recorded(state, res)
+
+
 # ========== FUNCIÓN STANDALONE PARA ACTUALIZAR SUPABASE ==========
 def update_supabase_status(job_id: str, phone: str, status: str, retell_call_id: str = None):
-    """Actualiza estado en Supabase outbound_call_queue"""
+    """Encola el cambio de estado para outbound_call_queue (se escribe en bloque)"""
     try:
         status_map = {
             'queued': 'queued',
             'calling': 'calling',
             'active': 'active',
-            'voicemail': 'canceled',
+            'voicemail': 'voicemail',
             'completed': 'finished',
-            'failed': 'canceled'
+            'failed': 'failed'
         }
 
         supabase_status = status_map.get(status, status)
@@ -62,21 +184,51 @@ def update_supabase_status(job_id: str, phone: str, status: str, retell_call_id:
         if retell_call_id:
             update_data['retell_call_id'] = retell_call_id
 
-        # Si es finished o canceled, marcar como inactive
-        if supabase_status in ['finished', 'canceled']:
+        # Estados finales (outbound_call_queue_status_check): la fila queda inactiva
+        if supabase_status in ['finished', 'voicemail', 'failed']:
             update_data['active'] = False
 
-        result = supabase.table('outbound_call_queue') \
-            .update(update_data) \
-            .eq('phone', phone) \
-            .eq('job_id', job_id) \
-            .execute()
+        status_writer.update_by_job(job_id, phone, update_data)
 
-        logger.info(f"✅ Supabase: {phone} → {supabase_status}")
+        logger.info(f"📝 Supabase (queued): {phone} → {supabase_status}")
     except Exception as e:
         logger.error(f"❌ Supabase error: {e}")
 
 
+# ========== LÓGICA COMÚN DE LOS DISPATCHERS ==========
+def _claim_skip(job_id: str, outcome: str, prev: Optional[str]) -> Optional[bool]:
+    """None si este worker tomó el trabajo; si no, si su entrada se confirma (ack)"""
+    if outcome == MISSING:
+        raise ValueError(f"Job {job_id} not found")
+    if outcome == HELD:
+        logger.warning(f"⏭️ Job {job_id[:8]}... claimed by another worker, skipping redelivery")
+        return False
+    if outcome == DONE:
+        logger.warning(f"⏭️ Job {job_id[:8]}... already {prev}, skipping redelivery")
+        return True
+    _TRANSITIONS[CallState.CLAIMED].inc()
+    return None
+
+
+def _on_state_set(state: CallState, res) -> Tuple[Optional[dict], bool]:
+    """(job_data, changed): job_data None si el worker ya perdió el claim"""
+    if res is None:
+        return None, False
+    changed, job_data = res
+    if changed:
+        _TRANSITIONS[state].inc()
+    return job_data, changed
+
+
+def _push_status(job_id: str, state: CallState, job_data: dict):
+    update_supabase_status(
+        job_id=job_id,
+        phone=job_data.get('to_number'),
+        status=state.value,
+        retell_call_id=job_data.get('retell_call_id')
+    )
+
+
 # ========== CLASES ==========
 class CallJob:
     def __init__(self, job_id: str, to_number: str, from_number: str, agent_id: str):
@@ -109,21 +261,19 @@ class CallJob:
         return {k: v for k, v in raw.items() if v is not None}
 
 
-class CallQueueManager:
-    def __init__(self, max_concurrent=20):
+class _CallDispatcher:
+    """Encolado y consultas comunes a CallQueueManager y AsyncCallDispatcher"""
+
+    def __init__(self, max_concurrent: int):
         self.max_concurrent = max_concurrent
-        self.call_queue = Queue()
+        self.job_queue = create_job_queue(redis_client, async_redis_client)
         self.active_count = 0
-        self.lock = threading.Lock()
-
-        logger.info(f"Starting {max_concurrent} workers...")
-        for i in range(max_concurrent):
-            t = threading.Thread(target=self._worker, daemon=True, name=f"Worker-{i}")
-            t.start()
-        logger.info(f"✅ {max_concurrent} workers started")
 
-    def submit_call(self, to_number: str, from_number: str, agent_id: str, variables: dict = None) -> str:
-        job_id = str(uuid.uuid4())
+    def submit_call(self, to_number: str, from_number: str, agent_id: str, variables: dict = None,
+                    attempt: int = 1, priority: Optional[str] = None, campaign_id: Optional[str] = None,
+                    job_id: Optional[str] = None) -> str:
+        # job_id explícito: ya reservado por una clave de idempotencia
+        job_id = job_id or str(uuid.uuid4())
         job = CallJob(
             job_id=job_id,
             to_number=to_number,
@@ -132,59 +282,133 @@ class CallQueueManager:
         )
 
         try:
-            redis_client.hset(f"call:{job_id}", mapping=job.to_dict())
-            redis_client.expire(f"call:{job_id}", 7200)
+            pipe = redis_client.pipeline()
+            pipe.hset(f"call:{job_id}", mapping={
+                **job.to_dict(),
+                "t_submitted": now_ms(),
+                # Para que el scheduler pueda reintentar el mismo trabajo
+                "variables": json.dumps(variables or {}),
+                "attempt": attempt,
+            })
+            if campaign_id:
+                campaigns.add_job(pipe, campaign_id, job_id, retry=attempt > 1)
+            pipe.expire(f"call:{job_id}", JOB_TTL)
+            call_states.add_queued(pipe, job_id)
+            pipe.execute()
         except Exception as e:
             logger.error(f"Redis error: {e}")
             raise
+        _TRANSITIONS[CallState.QUEUED].inc()
 
-        self.call_queue.put((job_id, variables or {}))
+        self.job_queue.put(job_id, variables or {},
+                           queue_key=fair_queue_key(agent_id, from_number, variables), priority=priority)
         logger.info(f"📞 Job {job_id[:8]}... queued for {to_number}")
         return job_id
 
+    def get_job(self, job_id: str) -> dict:
+        data = redis_client.hgetall(f"call:{job_id}")
+        return data if data else None
+
+    def get_active_count(self) -> int:
+        return self.active_count
+
+    def get_queue_size(self) -> int:
+        return self.job_queue.qsize()
+
+
+class CallQueueManager(_CallDispatcher):
+    def __init__(self, max_concurrent=20):
+        super().__init__(max_concurrent)
+        self.lock = threading.Lock()
+
+        logger.info(f"Starting {max_concurrent} workers...")
+        for i in range(max_concurrent):
+            t = threading.Thread(target=self._worker, daemon=True, name=f"Worker-{i}")
+            t.start()
+        logger.info(f"✅ {max_concurrent} workers started")
+
     def _worker(self):
         thread_name = threading.current_thread().name
         logger.info(f"🔧 {thread_name} ready")
 
         while True:
-            job_id, variables = self.call_queue.get()
+            try:
+                item = self.job_queue.get()
+            except Exception as e:
+                logger.error(f"❌ {thread_name} queue error: {e}")
+                time.sleep(1)
+                continue
+            if item is None:
+                continue
+            entry_id, job_id, variables = item
+            # Dueño de este intento: las transiciones solo valen mientras tenga el claim
+            owner = uuid.uuid4().hex
 
             with self.lock:
                 self.active_count += 1
 
             logger.info(f"🚀 {thread_name} processing {job_id[:8]}...")
 
+            ack = True
             try:
-                self._process_call(job_id, variables)
+                ack = self._process_call(entry_id, job_id, variables, owner)
             except Exception as e:
                 logger.error(f"❌ {thread_name} error: {e}")
-                self._update_state(job_id, CallState.FAILED, error=str(e))
+                self._update_state(job_id, CallState.FAILED, owner=owner, error=str(e))
             finally:
                 with self.lock:
                     self.active_count -= 1
-                self.call_queue.task_done()
+                try:
+                    if ack:
+                        self.job_queue.ack(entry_id)
+                    else:
+                        self.job_queue.release(entry_id)
+                except Exception as e:
+                    logger.error(f"❌ {thread_name} ack error: {e}")
+
+    def _process_call(self, entry_id: str, job_id: str, variables: dict, owner: str) -> bool:
+        """False si otro worker tiene el trabajo: su entrada no se confirma"""
+        # Entrega al-menos-una-vez: queued → claimed atómico antes de cualquier espera
+        skip = _claim_skip(job_id, *call_states.claim(job_id, owner))
+        if skip is not None:
+            return skip
 
-    def _process_call(self, job_id: str, variables: dict):
         job_data = redis_client.hgetall(f"call:{job_id}")
-        if not job_data:
-            raise ValueError(f"Job {job_id} not found")
-
         to_number = job_data['to_number']
         from_number = job_data['from_number']
         agent_id = job_data['agent_id']
 
-        # CALLING
-        self._update_state(job_id, CallState.CALLING)
+        call_timeline.mark(job_id, "picked_up")
+        # Mientras espera cupo renueva el claim y la entrada, así no se vuelve a entregar
+        keepalive = call_states.keepalive(self.job_queue, entry_id, job_id, owner)
+
+        # Modo adaptativo: espera cupo de la campaña/troncal (CLAIMED mientras tanto)
+        if not adaptive_pacer.acquire(pacing_key(agent_id, from_number, variables), job_id, keepalive):
+            return False
+        # Cupo de llamada viva (se libera con AMD terminal, call_ended o FAILED)
+        if not live_calls.acquire(agent_id, from_number, job_id, keepalive):
+            return False
+
+        # CALLING (solo si el claim sigue siendo de este worker)
+        if self._update_state(job_id, CallState.CALLING, owner=owner) is None:
+            logger.warning(f"⏭️ Job {job_id[:8]}... lost its claim while waiting, skipping")
+            return False
         redis_client.hset(f"call:{job_id}", "started_at", datetime.utcnow().isoformat())
 
         from retell import register_call_with_retell_sync, originate_in_asterisk
 
+        # Token CPS de la troncal antes de registrar: el registro en Retell
+        # queda justo antes del originate y no se desperdicia en un rechazo
+        call_pacer.acquire(from_number)
+
         # Registrar en Retell
         retell_call_id = register_call_with_retell_sync(
             to_number, from_number, agent_id, variables
         )
 
         redis_client.hset(f"call:{job_id}", "retell_call_id", retell_call_id)
+        call_timeline.link(retell_call_id, job_id)
+        call_timeline.mark(job_id, "registered")
         update_supabase_status(job_id, to_number, 'calling', retell_call_id)
         logger.info(f"📋 Job {job_id[:8]}... → Retell {retell_call_id}")
 
@@ -194,6 +418,7 @@ class CallQueueManager:
         logger.info(f"📊 Originate result for job {job_id[:8]}: {result}")
 
         if result.get('success'):
+            call_timeline.mark(job_id, "originated")
             # Llamada originada exitosamente
             # El estado final será actualizado por:
             # 1. El dialplan via /api/retell/amd-result (VOICEMAIL/HUMAN)
@@ -201,42 +426,221 @@ class CallQueueManager:
             logger.info(f"✅ Job {job_id[:8]}... → ORIGINATED (waiting for AMD/webhook)")
         else:
             # Error al originar
-            self._update_state(job_id, CallState.FAILED,
+            self._update_state(job_id, CallState.FAILED, owner=owner,
                              error=result.get('hangup_cause', 'Originate failed'))
             logger.info(f"❌ Job {job_id[:8]}... → FAILED")
+        return True
+
+    def _update_state(self, job_id: str, state: CallState, owner: Optional[str] = None,
+                      **kwargs) -> Optional[dict]:
+        """Con owner, no hace nada (None) si el worker ya perdió el claim"""
+        job_data, changed = _on_state_set(
+            state, call_states.set(job_id, state.value, _state_fields(state, **kwargs), owner))
+        if not changed:
+            # Ya avanzó por AMD/webhook: no se pisa con un estado anterior
+            return job_data
+        if state == CallState.FAILED and job_data.get('pace_key'):
+            adaptive_pacer.release(job_data['pace_key'], job_id)
+        if state == CallState.FAILED and job_data.get('live_slots'):
+            live_calls.release(job_id)
+        if job_data.get('campaign_id') and state in _CAMPAIGN_STATUS:
+            campaigns.transition(job_id, _CAMPAIGN_STATUS[state])
+        if job_data:
+            _push_status(job_id, state, job_data)
+        return job_data
 
-    def _update_state(self, job_id: str, state: CallState, **kwargs):
-        updates = {"state": state.value}
+    def get_active_count(self) -> int:
+        with self.lock:
+            return self.active_count
 
-        if 'error' in kwargs:
-            updates['error'] = kwargs['error']
-        if 'amd_result' in kwargs:
-            updates['amd_result'] = kwargs['amd_result']
-        if state == CallState.COMPLETED:
-            updates['completed_at'] = datetime.utcnow().isoformat()
+    def start(self):
+        """Los workers arrancan en __init__; se mantiene por simetría con AsyncCallDispatcher"""
+
+    async def stop(self):
+        """Los hilos son daemon y terminan con el proceso"""
+
+
+class AsyncCallDispatcher(_CallDispatcher):
+    """
+    Mismo ciclo de vida que CallQueueManager pero como corrutinas en el
+    event loop de FastAPI. La concurrencia la limita un semáforo, no un
+    número de hilos, así que cientos de originates pueden estar en vuelo.
+    """
+
+    def __init__(self, max_concurrent=200):
+        super().__init__(max_concurrent)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._dispatcher_task: Optional[asyncio.Task] = None
+        self._tasks = set()
+
+    def start(self):
+        """Arranca el dispatcher en el loop actual (llamar desde el startup de la app)"""
+        if self._dispatcher_task and not self._dispatcher_task.done():
+            return
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._dispatcher_task = asyncio.get_running_loop().create_task(self._dispatch())
+        logger.info(f"✅ Async dispatcher started (max_concurrent={self.max_concurrent})")
+
+    async def stop(self):
+        if self._dispatcher_task:
+            self._dispatcher_task.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _dispatch(self):
+        while True:
+            # Tomar el cupo antes de leer: no se retiran trabajos que otro nodo podría atender
+            await self._semaphore.acquire()
+            try:
+                item = await self.job_queue.aget()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Async dispatcher queue error: {e}")
+                item = None
+                await asyncio.sleep(1)
+            if item is None:
+                self._semaphore.release()
+                continue
+
+            task = asyncio.create_task(self._run(*item))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, entry_id: str, job_id: str, variables: dict):
+        self.active_count += 1
+        owner = uuid.uuid4().hex
+        logger.info(f"🚀 Async worker processing {job_id[:8]}...")
+        ack = True
+        try:
+            ack = await self._process_call(entry_id, job_id, variables, owner)
+        except asyncio.CancelledError:
+            # Apagado: la entrada queda pendiente y otro worker la reclama
+            ack = False
+            raise
+        except Exception as e:
+            logger.error(f"❌ Async worker error: {e}")
+            await self._update_state(job_id, CallState.FAILED, owner=owner, error=str(e))
+        finally:
+            self.active_count -= 1
+            self._semaphore.release()
+            try:
+                if ack:
+                    await self.job_queue.aack(entry_id)
+                else:
+                    await self.job_queue.arelease(entry_id)
+            except Exception as e:
+                logger.error(f"❌ Async worker ack error: {e}")
 
-        redis_client.hset(f"call:{job_id}", mapping=updates)
+    async def _process_call(self, entry_id: str, job_id: str, variables: dict, owner: str) -> bool:
+        """False si otro worker tiene el trabajo: su entrada no se confirma"""
+        skip = _claim_skip(job_id, *await call_states.aclaim(job_id, owner))
+        if skip is not None:
+            return skip
 
-        job_data = redis_client.hgetall(f"call:{job_id}")
-        if job_data:
-            update_supabase_status(
-                job_id=job_id,
-                phone=job_data.get('to_number'),
-                status=state.value,
-                retell_call_id=job_data.get('retell_call_id')
-            )
+        job_data = await async_redis_client.hgetall(f"call:{job_id}")
+        to_number = job_data['to_number']
+        from_number = job_data['from_number']
+        agent_id = job_data['agent_id']
 
-    def get_job(self, job_id: str) -> dict:
-        data = redis_client.hgetall(f"call:{job_id}")
-        return data if data else None
+        await call_timeline.amark(job_id, "picked_up")
+        keepalive = call_states.akeepalive(self.job_queue, entry_id, job_id, owner)
 
-    def get_active_count(self) -> int:
-        with self.lock:
-            return self.active_count
+        if not await adaptive_pacer.aacquire(pacing_key(agent_id, from_number, variables), job_id, keepalive):
+            return False
+        if not await live_calls.aacquire(agent_id, from_number, job_id, keepalive):
+            return False
 
-    def get_queue_size(self) -> int:
-        return self.call_queue.qsize()
+        # CALLING (solo si el claim sigue siendo de este worker)
+        if await self._update_state(job_id, CallState.CALLING, owner=owner) is None:
+            logger.warning(f"⏭️ Job {job_id[:8]}... lost its claim while waiting, skipping")
+            return False
+        await async_redis_client.hset(f"call:{job_id}", "started_at", datetime.utcnow().isoformat())
+
+        from retell import register_call_with_retell, originate_in_asterisk
+
+        await call_pacer.aacquire(from_number)
+
+        # Registrar en Retell (pool async compartido)
+        retell_call_id = await register_call_with_retell(
+            to_number, from_number, agent_id, variables
+        )
+
+        await async_redis_client.hset(f"call:{job_id}", "retell_call_id", retell_call_id)
+        await call_timeline.alink(retell_call_id, job_id)
+        await call_timeline.amark(job_id, "registered")
+        await asyncio.to_thread(update_supabase_status, job_id, to_number, 'calling', retell_call_id)
+        logger.info(f"📋 Job {job_id[:8]}... → Retell {retell_call_id}")
+
+        # ORIGINAR - el pool AMI es bloqueante, se ejecuta fuera del loop
+        result = await asyncio.to_thread(originate_in_asterisk, to_number, from_number, retell_call_id)
+        logger.info(f"📊 Originate result for job {job_id[:8]}: {result}")
+
+        if result.get('success'):
+            await call_timeline.amark(job_id, "originated")
+            logger.info(f"✅ Job {job_id[:8]}... → ORIGINATED (waiting for AMD/webhook)")
+        else:
+            await self._update_state(job_id, CallState.FAILED, owner=owner,
+                                     error=result.get('hangup_cause', 'Originate failed'))
+            logger.info(f"❌ Job {job_id[:8]}... → FAILED")
+        return True
+
+    async def _update_state(self, job_id: str, state: CallState, owner: Optional[str] = None,
+                            **kwargs) -> Optional[dict]:
+        job_data, changed = _on_state_set(
+            state, await call_states.aset(job_id, state.value, _state_fields(state, **kwargs), owner))
+        if not changed:
+            return job_data
+        if state == CallState.FAILED and job_data.get('pace_key'):
+            await adaptive_pacer.arelease(job_data['pace_key'], job_id)
+        if state == CallState.FAILED and job_data.get('live_slots'):
+            await live_calls.arelease(job_id)
+        if job_data.get('campaign_id') and state in _CAMPAIGN_STATUS:
+            await campaigns.atransition(job_id, _CAMPAIGN_STATUS[state])
+        if job_data:
+            await asyncio.to_thread(_push_status, job_id, state, job_data)
+        return job_data
 
 
 # Instancia global
-queue_manager = CallQueueManager(max_concurrent=20)
\ No newline at end of file
+if QUEUE_DISPATCH_MODE == "asyncio":
+    queue_manager = AsyncCallDispatcher(max_concurrent=QUEUE_MAX_CONCURRENT)
+else:
+    queue_manager = CallQueueManager(max_concurrent=QUEUE_MAX_CONCURRENT)
+
+
+def _requeue_scheduled(item: dict) -> Optional[str]:
+    """Reencola un callback/reintento y crea su fila en outbound_call_queue"""
+    # Pudo pasar a DNC/inactivo mientras esperaba; el cooldown no aplica a reintentos
+    reason = suppression.check(item["to_number"], cooldown=False)
+    if reason:
+        logger.info(f"🚫 Scheduled {item.get('reason')} for {item['to_number']} dropped: {reason}")
+        return None
+    variables = item.get("variables") or {}
+    job_id = queue_manager.submit_call(
+        item["to_number"], item["from_number"], item["agent_id"], variables,
+        attempt=int(item.get("attempt") or 1),
+        # El cliente pidió esa hora: el callback pasa delante de los lotes
+        priority="high" if item.get("reason") == "callback" else None,
+        campaign_id=item.get("campaign_id"),
+    )
+    # Fila nueva por intento: la anterior conserva su resultado (no_answer, callback...)
+    try:
+        supabase.table("outbound_call_queue").insert({
+            "phone": item["to_number"],
+            "user_name": variables.get("user_name") or "Cliente",
+            "locale": variables.get("locale") or "es",
+            "from_number": item["from_number"],
+            "job_id": job_id,
+            "status": "queued",
+            "retell_call_id": None,
+            "active": True,
+        }).execute()
+    except Exception as e:
+        logger.error(f"❌ Supabase error (requeue {item['to_number']}): {e}")
+    return job_id
+
+
+# Callbacks y reintentos diferidos (ZSET en Redis), rellenan la capacidad ociosa
+call_scheduler = CallScheduler(redis_client, submit=_requeue_scheduled, backlog=queue_manager.get_queue_size)
@@ -1,15 +1,29 @@
-from fastapi import APIRouter, HTTPException, Header, Depends, BackgroundTasks
-from fastapi.responses import PlainTextResponse
+from fastapi import APIRouter, HTTPException, Header, Depends, BackgroundTasks, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import httpx
 import os
+import io
+import uuid
 import random
 import asyncio
+import tempfile
 from typing import Optional, Dict, List
-from queue_manager import queue_manager, CallState
+from queue_manager import (queue_manager, CallState, redis_client, async_redis_client, call_pacer,
+                           status_writer, get_state_counts, call_timeline, adaptive_pacer,
+                           call_scheduler, live_calls, campaigns, suppression,
+                           arecord_call_state, amd_call_state)
 from datetime import datetime
 import logging
 from supabase import create_client, Client
+from ami_pool import AMIConnectionPool
+from channel_index import ChannelIndex
+from retell_client import retell_client
+from spoken_phone import build_spoken_vars_batch
+from phone_normalizer import normalize_phone, normalize_many
+from contact_importer import ContactImporter, detect_format
+from live_status import LiveStatusHub
+from metrics import AMD_RESULTS, amd_cause_label, amd_result_label
+from idempotency import IdempotencyStore, RequestProgress, fingerprint, NEW, REPLAY, IN_PROGRESS
 
 router = APIRouter(prefix="/api/retell", tags=["Retell AI"])
 logger = logging.getLogger(__name__)
@@ -22,6 +36,7 @@ AMI_HOST = os.getenv("AMI_HOST", "31.97.210.100")
 AMI_PORT = int(os.getenv("AMI_PORT", 5038))
 AMI_USER = os.getenv("AMI_USER", "omnileads")
 AMI_PASS = os.getenv("AMI_PASS")
+AMI_POOL_SIZE = int(os.getenv("AMI_POOL_SIZE", 4))
 
 DEFAULT_FROM_NUMBER = "+18887719555"
 
@@ -30,6 +45,27 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 
+# Pool AMI compartido (originate, transferencias, clasificador)
+ami_pool = AMIConnectionPool(AMI_HOST, AMI_PORT, AMI_USER, AMI_PASS, size=AMI_POOL_SIZE)
+# Índice call_id → canal alimentado por eventos AMI (Newchannel/VarSet/Hangup)
+channel_index = ChannelIndex(AMI_HOST, AMI_PORT, AMI_USER, AMI_PASS, redis_client=redis_client)
+
+def _live_node_stats() -> dict:
+    # Lectura directa: no toma el lock de get_active_count en cada tick
+    return {"active_calls": queue_manager.active_count, "max_concurrent": queue_manager.max_concurrent}
+
+
+def _live_cluster_stats() -> dict:
+    return {"queue_size": queue_manager.get_queue_size(), "states": get_state_counts()}
+
+
+# Estado en vivo para los dashboards (SSE alimentado por Redis pub/sub)
+live_status = LiveStatusHub(async_redis_client, _live_node_stats, _live_cluster_stats,
+                            pending_transfers=lambda: _fetch_pending_transfers())
+
+# Idempotency-Key de batch-call / make-call (respuestas originales en Redis)
+idempotency = IdempotencyStore(async_redis_client)
+
 # Diccionario en memoria para transferencias
 pending_transfers = {}
 # Variable global para tracking de transferencias
@@ -44,6 +80,10 @@ class MakeCallRequest(BaseModel):
     from_number: Optional[str] = None
     agent_id: Optional[str] = None
     retell_llm_dynamic_variables: Optional[dict] = None
+    # Clase de prioridad en la cola (JOB_PRIORITIES; solo backend "fair")
+    priority: Optional[str] = None
+    # Clave de idempotencia del elemento: un reenvío devuelve el mismo job_id
+    idempotency_key: Optional[str] = None
 
 
 # ==========================================================
@@ -110,6 +150,23 @@ async def _handle_amd_result(call_id: str, result: str, cause: str):
     }
 
     db_status = status_map.get(result.upper(), 'failed')
+    AMD_RESULTS.labels(amd_result_label(result), amd_cause_label(cause)).inc()
+    job_id = await call_timeline.ajob_for_call(call_id)
+    if job_id:
+        await call_timeline.amark(job_id, "amd")
+        await arecord_call_state(job_id, amd_call_state(result), amd_result=result.upper())
+        await adaptive_pacer.on_amd(job_id, result)
+        await campaigns.atransition(job_id, db_status)
+        # HUMAN: el cupo vivo cubre la conversación; cualquier otro resultado es terminal
+        if result.upper() == 'HUMAN':
+            await live_calls.aextend(job_id)
+        else:
+            await live_calls.arelease(job_id)
+        # NO_ANSWER/BUSY: reintento con backoff (call_scheduler)
+        try:
+            await asyncio.to_thread(call_scheduler.retry_job, job_id, result)
+        except Exception as e:
+            logger.error(f"❌ Error scheduling retry: {e}")
 
     # Estados que marcan la llamada como inactiva
     inactive_statuses = ['voicemail', 'no_answer', 'busy', 'failed']
@@ -125,10 +182,7 @@ async def _handle_amd_result(call_id: str, result: str, cause: str):
         if is_inactive:
             update_data['active'] = False
 
-        supabase.table('outbound_call_queue') \
-            .update(update_data) \
-            .eq('retell_call_id', call_id) \
-            .execute()
+        status_writer.update_by_call(call_id, update_data)
 
         logger.info(f"✅ Queue → {db_status.upper()}: {call_id}")
         return PlainTextResponse(f"{db_status.upper()}:{call_id}")
@@ -144,8 +198,6 @@ async def _handle_amd_result(call_id: str, result: str, cause: str):
 def register_call_with_retell_sync(to_number: str, from_number: str,
                                    agent_id: str, vars: dict) -> str:
     """Versión SÍNCRONA de register_call_with_retell"""
-    import httpx
-
     payload = {
         "agent_id": agent_id,
         "from_number": from_number,
@@ -154,15 +206,7 @@ def register_call_with_retell_sync(to_number: str, from_number: str,
         "retell_llm_dynamic_variables": vars
     }
 
-    with httpx.Client() as client:
-        r = client.post(
-            "https://api.retellai.com/v2/register-phone-call",
-            headers={"Authorization": f"Bearer {RETELL_API_KEY}"},
-            json=payload,
-            timeout=30
-        )
-        r.raise_for_status()
-        return r.json().get("call_id")
+    return retell_client.register_phone_call(payload)
 
 
 # ==========================================================
@@ -178,15 +222,7 @@ async def register_call_with_retell(to_number: str, from_number: str,
         "direction": "outbound",
         "retell_llm_dynamic_variables": vars
     }
-    async with httpx.AsyncClient() as client:
-        r = await client.post(
-            "https://api.retellai.com/v2/register-phone-call",
-            headers={"Authorization": f"Bearer {RETELL_API_KEY}"},
-            json=payload,
-            timeout=30
-        )
-        r.raise_for_status()
-        return r.json().get("call_id")
+    return await retell_client.aregister_phone_call(payload)
 
 
 # ==========================================================
@@ -197,31 +233,21 @@ def originate_in_asterisk(to_number: str, from_number: str, retell_call_id: str)
     Origina llamada en Asterisk de forma simple.
     El dialplan se encarga de AMD y notifica via HTTP.
     """
-    import asterisk.manager
-
     clean_num = to_number.lstrip("+")
 
     try:
-        manager = asterisk.manager.Manager()
-        manager.connect(AMI_HOST, AMI_PORT)
-        manager.login(AMI_USER, AMI_PASS)
-
         logger.info(f"📡 Originating: {to_number} ({retell_call_id})")
 
-        # Usar send_action para control total
-        response = manager.send_action({
-            'Action': 'Originate',
-            'Channel': f'Local/{clean_num}@retell-originate',
-            'Context': 'retell-bridge',
-            'Exten': 's',
-            'Priority': '1',
-            'Timeout': '45000',
-            'CallerID': f'"{from_number}" <{from_number}>',
-            'Variable': f'TO_NUMBER={to_number},FROM_NUMBER={from_number},RETELL_CALL_ID={retell_call_id}',
-            'Async': 'true'
-        })
-
-        manager.logoff()
+        response = ami_pool.originate(
+            Channel=f'Local/{clean_num}@retell-originate',
+            Context='retell-bridge',
+            Exten='s',
+            Priority='1',
+            Timeout='45000',
+            CallerID=f'"{from_number}" <{from_number}>',
+            Variable=f'TO_NUMBER={to_number},FROM_NUMBER={from_number},RETELL_CALL_ID={retell_call_id}',
+            Async='true'
+        )
 
         logger.info(f"✅ Originate sent: {retell_call_id} - Response: {response}")
 
@@ -240,20 +266,44 @@ def originate_in_asterisk(to_number: str, from_number: str, retell_call_id: str)
         }
 
 
+def _resolve_retell_channel(retell_call_id: str) -> Optional[str]:
+    """
+    Resuelve el canal de Retell desde el índice de eventos (sin AMI).
+    Recorre los canales si la suscripción está caída o resincronizando
+    (el índice puede tener canales ya colgados) o si el call_id no está.
+    """
+    if channel_index.is_live():
+        channel = channel_index.lookup(retell_call_id)
+        if channel:
+            return channel
+        logger.warning(f"⚠️ {retell_call_id} not in channel index, scanning channels via AMI")
+    else:
+        logger.warning("⚠️ Channel index offline, scanning channels via AMI")
+    return _find_retell_channel(retell_call_id)
+
+
+def _find_retell_channel(retell_call_id: str) -> Optional[str]:
+    """Busca el canal PJSIP/SIP cuya variable RETELL_CALL_ID coincide"""
+    response = ami_pool.command('core show channels')
+
+    # Formato típico: "PJSIP/didww_out_aux-0000009e"
+    for line in response.data.split('\n'):
+        if 'PJSIP/' in line or 'SIP/' in line:
+            parts = line.strip().split()
+            if not parts:
+                continue
+            channel = parts[0]
+            try:
+                if ami_pool.getvar(channel, 'RETELL_CALL_ID') == retell_call_id:
+                    logger.info(f"✅ Canal encontrado: {channel}")
+                    return channel
+            except Exception:
+                continue
+    return None
+
+
 def normalize_inbound_number(num: str, default_cc: Optional[str] = "+506") -> str:
-    if not num:
-        return ""
-    num = num.strip()
-    if num.startswith("+"):
-        return num
-    digits = "".join(ch for ch in num if ch.isdigit())
-    if not digits:
-        return ""
-    if digits.startswith("506") and len(digits) == 11:
-        return "+" + digits
-    if len(digits) == 8 and default_cc:
-        return default_cc + digits
-    return "+" + digits
+    return normalize_phone(num, default_cc) or ""
 
 
 # ==========================================================
@@ -315,44 +365,14 @@ async def prepare_transfer(
     Prepara una transferencia buscando el canal de Asterisk donde está Retell.
 
     Flujo:
-    1. Conectar a AMI
-    2. Buscar canal que tiene la variable RETELL_CALL_ID
+    1. Resolver el canal desde el índice de eventos AMI
+    2. (Fallback) Buscar canal que tiene la variable RETELL_CALL_ID
     3. Guardar info en memoria para execute-transfer
     """
     try:
-        manager = asterisk.manager.Manager()
-        manager.connect(AMI_HOST, AMI_PORT)
-        manager.login(AMI_USER, AMI_PASS)
-
         logger.info(f"🔍 Buscando canal para Retell call: {retell_call_id}")
 
-        # Obtener todos los canales activos
-        response = manager.command('core show channels')
-        channels_output = response.data
-
-        # Buscar canal con el retell_call_id
-        retell_channel = None
-
-        # Lista de canales (parsear output de AMI)
-        # Formato típico: "PJSIP/didww_out_aux-0000009e"
-        for line in channels_output.split('\n'):
-            if 'PJSIP/' in line or 'SIP/' in line:
-                # Extraer nombre del canal
-                parts = line.strip().split()
-                if parts:
-                    channel = parts[0]
-
-                    # Verificar si este canal tiene la variable RETELL_CALL_ID
-                    try:
-                        var_response = manager.getvar(channel, 'RETELL_CALL_ID')
-                        if var_response and var_response.data == retell_call_id:
-                            retell_channel = channel
-                            logger.info(f"✅ Canal encontrado: {channel}")
-                            break
-                    except:
-                        continue
-
-        manager.logoff()
+        retell_channel = _resolve_retell_channel(retell_call_id)
 
         if not retell_channel:
             logger.warning(f"⚠️ No se encontró canal para {retell_call_id}")
@@ -414,52 +434,33 @@ async def execute_transfer(
     phone = transfer_info.get('phone')
 
     try:
-        manager = asterisk.manager.Manager()
-        manager.connect(AMI_HOST, AMI_PORT)
-        manager.login(AMI_USER, AMI_PASS)
-
         logger.info(f"📞 Ejecutando transfer: Agente {agent_extension} ← {phone}")
 
         # Si no encontramos el canal antes, intentar de nuevo
         if not retell_channel:
             logger.info(f"🔍 Reintentando búsqueda de canal para {retell_call_id}")
-            response = manager.command('core show channels')
-            channels_output = response.data
-
-            for line in channels_output.split('\n'):
-                if 'PJSIP/' in line or 'SIP/' in line:
-                    parts = line.strip().split()
-                    if parts:
-                        channel = parts[0]
-                        try:
-                            var_response = manager.getvar(channel, 'RETELL_CALL_ID')
-                            if var_response and var_response.data == retell_call_id:
-                                retell_channel = channel
-                                transfer_info['retell_channel'] = channel
-                                logger.info(f"✅ Canal encontrado en retry: {channel}")
-                                break
-                        except:
-                            continue
+            retell_channel = _resolve_retell_channel(retell_call_id)
+            if retell_channel:
+                transfer_info['retell_channel'] = retell_channel
+                logger.info(f"✅ Canal encontrado en retry: {retell_channel}")
 
         if not retell_channel:
-            manager.logoff()
             raise HTTPException(404, f"Retell channel not found for call {retell_call_id}")
 
         # Originate llamada al agente con bridge automático
         logger.info(f"📞 Calling agent {agent_extension}...")
 
         # Usamos Originate con Bridge directo
-        response = manager.send_action({
-            'Action': 'Originate',
-            'Channel': f'PJSIP/{agent_extension}',
-            'Exten': retell_channel,  # ← Bridge directo al canal de Retell
-            'Context': 'bridge-direct',  # Contexto que hace Bridge
-            'Priority': '1',
-            'Timeout': '30000',
-            'CallerID': f'Transfer <{phone}>',
-            'Variable': f'TRANSFER_ID={transfer_id},RETELL_CALL_ID={retell_call_id},TARGET_CHANNEL={retell_channel}',
-            'Async': 'true'
-        })
+        response = ami_pool.originate(
+            Channel=f'PJSIP/{agent_extension}',
+            Exten=retell_channel,  # ← Bridge directo al canal de Retell
+            Context='bridge-direct',  # Contexto que hace Bridge
+            Priority='1',
+            Timeout='30000',
+            CallerID=f'Transfer <{phone}>',
+            Variable=f'TRANSFER_ID={transfer_id},RETELL_CALL_ID={retell_call_id},TARGET_CHANNEL={retell_channel}',
+            Async='true'
+        )
 
         logger.info(f"✅ Originate sent: {response}")
 
@@ -467,8 +468,6 @@ async def execute_transfer(
         transfer_info['status'] = 'bridging'
         transfer_info['agent_extension'] = agent_extension
 
-        manager.logoff()
-
         # Nota: El bridge se completará cuando el agente conteste
         # El dialplan en 'bridge-direct' hará el Bridge() automático
 
@@ -512,6 +511,7 @@ async def complete_transfer(
             .execute()
 
         logger.info(f"✅ Transfer {transfer_id} marked as {'completed' if success else 'failed'}")
+        await live_status.request_refresh()
 
         return {'status': 'ok', 'transfer_id': transfer_id}
     except Exception as e:
@@ -523,51 +523,248 @@ async def complete_transfer(
 #     📊 ENDPOINT: LISTAR TRANSFERENCIAS PENDIENTES
 # ==========================================================
 
+def _fetch_pending_transfers() -> List[dict]:
+    result = supabase.table('call_transfers') \
+        .select('*') \
+        .eq('status', 'pending') \
+        .order('created_at', desc=True) \
+        .execute()
+    return result.data or []
+
+
 @router.get("/pending-transfers")
 async def get_pending_transfers(token: str = Depends(verify_token)):
     """
     Obtiene todas las transferencias pendientes para mostrar en el dashboard
     """
     try:
-        result = supabase.table('call_transfers') \
-            .select('*') \
-            .eq('status', 'pending') \
-            .order('created_at', desc=True) \
-            .execute()
-
+        transfers = await asyncio.to_thread(_fetch_pending_transfers)
         return {
-            'transfers': result.data or [],
-            'count': len(result.data) if result.data else 0
+            'transfers': transfers,
+            'count': len(transfers)
         }
     except Exception as e:
         logger.error(f"❌ Error getting pending transfers: {e}")
         raise HTTPException(500, str(e))
 
+async def _idempotent(scope: str, key: Optional[str], payload, handler):
+    """
+    Ejecuta handler(progress) una sola vez por Idempotency-Key; los reintentos
+    reciben la respuesta original. progress registra lo ya encolado: si el
+    handler falla a mitad de camino, el reintento lo reutiliza.
+    """
+    if not key:
+        return await handler(None)
+    fp = fingerprint(payload)
+    state, response = await idempotency.begin(scope, key, fp)
+    if state == REPLAY:
+        logger.info(f"♻️ Idempotent replay of {scope} {key}")
+        return {**response, "replayed": True}
+    if state == IN_PROGRESS:
+        raise HTTPException(409, "A request with this Idempotency-Key is still in progress")
+    if state != NEW:
+        raise HTTPException(422, "Idempotency-Key already used with a different payload")
+    progress = idempotency.progress(scope, key)
+    renewer = asyncio.create_task(idempotency.keep_pending(scope, key))
+    try:
+        response = await handler(progress)
+    except BaseException:
+        renewer.cancel()
+        await idempotency.abort(scope, key, fp, progress)
+        raise
+    renewer.cancel()
+    await idempotency.complete(scope, key, fp, response)
+    return response
+
+
 @router.post("/batch-call")
-async def batch_call(calls: List[MakeCallRequest], token: str = Depends(verify_token)):
-    """Envía múltiples llamadas a la cola"""
+async def batch_call(calls: List[MakeCallRequest], campaign_id: Optional[str] = None,
+                     campaign_name: Optional[str] = None, allow_recent: bool = False,
+                     idempotency_key: Optional[str] = Header(None),
+                     token: str = Depends(verify_token)):
+    """
+    Envía múltiples llamadas a la cola como una campaña.
+    Sin ?campaign_id= se usa el campaign_id común de las variables o uno nuevo.
+
+    Los números inválidos (motivo de phone_normalizer), en DNC, inactivos o
+    marcados dentro del cooldown no se encolan: su job_id queda en None
+    (job_ids sigue alineado con `calls`) y se listan en `skipped`.
+    ?allow_recent=true ignora solo el cooldown.
+
+    Con el header Idempotency-Key un reintento devuelve la respuesta original.
+    Un número repetido en el lote se encola una vez (mismo job_id, listado en
+    `duplicates`) y un elemento con idempotency_key ya visto reutiliza su job_id.
+    """
     if len(calls) > 100:
         raise HTTPException(400, "Max 100 calls per batch")
 
+    payload = {
+        "calls": [req.model_dump() for req in calls],
+        "campaign_id": campaign_id,
+        "campaign_name": campaign_name,
+        "allow_recent": allow_recent,
+    }
+    return await _idempotent(
+        "batch", idempotency_key, payload,
+        lambda progress: _submit_batch(calls, campaign_id, campaign_name, allow_recent, progress),
+    )
+
+
+async def _submit_batch(calls: List[MakeCallRequest], campaign_id: Optional[str],
+                        campaign_name: Optional[str], allow_recent: bool,
+                        progress: Optional[RequestProgress] = None) -> dict:
+    if not campaign_id:
+        shared = {(req.retell_llm_dynamic_variables or {}).get("campaign_id") for req in calls}
+        campaign_id = shared.pop() if len(shared) == 1 else None
+    # Reintento de un pedido que falló a mitad: misma campaña y mismos job_ids
+    submitted = {}
+    if progress is not None:
+        campaign_id = await progress.campaign(campaign_id or uuid.uuid4().hex)
+        submitted = await progress.load()
+    campaign_id = campaigns.create(
+        campaign_id, campaign_name,
+        agent_id=(calls[0].agent_id or RETELL_AGENT_ID_DEFAULT) if calls else None,
+    )
+
+    normalized = normalize_many(req.to_number for req in calls)
+    # Pronunciación del teléfono para los números válidos (un cálculo por número distinto)
+    spoken = iter(build_spoken_vars_batch(to_n for to_n, _ in normalized if to_n))
+
     job_ids = []
-    for req in calls:
-        to_n = req.to_number if req.to_number.startswith("+") else f"+{req.to_number}"
+    skipped = []
+    duplicates = []
+    reused = []
+    first_index = {}
+    for index, (req, (to_n, invalid)) in enumerate(zip(calls, normalized)):
+        if invalid:
+            job_ids.append(None)
+            skipped.append({"index": index, "to_number": req.to_number, "reason": invalid})
+            continue
+        spoken_vars = next(spoken)
+
+        # Número repetido en el lote: comparte el job_id de la primera aparición
+        if to_n in first_index:
+            job_ids.append(job_ids[first_index[to_n]])
+            duplicates.append({"index": index, "to_number": to_n, "same_as": first_index[to_n]})
+            continue
+        first_index[to_n] = index
+
+        if index in submitted:
+            job_ids.append(submitted[index])
+            reused.append({"index": index, "to_number": to_n, "job_id": submitted[index]})
+            continue
+
+        item_key = req.idempotency_key
+        if item_key:
+            existing = await idempotency.item_job(item_key)
+            if existing:
+                job_ids.append(existing)
+                reused.append({"index": index, "to_number": to_n, "job_id": existing})
+                continue
+
+        reason = suppression.check(to_n, cooldown=not allow_recent)
+        if reason:
+            job_ids.append(None)
+            skipped.append({"index": index, "to_number": to_n, "reason": reason})
+            continue
+
+        job_id = None
+        if item_key:
+            job_id = str(uuid.uuid4())
+            existing = await idempotency.claim_item(item_key, job_id)
+            if existing:
+                # Otro pedido concurrente lo encoló primero
+                job_ids.append(existing)
+                reused.append({"index": index, "to_number": to_n, "job_id": existing})
+                continue
+
         from_n = req.from_number or DEFAULT_FROM_NUMBER
         agent = req.agent_id or RETELL_AGENT_ID_DEFAULT
         vars = normalize_vars(req.retell_llm_dynamic_variables or {})
-
-        job_id = queue_manager.submit_call(to_n, from_n, agent, vars)
+        for key, value in spoken_vars.items():
+            if value:
+                vars.setdefault(key, value)
+        # La sub-cola justa y la ventana de pacing se separan por variables["campaign_id"]
+        vars.setdefault("campaign_id", campaign_id)
+
+        try:
+            job_id = queue_manager.submit_call(to_n, from_n, agent, vars, priority=req.priority,
+                                               campaign_id=campaign_id, job_id=job_id)
+        except Exception:
+            if item_key:
+                await idempotency.release_item(item_key)
+            raise
+        if progress is not None:
+            await progress.record(index, job_id)
+        suppression.mark_dialed(to_n)
         job_ids.append(job_id)
 
+    if skipped:
+        logger.info(f"🚫 Batch skipped {len(skipped)}/{len(calls)} invalid or suppressed numbers")
+    if duplicates or reused:
+        logger.info(f"♻️ Batch collapsed {len(duplicates)} repeated numbers, reused {len(reused)} jobs")
+
     return {
         "success": True,
+        "campaign_id": campaign_id,
         "job_ids": job_ids,
-        "queued": len(job_ids),
+        "queued": len(calls) - len(skipped) - len(duplicates) - len(reused),
+        "skipped": skipped,
+        "duplicates": duplicates,
+        "reused": reused,
         "active_calls": queue_manager.get_active_count(),
         "queue_size": queue_manager.get_queue_size()
     }
 
 
+# Cuerpo del upload en memoria hasta este tamaño; más grande va a disco
+IMPORT_SPOOL_BYTES = 8 * 1024 * 1024
+IMPORT_MAX_REJECTS = 1000
+
+
+@router.post("/contacts/import")
+async def import_contacts(
+    request: Request,
+    format: Optional[str] = None,
+    default_cc: Optional[str] = "+506",
+    update: bool = False,
+    token: str = Depends(verify_token),
+):
+    """
+    Importa un CSV o NDJSON (cuerpo crudo) a outbound_call_contacts.
+    Devuelve el resumen y las primeras IMPORT_MAX_REJECTS filas rechazadas.
+    """
+    fmt = format or detect_format(None, request.headers.get("content-type"))
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(400, "format must be csv or ndjson")
+
+    # El cuerpo se recibe por streaming y se vuelca a un archivo temporal
+    spool = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+
+    rejects = []
+
+    def on_reject(line: int, value: str, reason: str):
+        if len(rejects) < IMPORT_MAX_REJECTS:
+            rejects.append({"row": line, "value": value, "reason": reason})
+
+    def run():
+        with io.TextIOWrapper(spool, encoding="utf-8-sig", newline="") as fh:
+            importer = ContactImporter(supabase, default_cc=default_cc or None, update_existing=update)
+            return importer.run(fh, fmt, on_reject)
+
+    try:
+        report = await asyncio.to_thread(run)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    report["rejects"] = rejects
+    report["rejects_truncated"] = report["rejected"] > len(rejects)
+    return report
+
+
 @router.get("/call-status/{job_id}")
 async def get_call_status(job_id: str, token: str = Depends(verify_token)):
     """Obtiene estado de una llamada específica"""
@@ -577,26 +774,127 @@ async def get_call_status(job_id: str, token: str = Depends(verify_token)):
     return job
 
 
+@router.get("/call-timeline/{job_id}")
+async def get_call_timeline(job_id: str, token: str = Depends(verify_token)):
+    """Etapas de una llamada con su desfase desde submit_call"""
+    timeline = await asyncio.to_thread(call_timeline.timeline, job_id)
+    if not timeline:
+        raise HTTPException(404, "Job not found")
+    return timeline
+
+
+@router.get("/latency")
+async def get_latency(window: int = 900, token: str = Depends(verify_token)):
+    """p50/p95/p99 de cada intervalo entre etapas en los últimos `window` segundos"""
+    window = max(10, min(window, 7200))
+    return {
+        "window_s": window,
+        "gaps": await asyncio.to_thread(call_timeline.percentiles, window),
+    }
+
+
+@router.get("/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str, token: str = Depends(verify_token)):
+    """Progreso de una campaña: trabajos por estado, leído de contadores en Redis"""
+    campaign = await asyncio.to_thread(campaigns.get, campaign_id)
+    if not campaign:
+        raise HTTPException(404, "Campaign not found")
+    return campaign
+
+
+@router.get("/scheduled")
+async def list_scheduled(limit: int = 50, token: str = Depends(verify_token)):
+    """Callbacks y reintentos pendientes, del más próximo al más lejano"""
+    limit = max(1, min(limit, 500))
+    return {
+        "items": await asyncio.to_thread(call_scheduler.upcoming, limit),
+        "stats": await asyncio.to_thread(call_scheduler.stats),
+    }
+
+
+@router.delete("/scheduled/{sched_id}")
+async def cancel_scheduled(sched_id: str, token: str = Depends(verify_token)):
+    """Cancela un callback/reintento que todavía no se reencoló"""
+    if not await asyncio.to_thread(call_scheduler.cancel, sched_id):
+        raise HTTPException(404, "Scheduled call not found")
+    return {"success": True, "cancelled": sched_id}
+
+
+@router.delete("/scheduled")
+async def cancel_scheduled_phone(phone: str, token: str = Depends(verify_token)):
+    """Cancela el callback/reintento pendiente de un número"""
+    phone = normalize_phone(phone) or phone
+    if not await asyncio.to_thread(call_scheduler.cancel_phone, phone):
+        raise HTTPException(404, "No scheduled call for this phone")
+    return {"success": True, "phone": phone}
+
+
 @router.get("/queue-status")
 async def get_queue_status(token: str = Depends(verify_token)):
     """Estado general de la cola"""
     return {
         "active_calls": queue_manager.get_active_count(),
         "queue_size": queue_manager.get_queue_size(),
-        "max_concurrent": queue_manager.max_concurrent
+        "max_concurrent": queue_manager.max_concurrent,
+        "queue": queue_manager.job_queue.stats(),
+        "cps": call_pacer.levels(),
+        "live_calls": live_calls.stats(),
+        "pacing": adaptive_pacer.stats(),
+        "scheduled": call_scheduler.stats(),
+        "suppression": suppression.stats(),
+        "status_writer": status_writer.stats()
     }
 
 
+@router.get("/queue-events")
+async def queue_events(token: Optional[str] = None, authorization: Optional[str] = Header(None)):
+    """
+    Server-Sent Events con el estado de la cola: snapshot inicial y luego
+    'cluster', 'node', 'totals' y 'transfers' a medida que cambian.
+    EventSource no envía headers: se acepta ?token= además de Authorization.
+    """
+    verify_token(authorization or (f"Bearer {token}" if token else None))
+    return StreamingResponse(
+        live_status.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/ami-stats")
+async def get_ami_stats(token: str = Depends(verify_token)):
+    """Estado del pool AMI, latencia por acción e índice de canales"""
+    stats = ami_pool.stats()
+    stats["channel_index"] = channel_index.stats()
+    return stats
+
+
+@router.get("/client-stats")
+async def get_client_stats(token: str = Depends(verify_token)):
+    """Uso del pool HTTP hacia la API de Retell"""
+    return retell_client.stats()
+
+
 @router.post("/make-call")
-async def make_call(req: MakeCallRequest, token: str = Depends(verify_token)):
-    """Llamada individual"""
+async def make_call(req: MakeCallRequest, idempotency_key: Optional[str] = Header(None),
+                    token: str = Depends(verify_token)):
+    """Llamada individual (Idempotency-Key o idempotency_key: un reintento devuelve el mismo call_id)"""
+    return await _idempotent("make", idempotency_key or req.idempotency_key, req.model_dump(),
+                             lambda _progress: _make_call(req))
+
+
+async def _make_call(req: MakeCallRequest) -> dict:
     import threading
 
-    to_n = req.to_number if req.to_number.startswith("+") else f"+{req.to_number}"
+    (to_n, invalid), = normalize_many([req.to_number])
+    if invalid:
+        raise HTTPException(422, f"Invalid to_number: {invalid}")
     from_n = req.from_number or DEFAULT_FROM_NUMBER
     agent = req.agent_id or RETELL_AGENT_ID_DEFAULT
     vars = normalize_vars(req.retell_llm_dynamic_variables or {})
 
+    await call_pacer.aacquire(from_n)
+
     call_id = await register_call_with_retell(
         to_number=to_n,
         from_number=from_n,
@@ -649,15 +947,7 @@ async def handle_inbound_get(from_number: str, to_number: str, token: Optional[s
         },
     }
 
-    async with httpx.AsyncClient() as client:
-        r = await client.post(
-            "https://api.retellai.com/v2/register-phone-call",
-            headers={"Authorization": f"Bearer {RETELL_API_KEY}"},
-            json=payload,
-            timeout=30,
-        )
-        r.raise_for_status()
-        call_id = r.json().get("call_id")
+    call_id = await retell_client.aregister_phone_call(payload)
 
     return PlainTextResponse(call_id)
 
@@ -814,28 +1104,20 @@ def originate_classification_call(to_number: str):
     """
     Origina llamada de clasificación (sin Retell)
     """
-    import asterisk.manager
-    
     clean_num = to_number.lstrip("+")
     
     try:
-        manager = asterisk.manager.Manager()
-        manager.connect(AMI_HOST, AMI_PORT)
-        manager.login(AMI_USER, AMI_PASS)
-        
         logger.info(f"🕵️‍♂️ Classifying: {to_number}")
         
-        response = manager.send_action({
-            'Action': 'Originate',
-            'Channel': f'Local/{clean_num}@classifier-originate',
-            'Context': 'classifier-done',
-            'Exten': 's',
-            'Priority': '1',
-            'Timeout': '30000',
-            'Async': 'true'
-        })
+        response = ami_pool.originate(
+            Channel=f'Local/{clean_num}@classifier-originate',
+            Context='classifier-done',
+            Exten='s',
+            Priority='1',
+            Timeout='30000',
+            Async='true'
+        )
         
-        manager.logoff()
         return {'success': True}
         
     except Exception as e:
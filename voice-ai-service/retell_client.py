@@ -0,0 +1,184 @@
+# Cliente HTTP compartido para la API de Retell.
+# Un solo pool keep-alive (opcionalmente HTTP/2) con cara síncrona para
+# los workers y cara async para los endpoints FastAPI.
+
+import os
+import time
+import threading
+import logging
+from typing import Optional
+
+import httpx
+
+from metrics import RETELL_REGISTER_SECONDS, RETELL_REGISTER_ERRORS
+
+logger = logging.getLogger(__name__)
+
+RETELL_API_KEY = os.getenv("RETELL_API_KEY")
+RETELL_BASE_URL = os.getenv("RETELL_BASE_URL", "https://api.retellai.com")
+
+# Pool y timeouts por fase (segundos)
+RETELL_HTTP2 = os.getenv("RETELL_HTTP2", "false").lower() in ("1", "true", "yes")
+RETELL_MAX_CONNECTIONS = int(os.getenv("RETELL_MAX_CONNECTIONS", 50))
+RETELL_MAX_KEEPALIVE = int(os.getenv("RETELL_MAX_KEEPALIVE", 20))
+RETELL_KEEPALIVE_EXPIRY = float(os.getenv("RETELL_KEEPALIVE_EXPIRY", 60))
+RETELL_CONNECT_TIMEOUT = float(os.getenv("RETELL_CONNECT_TIMEOUT", 5))
+RETELL_READ_TIMEOUT = float(os.getenv("RETELL_READ_TIMEOUT", 30))
+RETELL_WRITE_TIMEOUT = float(os.getenv("RETELL_WRITE_TIMEOUT", 10))
+RETELL_POOL_TIMEOUT = float(os.getenv("RETELL_POOL_TIMEOUT", 5))
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class RetellClient:
+    """Cliente Retell con httpx.Client + httpx.AsyncClient sobre pools persistentes"""
+
+    def __init__(self, api_key: Optional[str] = RETELL_API_KEY,
+                 base_url: str = RETELL_BASE_URL, http2: bool = RETELL_HTTP2):
+        self.api_key = api_key
+        self.base_url = base_url
+
+        self.http2 = http2 and _http2_available()
+        if http2 and not self.http2:
+            logger.warning("⚠️ RETELL_HTTP2 requested but 'h2' is not installed, using HTTP/1.1")
+
+        self.limits = httpx.Limits(
+            max_connections=RETELL_MAX_CONNECTIONS,
+            max_keepalive_connections=RETELL_MAX_KEEPALIVE,
+            keepalive_expiry=RETELL_KEEPALIVE_EXPIRY,
+        )
+        self.timeout = httpx.Timeout(
+            connect=RETELL_CONNECT_TIMEOUT,
+            read=RETELL_READ_TIMEOUT,
+            write=RETELL_WRITE_TIMEOUT,
+            pool=RETELL_POOL_TIMEOUT,
+        )
+
+        self._sync: Optional[httpx.Client] = None
+        self._async: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+        # Métricas (en vuelo por pool: cada uno tiene su propio max_connections)
+        self._in_flight = {"sync": 0, "async": 0}
+        self._max_in_flight = {"sync": 0, "async": 0}
+        self._requests = 0
+        self._errors = 0
+        self._total_ms = 0.0
+        self._max_ms = 0.0
+
+    # ---------- ciclo de vida ----------
+    def _client_kwargs(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "headers": {"Authorization": f"Bearer {self.api_key}"},
+            "limits": self.limits,
+            "timeout": self.timeout,
+            "http2": self.http2,
+        }
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        if self._sync is None:
+            with self._lock:
+                if self._sync is None:
+                    self._sync = httpx.Client(**self._client_kwargs())
+        return self._sync
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async is None:
+            self._async = httpx.AsyncClient(**self._client_kwargs())
+        return self._async
+
+    def start(self):
+        """Abre ambos pools al arrancar la app (evita el costo en la primera llamada)"""
+        self.sync_client
+        self.async_client
+        logger.info(f"✅ Retell client ready (http2={self.http2}, max_connections={self.limits.max_connections})")
+
+    async def aclose(self):
+        if self._async is not None:
+            await self._async.aclose()
+            self._async = None
+        with self._lock:
+            if self._sync is not None:
+                self._sync.close()
+                self._sync = None
+
+    # ---------- métricas ----------
+    def _begin(self, pool: str) -> float:
+        with self._lock:
+            self._in_flight[pool] += 1
+            if self._in_flight[pool] > self._max_in_flight[pool]:
+                self._max_in_flight[pool] = self._in_flight[pool]
+        return time.perf_counter()
+
+    def _end(self, pool: str, start: float, ok: bool):
+        elapsed = time.perf_counter() - start
+        RETELL_REGISTER_SECONDS.observe(elapsed)
+        if not ok:
+            RETELL_REGISTER_ERRORS.inc()
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            self._in_flight[pool] -= 1
+            self._requests += 1
+            if not ok:
+                self._errors += 1
+            self._total_ms += elapsed_ms
+            if elapsed_ms > self._max_ms:
+                self._max_ms = elapsed_ms
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "http2": self.http2,
+                "max_connections": self.limits.max_connections,
+                "in_flight": sum(self._in_flight.values()),
+                "pools": {
+                    pool: {
+                        "in_flight": in_flight,
+                        "max_in_flight": self._max_in_flight[pool],
+                        "utilization": round(in_flight / self.limits.max_connections, 3),
+                    }
+                    for pool, in_flight in self._in_flight.items()
+                },
+                "requests": self._requests,
+                "errors": self._errors,
+                "avg_ms": round(self._total_ms / self._requests, 2) if self._requests else 0.0,
+                "max_ms": round(self._max_ms, 2),
+            }
+
+    # ---------- API ----------
+    def register_phone_call(self, payload: dict) -> str:
+        """POST /v2/register-phone-call (síncrono, para hilos)"""
+        start = self._begin("sync")
+        ok = False
+        try:
+            r = self.sync_client.post("/v2/register-phone-call", json=payload)
+            r.raise_for_status()
+            ok = True
+            return r.json().get("call_id")
+        finally:
+            self._end("sync", start, ok)
+
+    async def aregister_phone_call(self, payload: dict) -> str:
+        """POST /v2/register-phone-call (async, para endpoints)"""
+        start = self._begin("async")
+        ok = False
+        try:
+            r = await self.async_client.post("/v2/register-phone-call", json=payload)
+            r.raise_for_status()
+            ok = True
+            return r.json().get("call_id")
+        finally:
+            self._end("async", start, ok)
+
+
+# Instancia global
+retell_client = RetellClient()
@@ -0,0 +1,117 @@
+# Variables para que el agente pronuncie un teléfono (caller_phone_spoken_es/en).
+# Tablas 0–99 precalculadas, un solo parse por número y caché LRU por E.164.
+
+import os
+import re
+import logging
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+import phonenumbers
+from phonenumbers import geocoder as pn_geocoder
+
+logger = logging.getLogger(__name__)
+
+SPOKEN_CACHE_SIZE = int(os.getenv("SPOKEN_CACHE_SIZE", 10000))
+
+_ES_DIGITS = ["cero","uno","dos","tres","cuatro","cinco","seis","siete","ocho","nueve"]
+_EN_DIGITS = ["zero","one","two","three","four","five","six","seven","eight","nine"]
+
+def _es_0_99(n:int)->str:
+    esp10 = {10:"diez",11:"once",12:"doce",13:"trece",14:"catorce",15:"quince"}
+    tens = {20:"veinte",30:"treinta",40:"cuarenta",50:"cincuenta",
+            60:"sesenta",70:"setenta",80:"ochenta",90:"noventa"}
+    if n < 10: return _ES_DIGITS[n]
+    if n in esp10: return esp10[n]
+    if 16 <= n <= 19: return "dieci" + _ES_DIGITS[n-10]
+    if n == 20: return "veinte"
+    if 21 <= n <= 29: return "veinti" + _ES_DIGITS[n-20]
+    d, r = (n//10)*10, n%10
+    return tens[d] if r == 0 else f"{tens[d]} y {_ES_DIGITS[r]}"
+
+def _en_0_99(n:int)->str:
+    teens = {10:"ten",11:"eleven",12:"twelve",13:"thirteen",14:"fourteen",
+             15:"fifteen",16:"sixteen",17:"seventeen",18:"eighteen",19:"nineteen"}
+    tens = {20:"twenty",30:"thirty",40:"forty",50:"fifty",
+            60:"sixty",70:"seventy",80:"eighty",90:"ninety"}
+    if n < 10: return _EN_DIGITS[n]
+    if n in teens: return teens[n]
+    if n in tens: return tens[n]
+    d, r = (n//10)*10, n%10
+    return f"{tens[d]} {_EN_DIGITS[r]}"
+
+# Grupo de 1 o 2 dígitos ("7", "07", "77") → palabras; se arma una vez
+_ES_GROUPS: Dict[str, str] = {str(d): _ES_DIGITS[d] for d in range(10)}
+_ES_GROUPS.update({f"{n:02d}": _es_0_99(n) for n in range(100)})
+_EN_GROUPS: Dict[str, str] = {str(d): _EN_DIGITS[d] for d in range(10)}
+_EN_GROUPS.update({f"{n:02d}": _en_0_99(n) for n in range(100)})
+
+_COUNTRY_ES = {
+    "CR": "Costa Rica", "PA":"Panamá", "MX":"México", "CA":"Canadá",
+    "US":"Estados Unidos", "GB":"Reino Unido", "ES":"España"
+}
+_COUNTRY_EN = {
+    "CR":"Costa Rica", "PA":"Panama", "MX":"Mexico", "CA":"Canada",
+    "US":"United States", "GB":"United Kingdom", "ES":"Spain"
+}
+
+# Números de muestra para cargar la metadata del geocoder al arrancar
+_WARMUP_NUMBERS = ["+50688887777", "+18887719555", "+525512345678", "+50761234567",
+                   "+442071234567", "+34911234567"]
+
+def _country_name(num: phonenumbers.PhoneNumber, lang: str) -> str:
+    name = pn_geocoder.country_name_for_number(num, lang) or ""
+    if name: return name
+    rc = phonenumbers.region_code_for_number(num) or ""
+    if lang.startswith("es"): return _COUNTRY_ES.get(rc, rc or "Internacional")
+    return _COUNTRY_EN.get(rc, rc or "International")
+
+def _chunk_pairs(s: str) -> List[str]:
+    return [s[i:i+2] for i in range(0, len(s), 2)]
+
+@lru_cache(maxsize=SPOKEN_CACHE_SIZE)
+def _spoken(e164: str) -> Tuple[str, str]:
+    try:
+        num = phonenumbers.parse(e164, None)
+    except Exception:
+        num = None
+
+    if num is not None and phonenumbers.is_valid_number(num):
+        nsn = phonenumbers.national_significant_number(num)
+    else:
+        nsn = re.sub(r"\D", "", e164)
+
+    if num is not None:
+        country_es = _country_name(num, "es")
+        country_en = _country_name(num, "en")
+    else:
+        country_es = "Internacional"
+        country_en = "International"
+
+    pairs = _chunk_pairs(nsn)
+    es = f"{country_es}, " + ", ".join(_ES_GROUPS[p] for p in pairs)
+    en = f"{country_en}, " + ", ".join(_EN_GROUPS[p] for p in pairs)
+    return es, en
+
+def build_spoken_vars(e164: str) -> dict:
+    """Devuelve variables para pronunciar el teléfono correctamente"""
+    if not e164:
+        return {"caller_phone_spoken_es": None, "caller_phone_spoken_en": None}
+    es, en = _spoken(e164)
+    return {"caller_phone_spoken_es": es, "caller_phone_spoken_en": en}
+
+def build_spoken_vars_batch(numbers: Iterable[str]) -> List[dict]:
+    """build_spoken_vars para un lote; cada número distinto se calcula una vez"""
+    numbers = list(numbers)
+    unique = {n: build_spoken_vars(n) for n in set(numbers)}
+    return [dict(unique[n]) for n in numbers]
+
+def warm_up_spoken_vars():
+    """Carga la metadata del geocoder (es/en) para que la primera llamada no pague el costo"""
+    for e164 in _WARMUP_NUMBERS:
+        build_spoken_vars(e164)
+    logger.info(f"✅ Spoken phone cache warmed ({len(_WARMUP_NUMBERS)} regions)")
+
+def spoken_cache_stats() -> dict:
+    info = _spoken.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
@@ -0,0 +1,255 @@
+# Escritura diferida (write-behind) de estados en outbound_call_queue.
+# Las transiciones se acumulan por llamada, se fusionan (solo queda el
+# último estado) y se envían en bloque con una sola RPC.
+#
+# Una fila que la base rechaza por sus datos (SQLSTATE 22xxx/23xxx, p. ej. un
+# status fuera de outbound_call_queue_status_check) aborta toda la RPC: el lote
+# se reintenta fila por fila y las rechazadas se descartan (dead-letter en el
+# log y en métricas) en lugar de volver al buffer para siempre.
+
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Tuple
+
+from metrics import SUPABASE_WRITE_SECONDS, SUPABASE_WRITE_ROWS, SUPABASE_WRITE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+STATUS_FLUSH_INTERVAL = float(os.getenv("STATUS_FLUSH_INTERVAL", 0.5))
+STATUS_FLUSH_SIZE = int(os.getenv("STATUS_FLUSH_SIZE", 200))
+STATUS_MAX_BUFFER = int(os.getenv("STATUS_MAX_BUFFER", 20000))
+BULK_RPC = "apply_outbound_queue_updates"
+# Clases SQLSTATE de errores propios de la fila: reintentarla no sirve
+POISON_SQLSTATE_CLASSES = ("22", "23")
+
+# (tipo, valor): ("job", job_id) o ("call", retell_call_id)
+BufferKey = Tuple[str, str]
+
+
+def _is_poison(error: Exception) -> bool:
+    """Error de la fila (datos/constraint), no de la conexión ni del servidor"""
+    code = str(getattr(error, "code", "") or "")
+    return code[:2] in POISON_SQLSTATE_CLASSES
+
+
+class _Pending:
+    __slots__ = ("match", "fields", "first_ts", "writes")
+
+    def __init__(self, match: dict, fields: dict):
+        self.match = match
+        self.fields = fields
+        self.first_ts = time.monotonic()
+        self.writes = 1
+
+    def merge(self, fields: dict):
+        # 'active' es monótono: una vez inactiva la fila no vuelve a activarse
+        if self.fields.get("active") is False:
+            fields = {k: v for k, v in fields.items() if k != "active"}
+        self.fields.update(fields)
+        self.writes += 1
+
+    def to_row(self) -> dict:
+        row = dict(self.fields)
+        row.update(self.match)
+        return row
+
+
+class SupabaseStatusWriter:
+    """
+    Buffer write-behind para outbound_call_queue.
+
+    - update_by_job(): transiciones del worker (filtro job_id + phone)
+    - update_by_call(): AMD y webhooks (filtro retell_call_id)
+
+    El orden se conserva: una entrada fusionada pasa al final del buffer y la
+    RPC aplica las filas secuencialmente en ese orden.
+    """
+
+    def __init__(self, supabase, flush_interval: float = STATUS_FLUSH_INTERVAL,
+                 flush_size: int = STATUS_FLUSH_SIZE, max_buffer: int = STATUS_MAX_BUFFER):
+        self.supabase = supabase
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_buffer = max_buffer
+
+        self._buffer: "OrderedDict[BufferKey, _Pending]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._rpc_available = True
+
+        # Métricas
+        self._enqueued = 0
+        self._coalesced = 0
+        self._flushes = 0
+        self._rows_written = 0
+        self._errors = 0
+        self._dead_lettered = 0
+        self._last_flush_ms = 0.0
+        self._last_lag_ms = 0.0
+
+        self._thread = threading.Thread(target=self._run, daemon=True, name="Status-Writer")
+        self._thread.start()
+
+    # ---------- productores ----------
+    def _enqueue(self, key: BufferKey, match: dict, fields: dict):
+        fields = dict(fields)
+        fields.setdefault("updated_at", datetime.utcnow().isoformat())
+
+        with self._lock:
+            self._enqueued += 1
+            pending = self._buffer.get(key)
+            if pending is not None:
+                pending.merge(fields)
+                self._buffer.move_to_end(key)
+                self._coalesced += 1
+            else:
+                self._buffer[key] = _Pending(match, fields)
+            size = len(self._buffer)
+
+        if size >= self.flush_size:
+            self._wakeup.set()
+        if size >= self.max_buffer:
+            # Backpressure: el productor espera a que el buffer se vacíe
+            self.flush()
+
+    def update_by_job(self, job_id: str, phone: str, fields: dict):
+        self._enqueue(("job", job_id), {"job_id": job_id, "phone": phone}, fields)
+
+    def update_by_call(self, retell_call_id: str, fields: dict):
+        self._enqueue(("call", retell_call_id), {"retell_call_id": retell_call_id}, fields)
+
+    # ---------- flush ----------
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Envía todo lo acumulado; devuelve filas enviadas"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._buffer:
+                    return 0
+                batch = self._buffer
+                self._buffer = OrderedDict()
+
+            now = time.monotonic()
+            self._last_lag_ms = max((now - p.first_ts) * 1000 for p in batch.values())
+
+            start = time.perf_counter()
+            try:
+                written, unwritten = self._write(batch)
+            except Exception as e:
+                self._errors += 1
+                SUPABASE_WRITE_ERRORS.labels("status_flush").inc()
+                logger.error(f"❌ Supabase bulk status error ({len(batch)} rows): {e}")
+                self._requeue(batch)
+                return 0
+            finally:
+                elapsed = time.perf_counter() - start
+                self._last_flush_ms = elapsed * 1000
+                SUPABASE_WRITE_SECONDS.labels("status_flush").observe(elapsed)
+
+            self._flushes += 1
+            self._rows_written += written
+            SUPABASE_WRITE_ROWS.labels("status_flush").inc(written)
+            if unwritten:
+                self._errors += 1
+                SUPABASE_WRITE_ERRORS.labels("status_flush").inc()
+                self._requeue(unwritten)
+            logger.info(f"✅ Supabase: {written} status rows flushed in {self._last_flush_ms:.0f}ms")
+            return written
+
+    def _write(self, batch: "OrderedDict[BufferKey, _Pending]") -> Tuple[int, "OrderedDict[BufferKey, _Pending]"]:
+        """(filas escritas, entradas a reintentar); un error transitorio de la RPC se propaga"""
+        if self._rpc_available:
+            try:
+                self.supabase.rpc(BULK_RPC, {"updates": [p.to_row() for p in batch.values()]}).execute()
+                return len(batch), OrderedDict()
+            except Exception as e:
+                # PGRST202: la función aún no existe (migración pendiente)
+                if "PGRST202" in str(e):
+                    logger.warning(f"⚠️ RPC {BULK_RPC} not found, falling back to per-row updates")
+                    self._rpc_available = False
+                elif _is_poison(e):
+                    logger.warning(f"⚠️ RPC {BULK_RPC} rejected the batch ({e}), retrying per row")
+                else:
+                    raise
+        return self._write_rows(batch)
+
+    def _write_rows(self, batch: "OrderedDict[BufferKey, _Pending]") -> Tuple[int, "OrderedDict[BufferKey, _Pending]"]:
+        """Fila por fila: las rechazadas se descartan; ante un error transitorio el resto vuelve al buffer"""
+        written = 0
+        items = list(batch.items())
+        for i, (key, pending) in enumerate(items):
+            row = pending.to_row()
+            fields = {k: v for k, v in row.items() if k not in ("job_id", "phone")}
+            query = self.supabase.table("outbound_call_queue")
+            if "job_id" in row:
+                query = query.update(fields).eq("phone", row["phone"]).eq("job_id", row["job_id"])
+            else:
+                fields.pop("retell_call_id", None)
+                query = query.update(fields).eq("retell_call_id", row["retell_call_id"])
+            try:
+                query.execute()
+                written += 1
+            except Exception as e:
+                if not _is_poison(e):
+                    logger.error(f"❌ Supabase status error, requeuing {len(items) - i} rows: {e}")
+                    return written, OrderedDict(items[i:])
+                self._dead_letter(row, e)
+        return written, OrderedDict()
+
+    def _dead_letter(self, row: dict, error: Exception):
+        self._dead_lettered += 1
+        SUPABASE_WRITE_ERRORS.labels("status_dead_letter").inc()
+        logger.error(f"☠️ Status row dropped (rejected by Supabase): {row}: {error}")
+
+    def _requeue(self, batch: "OrderedDict[BufferKey, _Pending]"):
+        """Devuelve un lote fallido al frente del buffer; lo nuevo tiene prioridad"""
+        with self._lock:
+            merged: "OrderedDict[BufferKey, _Pending]" = OrderedDict()
+            for key, old in batch.items():
+                newer = self._buffer.pop(key, None)
+                if newer is not None:
+                    old.merge(newer.fields)
+                merged[key] = old
+            merged.update(self._buffer)
+            self._buffer = merged
+
+    def close(self):
+        """Detiene el hilo y vacía el buffer (llamar en el shutdown)"""
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    # ---------- métricas ----------
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._buffer)
+            oldest = min((p.first_ts for p in self._buffer.values()), default=None)
+            lag_ms = (time.monotonic() - oldest) * 1000 if oldest else 0.0
+        return {
+            "pending": pending,
+            "lag_ms": round(lag_ms, 1),
+            "last_flush_lag_ms": round(self._last_lag_ms, 1),
+            "last_flush_ms": round(self._last_flush_ms, 1),
+            "enqueued": self._enqueued,
+            "coalesced": self._coalesced,
+            "flushes": self._flushes,
+            "rows_written": self._rows_written,
+            "errors": self._errors,
+            "dead_lettered": self._dead_lettered,
+            "bulk_rpc": self._rpc_available,
+        }
@@ -0,0 +1,253 @@
+# Índice en memoria de números que no se deben marcar: do_not_call de
+# outbound_call_contacts, inactive_contacts y los marcados hace menos de
+# SUPPRESS_COOLDOWN_HOURS (outbound_call_queue). batch_call lo consulta antes
+# de encolar, así no se paga un registro en Retell ni un originate.
+#
+# Los teléfonos se guardan como enteros (E.164 sin '+') en sets: búsqueda
+# exacta en O(1) y bastante menos memoria que los strings.
+#
+# Carga completa al arrancar; después, cada SUPPRESS_REFRESH_SECONDS:
+#   - do_not_call se relee completo (no hay columna para saber qué cambió)
+#   - inactive_contacts y outbound_call_queue solo desde el último id visto
+# y cada SUPPRESS_FULL_RELOAD_SECONDS se reconstruye todo (bajas incluidas).
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional, Set
+
+from phone_normalizer import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# 0 = sin cooldown
+SUPPRESS_COOLDOWN_HOURS = float(os.getenv("SUPPRESS_COOLDOWN_HOURS", 24))
+SUPPRESS_REFRESH_SECONDS = float(os.getenv("SUPPRESS_REFRESH_SECONDS", 60))
+SUPPRESS_FULL_RELOAD_SECONDS = float(os.getenv("SUPPRESS_FULL_RELOAD_SECONDS", 3600))
+SUPPRESS_PAGE_SIZE = int(os.getenv("SUPPRESS_PAGE_SIZE", 1000))
+
+DO_NOT_CALL = "do_not_call"
+INACTIVE = "inactive"
+COOLDOWN = "cooldown"
+
+
+def phone_key(phone: Optional[str]) -> Optional[int]:
+    """'+506 8888-7777' → 50688887777"""
+    norm = normalize_phone(phone)
+    if not norm:
+        return None
+    try:
+        return int(norm.lstrip("+"))
+    except ValueError:
+        return None
+
+
+def _epoch(ts: Optional[str]) -> float:
+    try:
+        when = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return time.time()
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp()
+
+
+class SuppressionIndex:
+    def __init__(self, supabase, cooldown_hours: float = SUPPRESS_COOLDOWN_HOURS,
+                 refresh_interval: float = SUPPRESS_REFRESH_SECONDS,
+                 full_reload_interval: float = SUPPRESS_FULL_RELOAD_SECONDS,
+                 page_size: int = SUPPRESS_PAGE_SIZE):
+        self.supabase = supabase
+        self.cooldown_s = cooldown_hours * 3600
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self.page_size = page_size
+
+        self._dnc: Set[int] = set()
+        self._inactive: Set[int] = set()
+        # teléfono → epoch del último marcado
+        self._dialed: Dict[int, float] = {}
+        self._last_inactive_id = 0
+        self._last_queue_id = 0
+        self._last_full = 0.0
+        self._last_refresh = 0.0
+        self.ready = False
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Métricas
+        self.skipped = {DO_NOT_CALL: 0, INACTIVE: 0, COOLDOWN: 0}
+        self.errors = 0
+
+    # ---------- consulta ----------
+    def check(self, phone: Optional[str], cooldown: bool = True) -> Optional[str]:
+        """Motivo para no marcar el número (do_not_call/inactive/cooldown) o None"""
+        key = phone_key(phone)
+        if key is None:
+            return None
+        reason = None
+        if key in self._dnc:
+            reason = DO_NOT_CALL
+        elif key in self._inactive:
+            reason = INACTIVE
+        elif cooldown and self.cooldown_s:
+            last = self._dialed.get(key)
+            if last and time.time() - last < self.cooldown_s:
+                reason = COOLDOWN
+        if reason:
+            self.skipped[reason] += 1
+        return reason
+
+    def mark_dialed(self, phone: Optional[str]):
+        """Encolado en este nodo: entra al cooldown sin esperar la fila en outbound_call_queue"""
+        key = phone_key(phone)
+        if key is not None and self.cooldown_s:
+            with self._lock:
+                self._dialed[key] = time.time()
+
+    # ---------- carga ----------
+    def _load_dnc(self) -> Set[int]:
+        out, last = set(), ""
+        while True:
+            rows = self.supabase.table("outbound_call_contacts") \
+                .select("phone") \
+                .eq("do_not_call", True) \
+                .gt("phone", last) \
+                .order("phone") \
+                .limit(self.page_size) \
+                .execute().data or []
+            for row in rows:
+                key = phone_key(row.get("phone"))
+                if key is not None:
+                    out.add(key)
+            if len(rows) < self.page_size:
+                return out
+            last = rows[-1]["phone"]
+
+    def _load_inactive(self, since_id: int):
+        out, last = set(), since_id
+        while True:
+            rows = self.supabase.table("inactive_contacts") \
+                .select("id, phone") \
+                .gt("id", last) \
+                .order("id") \
+                .limit(self.page_size) \
+                .execute().data or []
+            for row in rows:
+                key = phone_key(row.get("phone"))
+                if key is not None:
+                    out.add(key)
+            if rows:
+                last = rows[-1]["id"]
+            if len(rows) < self.page_size:
+                return out, last
+
+    def _load_dialed(self, since_id: int, since_ts: Optional[str]):
+        out, last = {}, since_id
+        while True:
+            query = self.supabase.table("outbound_call_queue") \
+                .select("id, phone, created_at") \
+                .gt("id", last)
+            if since_ts:
+                query = query.gte("created_at", since_ts)
+            rows = query.order("id").limit(self.page_size).execute().data or []
+            for row in rows:
+                key = phone_key(row.get("phone"))
+                if key is not None:
+                    out[key] = max(out.get(key, 0), _epoch(row.get("created_at")))
+            if rows:
+                last = rows[-1]["id"]
+            if len(rows) < self.page_size:
+                return out, last
+
+    def _max_queue_id(self) -> int:
+        rows = self.supabase.table("outbound_call_queue") \
+            .select("id") \
+            .order("id", desc=True) \
+            .limit(1) \
+            .execute().data or []
+        return int(rows[0]["id"]) if rows else 0
+
+    def full_reload(self):
+        start = time.perf_counter()
+        dnc = self._load_dnc()
+        inactive, last_inactive = self._load_inactive(0)
+        dialed, last_queue = {}, self._last_queue_id
+        if self.cooldown_s:
+            since = datetime.now(timezone.utc) - timedelta(seconds=self.cooldown_s)
+            dialed, last_queue = self._load_dialed(0, since.isoformat())
+            if not dialed:
+                # Nada en la ventana: el incremental arranca desde la última fila
+                last_queue = self._max_queue_id()
+        with self._lock:
+            # Los marcados locales más recientes que la tabla se conservan
+            for key, ts in self._dialed.items():
+                if ts > dialed.get(key, 0):
+                    dialed[key] = ts
+            self._dnc, self._inactive, self._dialed = dnc, inactive, dialed
+            self._last_inactive_id, self._last_queue_id = last_inactive, last_queue
+        self._last_full = self._last_refresh = time.time()
+        self.ready = True
+        logger.info(f"✅ Suppression index loaded: {len(dnc)} DNC, {len(inactive)} inactive, "
+                    f"{len(dialed)} in cooldown ({time.perf_counter() - start:.1f}s)")
+
+    def refresh(self):
+        dnc = self._load_dnc()
+        inactive, last_inactive = self._load_inactive(self._last_inactive_id)
+        dialed, last_queue = {}, self._last_queue_id
+        if self.cooldown_s:
+            dialed, last_queue = self._load_dialed(self._last_queue_id, None)
+        cutoff = time.time() - self.cooldown_s
+        with self._lock:
+            self._dnc = dnc
+            self._inactive |= inactive
+            for key, ts in dialed.items():
+                if ts > self._dialed.get(key, 0):
+                    self._dialed[key] = ts
+            self._dialed = {key: ts for key, ts in self._dialed.items() if ts >= cutoff}
+            self._last_inactive_id, self._last_queue_id = last_inactive, last_queue
+        self._last_refresh = time.time()
+
+    # ---------- ciclo ----------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="SuppressionIndex")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        delay = 0.0
+        while not self._stop.wait(delay):
+            try:
+                if not self.ready or time.time() - self._last_full >= self.full_reload_interval:
+                    self.full_reload()
+                else:
+                    self.refresh()
+                delay = self.refresh_interval
+            except Exception as e:
+                self.errors += 1
+                # Hasta la primera carga no se suprime nada: reintento rápido
+                delay = 5 if not self.ready else self.refresh_interval
+                logger.error(f"❌ Suppression index refresh failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "do_not_call": len(self._dnc),
+            "inactive": len(self._inactive),
+            "cooldown": len(self._dialed),
+            "cooldown_hours": self.cooldown_s / 3600,
+            "refreshed_s_ago": round(time.time() - self._last_refresh, 1) if self._last_refresh else None,
+            "skipped": dict(self.skipped),
+            "errors": self.errors,
+        }
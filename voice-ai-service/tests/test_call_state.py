@@ -0,0 +1,47 @@
+import time
+
+import fakeredis
+import pytest
+
+from call_state import CallStateStore
+
+
+@pytest.fixture
+def states():
+    client = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    return CallStateStore(client, job_ttl=2)
+
+
+def submit(states, job_id: str):
+    pipe = states.redis.pipeline()
+    pipe.hset(f"call:{job_id}", mapping={"state": "queued"})
+    states.add_queued(pipe, job_id)
+    pipe.execute()
+
+
+def test_levels_follow_the_call_to_its_terminal_event(states):
+    submit(states, "a")
+    submit(states, "b")
+    states.claim("a", "w1")
+    states.set("a", "calling", owner="w1")
+    assert states.counts() == {"queued": 1, "claimed": 0, "calling": 1, "active": 0,
+                               "voicemail": 0, "completed": 0, "failed": 0}
+
+    # AMD HUMAN y luego call_ended
+    assert states.set("a", "active")[0]
+    assert states.set("a", "completed")[0]
+    # Evento atrasado o repetido: no retrocede ni vuelve a contar
+    assert states.set("a", "active")[0] is False
+    assert states.set("a", "completed")[0] is False
+    counts = states.counts()
+    assert (counts["calling"], counts["active"], counts["completed"]) == (0, 0, 1)
+
+
+def test_job_without_terminal_event_stops_counting(states):
+    submit(states, "c")
+    states.claim("c", "w1")
+    states.set("c", "calling", owner="w1")
+    assert states.counts()["calling"] == 1
+    time.sleep(2.1)
+    assert states.counts()["calling"] == 0
+    assert states.set("missing", "active") is None
@@ -0,0 +1,84 @@
+# Tras una caída de la sesión AMI el índice no debe devolver canales colgados
+# y debe recuperar las llamadas que empezaron mientras estaba desconectado.
+
+import fakeredis
+
+from channel_index import ChannelIndex, INDEXED_VARIABLE, REDIS_KEY_PREFIX
+
+
+class FakeEvent:
+    def __init__(self, **headers):
+        self.headers = headers
+
+    def get_header(self, name, default=None):
+        return self.headers.get(name, default)
+
+
+class FakeManager:
+    """Asterisk con los canales dados: responde CoreShowChannels y Getvar"""
+
+    def __init__(self, channels: dict, index: ChannelIndex = None, hangup_during_sync: str = None):
+        self.channels = channels
+        self.index = index
+        self.hangup_during_sync = hangup_during_sync
+        self.handlers = {}
+
+    def register_event(self, name, handler):
+        self.handlers.setdefault(name, []).append(handler)
+
+    def unregister_event(self, name, handler):
+        self.handlers[name].remove(handler)
+
+    def connected(self):
+        return True
+
+    def _emit(self, name, **headers):
+        for handler in list(self.handlers.get(name, [])):
+            handler(FakeEvent(Event=name, **headers), self)
+
+    def send_action(self, action):
+        if action["Action"] == "CoreShowChannels":
+            for channel in self.channels:
+                self._emit("CoreShowChannel", Channel=channel)
+            self._emit("CoreShowChannelsComplete")
+            if self.hangup_during_sync:
+                self.index._on_hangup(FakeEvent(Channel=self.hangup_during_sync), self)
+            return FakeEvent(Response="Success")
+        if action["Action"] == "Getvar":
+            assert action["Variable"] == INDEXED_VARIABLE
+            return FakeEvent(Response="Success", Value=self.channels.get(action["Channel"], ""))
+        raise AssertionError(action)
+
+
+def varset(index, channel, call_id):
+    index._on_varset(FakeEvent(Variable=INDEXED_VARIABLE, Channel=channel, Value=call_id), None)
+
+
+def test_reconnect_drops_stale_channels_and_indexes_new_calls():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    index = ChannelIndex("127.0.0.1", 5038, "u", "s", redis_client=client)
+    varset(index, "PJSIP/retell-0001", "call_old")
+    varset(index, "PJSIP/retell-0002", "call_kept")
+
+    # Sesión caída: el Hangup de call_old y el VarSet de call_new se pierden
+    index._on_disconnect()
+    assert not index.is_live()
+    assert index._by_call == {}
+
+    manager = FakeManager({
+        "PJSIP/retell-0002": "call_kept",
+        "PJSIP/retell-0003": "call_new",
+        "PJSIP/retell-0004": "call_gone",
+        "Local/retell@ctx-0001;1": "call_local",
+    }, index=index, hangup_during_sync="PJSIP/retell-0004")
+    index._manager = manager
+    index._resync(manager)
+
+    assert index.is_live()
+    assert index.lookup("call_kept") == "PJSIP/retell-0002"
+    assert index.lookup("call_new") == "PJSIP/retell-0003"
+    assert index.lookup("call_old") is None
+    assert index.lookup("call_gone") is None
+    assert index.lookup("call_local") is None
+    assert client.get(f"{REDIS_KEY_PREFIX}call_new") == "PJSIP/retell-0003"
+    assert client.get(f"{REDIS_KEY_PREFIX}call_old") is None
@@ -0,0 +1,179 @@
+# Un trabajo que espera cupo sigue pendiente en la cola; si la entrada se
+# vuelve a entregar a otro worker, ese worker no debe marcar el mismo número.
+
+import time
+import asyncio
+import threading
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+from adaptive_pacing import AdaptivePacer, pacing_key
+from call_state import CallStateStore, CLAIMED, HELD
+from job_queue import RedisStreamJobQueue, FairJobQueue
+from live_calls import LiveCallLimiter
+
+LEASE_MS = 1500
+AGENT = "agent_test"
+FROM = "+50640000000"
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def client(server):
+    return fakeredis.FakeRedis(server=server, decode_responses=True)
+
+
+def make_queue(client, backend: str, consumer: str):
+    if backend == "stream":
+        return RedisStreamJobQueue(client, consumer=consumer, claim_idle_ms=LEASE_MS, claim_interval=0)
+    return FairJobQueue(client, claim_idle_ms=LEASE_MS, claim_interval=0)
+
+
+def force_redelivery(client, queue, backend: str):
+    """Lo que haría el reclamo si el worker dejara de renovar justo ahora"""
+    if backend == "stream":
+        _, entries, *_ = client.xautoclaim(queue.stream, queue.group, queue.consumer,
+                                           min_idle_time=0, start_id="0-0", count=1)
+        entry_id, fields = entries[0]
+        return queue._parse(entry_id, fields)
+    for entry_id in client.zrange(queue.inflight_key, 0, -1):
+        client.zadd(queue.inflight_key, {entry_id: 0})
+    return queue.get(block_ms=200)
+
+
+def process(queue, states, limiter, item, name: str, dials: list, pacer=None) -> str:
+    """Los pasos del dispatcher hasta el originate"""
+    entry_id, job_id, _ = item
+    owner = f"{name}-{time.monotonic_ns()}"
+    outcome, _ = states.claim(job_id, owner)
+    if outcome != CLAIMED:
+        queue.release(entry_id)
+        return outcome
+    keepalive = states.keepalive(queue, entry_id, job_id, owner, interval=0)
+    if pacer and not pacer.acquire(pacing_key(AGENT, FROM), job_id, keepalive):
+        queue.release(entry_id)
+        return "lost"
+    if not limiter.acquire(AGENT, FROM, job_id, keepalive):
+        queue.release(entry_id)
+        return "lost"
+    if states.set(job_id, "calling", owner=owner) is None:
+        queue.release(entry_id)
+        return "lost"
+    dials.append(name)
+    queue.ack(entry_id)
+    return "dialed"
+
+
+def submit(client, queue, job_id: str):
+    client.hset(f"call:{job_id}", mapping={"state": "queued", "agent_id": AGENT, "from_number": FROM})
+    queue.put(job_id, {}, queue_key=AGENT)
+
+
+def wait_for_state(client, job_id: str, state: str, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while client.hget(f"call:{job_id}", "state") != state:
+        assert time.monotonic() < deadline, f"{job_id} never reached {state}"
+        time.sleep(0.02)
+
+
+@pytest.mark.parametrize("backend", ["stream", "fair"])
+def test_redelivered_job_blocked_on_live_slot_dials_once(client, backend):
+    states = CallStateStore(client, claim_lease_ms=LEASE_MS)
+    limiter = LiveCallLimiter(client, max_per_agent=1, max_per_trunk=0)
+    node_a = make_queue(client, backend, "node-a")
+    node_b = make_queue(client, backend, "node-b")
+    dials = []
+
+    # El cupo del agente lo ocupa otra llamada: el trabajo queda esperando
+    assert limiter.acquire(AGENT, FROM, "other-call")
+    submit(client, node_a, "job-1")
+    item = node_a.get(block_ms=200)
+    worker_a = threading.Thread(target=process, args=(node_a, states, limiter, item, "A", dials),
+                                daemon=True)
+    worker_a.start()
+    wait_for_state(client, "job-1", "claimed")
+
+    # Espera más que el idle de reclamo: la renovación evita la redelivery
+    time.sleep(2 * LEASE_MS / 1000)
+    assert node_b.get(block_ms=200) is None
+
+    # Aun si la entrada se entrega de nuevo, el segundo worker pierde el claim
+    redelivered = force_redelivery(client, node_b, backend)
+    assert redelivered[1] == "job-1"
+    assert process(node_b, states, limiter, redelivered, "B", dials) == HELD
+
+    limiter.release("other-call")
+    worker_a.join(timeout=10)
+    assert dials == ["A"]
+    assert client.hget("call:job-1", "state") == "calling"
+    assert node_a.stats()["pending"] == 0
+
+
+@pytest.mark.parametrize("backend", ["stream", "fair"])
+def test_claim_of_dead_worker_is_taken_over(client, backend):
+    states = CallStateStore(client, claim_lease_ms=LEASE_MS)
+    limiter = LiveCallLimiter(client, max_per_agent=1, max_per_trunk=0)
+    node_a = make_queue(client, backend, "node-a")
+    node_b = make_queue(client, backend, "node-b")
+    dials = []
+
+    submit(client, node_a, "job-2")
+    item = node_a.get(block_ms=200)
+    # El worker toma el claim y muere sin renovarlo ni hacer ACK
+    assert states.claim("job-2", "A-dead")[0] == CLAIMED
+    assert states.claim("job-2", "B-early")[0] == HELD
+
+    time.sleep(LEASE_MS / 1000 + 0.1)
+    redelivered = force_redelivery(client, node_b, backend)
+    assert redelivered[0] == item[0]
+    assert process(node_b, states, limiter, redelivered, "B", dials) == "dialed"
+    assert dials == ["B"]
+
+
+@pytest.mark.parametrize("backend", ["stream", "fair"])
+def test_redelivered_job_blocked_on_adaptive_pacing_dials_once(client, backend):
+    states = CallStateStore(client, claim_lease_ms=LEASE_MS)
+    limiter = LiveCallLimiter(client, max_per_agent=0, max_per_trunk=0)
+    # Meta 0: ningún originate permitido hasta que se sube
+    pacer = AdaptivePacer(client, mode="adaptive", target_live=0)
+    node_a = make_queue(client, backend, "node-a")
+    node_b = make_queue(client, backend, "node-b")
+    dials = []
+
+    submit(client, node_a, "job-3")
+    item = node_a.get(block_ms=200)
+    worker_a = threading.Thread(target=process, args=(node_a, states, limiter, item, "A", dials, pacer),
+                                daemon=True)
+    worker_a.start()
+    wait_for_state(client, "job-3", "claimed")
+
+    time.sleep(2 * LEASE_MS / 1000)
+    assert node_b.get(block_ms=200) is None
+    redelivered = force_redelivery(client, node_b, backend)
+    assert process(node_b, states, limiter, redelivered, "B", dials, pacer) == HELD
+
+    pacer.target_live = 1
+    worker_a.join(timeout=10)
+    assert dials == ["A"]
+
+
+def test_repeated_amd_is_counted_once(server, client):
+    async_client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    pacer = AdaptivePacer(client, async_client, mode="adaptive", target_live=5)
+    key = pacing_key(AGENT, FROM)
+    client.hset("call:job-4", mapping={"state": "queued"})
+    assert pacer.acquire(key, "job-4")
+
+    async def amd_twice():
+        await pacer.on_amd("job-4", "HUMAN")
+        await pacer.on_amd("job-4", "HUMAN")
+
+    asyncio.run(amd_twice())
+    state = pacer.state(key, fresh=True)
+    assert (state["resolved"], state["human"], state["live"], state["dialing"]) == (1, 1, 1, 0)
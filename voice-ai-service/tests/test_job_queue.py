@@ -0,0 +1,64 @@
+# Los pendientes de un worker caído vuelven en lotes, no de a uno por intervalo.
+
+import asyncio
+
+import fakeredis
+import fakeredis.aioredis
+
+from job_queue import RedisStreamJobQueue
+
+JOBS = 250
+
+
+def crashed_backlog(server):
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    dead = RedisStreamJobQueue(client, consumer="node-dead")
+    for i in range(JOBS):
+        dead.put(f"job-{i}", {})
+    # El worker toma todo y muere sin ACK
+    for _ in range(JOBS):
+        assert dead.get(block_ms=10)
+    return client
+
+
+def test_crashed_worker_backlog_is_reclaimed_in_batches():
+    server = fakeredis.FakeServer()
+    client = crashed_backlog(server)
+    # Con el intervalo de reclamo de producción solo habría un XAUTOCLAIM en toda la prueba
+    node = RedisStreamJobQueue(client, consumer="node-b", claim_idle_ms=0, claim_interval=3600, claim_batch=100)
+
+    jobs = [node.get(block_ms=10) for _ in range(JOBS)]
+    assert sorted(item[1] for item in jobs) == sorted(f"job-{i}" for i in range(JOBS))
+    assert node.stats()["reclaimed"] == JOBS
+    assert node.get(block_ms=10) is None
+
+
+def test_crashed_worker_backlog_is_reclaimed_in_batches_async():
+    server = fakeredis.FakeServer()
+    client = crashed_backlog(server)
+    async_client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    node = RedisStreamJobQueue(client, async_client, consumer="node-b", claim_idle_ms=0,
+                               claim_interval=3600, claim_batch=100)
+
+    async def drain():
+        return [await node.aget(block_ms=10) for _ in range(JOBS)]
+
+    jobs = asyncio.run(drain())
+    assert len({item[1] for item in jobs}) == JOBS
+
+
+def test_arelease_leaves_entry_pending_for_reclaim():
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    async_client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    node = RedisStreamJobQueue(client, async_client, consumer="node-a", claim_idle_ms=0, claim_interval=0)
+    node.put("job-1", {})
+
+    async def release_and_reclaim():
+        entry_id, job_id, _ = await node.aget(block_ms=10)
+        await node.arelease(entry_id)
+        return job_id, await node.aget(block_ms=10)
+
+    job_id, again = asyncio.run(release_and_reclaim())
+    # Sin ACK: sigue pendiente en el grupo y el mismo nodo la vuelve a reclamar
+    assert again[1] == job_id == "job-1"
@@ -0,0 +1,23 @@
+# /amd-result no está autenticado: result y cause vienen del query string y
+# no pueden abrir series nuevas en amd_results_total.
+
+import pytest
+
+from metrics import amd_cause_label, amd_result_label
+
+
+@pytest.mark.parametrize("raw,expected", [
+    ("voicemail", "VOICEMAIL"), ("HUMAN", "HUMAN"), ("no_answer", "NO_ANSWER"),
+    ("MACHINE", "OTHER"), ("x" * 500, "OTHER"), ("", "OTHER"), (None, "OTHER"),
+])
+def test_result_label_is_bounded(raw, expected):
+    assert amd_result_label(raw) == expected
+
+
+@pytest.mark.parametrize("raw,expected", [
+    ("TOOLONG-5000", "TOOLONG"), ("HUMAN-1200-800", "HUMAN"), ("TIMEOUT_NOANSWER", "TIMEOUT_NOANSWER"),
+    ("LINE_BUSY", "LINE_BUSY"), ("congestion", "CONGESTION"), ("", "none"), (None, "none"),
+    ("TOOLONG5000", "OTHER"), ("<script>", "OTHER"), ("TIMEOUT_" + "A" * 40, "OTHER"),
+])
+def test_cause_label_is_bounded(raw, expected):
+    assert amd_cause_label(raw) == expected
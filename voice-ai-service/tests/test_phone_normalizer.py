@@ -0,0 +1,29 @@
+# Caller IDs sin dígitos ('anonymous', 'Unknown') no son teléfonos: no se
+# registran con Retell ni entran a las colas o al CRM.
+
+import pytest
+
+from phone_normalizer import normalize_phone, normalize_many, validate, EMPTY, NOT_NUMERIC
+
+
+@pytest.mark.parametrize("raw,default_cc,expected", [
+    ("+506 8888-7777", None, "+50688887777"),
+    ("00506 8888 7777", None, "+50688887777"),
+    ("tel:+1 (303) 879-3188", None, "+13038793188"),
+    ("8888-7777", "+506", "+50688887777"),
+])
+def test_normalizes_digits(raw, default_cc, expected):
+    assert normalize_phone(raw, default_cc) == expected
+
+
+@pytest.mark.parametrize("raw", ["anonymous", "Unknown", "+abc", "+506abc", "", None, "   ", "+٣٣٣"])
+def test_rejects_values_without_only_digits(raw):
+    assert normalize_phone(raw) is None
+    assert normalize_phone(raw, "+506") is None
+
+
+def test_normalize_many_reasons():
+    assert normalize_many(["anonymous", "", "+50688887777"]) == [
+        (None, NOT_NUMERIC), (None, EMPTY), ("+50688887777", None),
+    ]
+    assert validate(normalize_phone("anonymous")) == EMPTY
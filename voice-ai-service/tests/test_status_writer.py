@@ -0,0 +1,97 @@
+# Una fila que viola outbound_call_queue_status_check no debe frenar las
+# demás escrituras de estado ni volver al buffer para siempre.
+
+import pytest
+from postgrest.exceptions import APIError
+
+from status_writer import SupabaseStatusWriter
+
+ALLOWED = {"queued", "calling", "active", "finished", "voicemail", "no_answer",
+           "busy", "failed", "short_call", "callback"}
+
+
+def check_violation():
+    return APIError({"code": "23514", "message": "violates check constraint outbound_call_queue_status_check"})
+
+
+class FakeQuery:
+    def __init__(self, db, fields=None):
+        self.db = db
+        self.fields = fields
+        self.match = {}
+
+    def update(self, fields):
+        return FakeQuery(self.db, fields)
+
+    def eq(self, column, value):
+        self.match[column] = value
+        return self
+
+    def execute(self):
+        if self.db.down:
+            raise ConnectionError("supabase unreachable")
+        if self.fields.get("status") not in ALLOWED:
+            raise check_violation()
+        self.db.rows.append({**self.match, **self.fields})
+
+
+class FakeRpc:
+    def __init__(self, db, rows):
+        self.db = db
+        self.rows = rows
+
+    def execute(self):
+        if self.db.down:
+            raise ConnectionError("supabase unreachable")
+        if any(row.get("status") not in ALLOWED for row in self.rows):
+            # La RPC es una transacción: una fila inválida aborta todo el lote
+            raise check_violation()
+        self.db.rows.extend(self.rows)
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.rows = []
+        self.down = False
+
+    def rpc(self, name, params):
+        return FakeRpc(self, params["updates"])
+
+    def table(self, name):
+        return FakeQuery(self)
+
+
+@pytest.fixture
+def writer():
+    db = FakeSupabase()
+    w = SupabaseStatusWriter(db, flush_interval=3600)
+    yield w
+    w._stop.set()
+    w._wakeup.set()
+
+
+def test_invalid_row_is_dropped_and_the_rest_is_written(writer):
+    writer.update_by_job("job-1", "+50688880001", {"status": "finished"})
+    writer.update_by_job("job-2", "+50688880002", {"status": "canceled"})
+    writer.update_by_call("call-3", {"status": "voicemail"})
+
+    assert writer.flush() == 2
+    assert [row.get("job_id") or row.get("retell_call_id") for row in writer.supabase.rows] == ["job-1", "call-3"]
+    assert writer.pending() == 0
+    assert writer.stats()["dead_lettered"] == 1
+
+    # Las escrituras siguientes vuelven a ir por la RPC
+    writer.update_by_job("job-4", "+50688880004", {"status": "failed"})
+    assert writer.flush() == 1
+    assert writer.stats()["bulk_rpc"] is True
+
+
+def test_transient_error_keeps_the_batch(writer):
+    writer.update_by_job("job-1", "+50688880001", {"status": "finished"})
+    writer.supabase.down = True
+    assert writer.flush() == 0
+    assert writer.pending() == 1
+
+    writer.supabase.down = False
+    assert writer.flush() == 1
+    assert writer.pending() == 0
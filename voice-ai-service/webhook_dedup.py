@@ -0,0 +1,108 @@
+# Deduplicación de webhooks de Retell.
+# Retell reintenta los webhooks; un call_analyzed repetido duplicaría la
+# entrada de conversación y todas las escrituras en Supabase. Antes de
+# encolar, cada evento se identifica por (call_id, event, hash del payload):
+# primero un LRU en proceso y luego SET NX con TTL en Redis (cluster-wide).
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from metrics import WEBHOOK_OUTCOMES
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_DEDUP_TTL = int(os.getenv("WEBHOOK_DEDUP_TTL", 86400))
+WEBHOOK_DEDUP_LRU = int(os.getenv("WEBHOOK_DEDUP_LRU", 5000))
+DEDUP_PREFIX = "webhook:dedup:"
+
+
+def payload_hash(payload: dict) -> str:
+    """Hash estable del payload (independiente del orden de las claves)"""
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class WebhookDeduplicator:
+    """LRU local + SET NX en Redis. Si Redis falla, solo se usa el LRU."""
+
+    def __init__(self, async_redis_client=None, ttl: int = WEBHOOK_DEDUP_TTL,
+                 lru_size: int = WEBHOOK_DEDUP_LRU):
+        self.redis = async_redis_client
+        self.ttl = ttl
+        self.lru_size = lru_size
+
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.misses = 0
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.redis_errors = 0
+        self.released = 0
+
+    @staticmethod
+    def make_key(call_id: str, event: str, payload: dict) -> str:
+        return f"{DEDUP_PREFIX}{call_id}:{event}:{payload_hash(payload)}"
+
+    def _remember(self, key: str) -> bool:
+        """Registra la clave en el LRU; True si ya estaba"""
+        with self._lock:
+            if key in self._seen:
+                self._seen.move_to_end(key)
+                return True
+            self._seen[key] = None
+            while len(self._seen) > self.lru_size:
+                self._seen.popitem(last=False)
+            return False
+
+    async def is_duplicate(self, key: str) -> bool:
+        """Reclama la clave; True si otro request (o nodo) ya la procesó"""
+        if self._remember(key):
+            self.local_hits += 1
+            WEBHOOK_OUTCOMES.labels("duplicate").inc()
+            return True
+
+        if self.redis is not None:
+            try:
+                claimed = await self.redis.set(key, "1", nx=True, ex=self.ttl)
+                if not claimed:
+                    self.redis_hits += 1
+                    WEBHOOK_OUTCOMES.labels("duplicate").inc()
+                    return True
+            except Exception as e:
+                self.redis_errors += 1
+                logger.error(f"Redis error (webhook dedup): {e}")
+
+        self.misses += 1
+        return False
+
+    async def release(self, key: str):
+        """Libera una clave reclamada cuyo evento no se llegó a encolar (503)"""
+        with self._lock:
+            self._seen.pop(key, None)
+        self.released += 1
+        if self.redis is None:
+            return
+        try:
+            await self.redis.delete(key)
+        except Exception as e:
+            logger.error(f"Redis error (webhook dedup release): {e}")
+
+    def stats(self) -> dict:
+        hits = self.local_hits + self.redis_hits
+        total = hits + self.misses
+        return {
+            "hits": hits,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / total, 3) if total else 0.0,
+            "released": self.released,
+            "redis_errors": self.redis_errors,
+            "lru_size": len(self._seen),
+        }
@@ -0,0 +1,221 @@
+# Pipeline de ingestión de webhooks de Retell: el endpoint valida, encola y
+# responde de inmediato; consumidores dedicados aplican los eventos.
+#
+# - Orden por llamada: cada call_id cae siempre en el mismo shard y el shard
+#   procesa en serie. Un evento anterior en el ciclo de vida que llega después
+#   de uno posterior (p.ej. call_started reintentado tras call_ended) se descarta.
+# - Backpressure: colas acotadas; si el shard está lleno, submit() devuelve False
+#   y el endpoint responde 503 para que Retell reintente.
+# - Reintentos con backoff y dead-letter en Redis al agotarlos.
+
+import os
+import json
+import time
+import asyncio
+import logging
+import zlib
+from collections import OrderedDict
+from typing import Callable, List
+
+from metrics import WEBHOOK_SECONDS, WEBHOOK_OUTCOMES
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_SHARDS = int(os.getenv("WEBHOOK_SHARDS", 8))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_MAX_RETRIES = int(os.getenv("WEBHOOK_MAX_RETRIES", 3))
+WEBHOOK_RETRY_BASE = float(os.getenv("WEBHOOK_RETRY_BASE", 0.5))
+DEAD_LETTER_KEY = "webhooks:dead"
+DEAD_LETTER_MAX = 5000
+
+# Orden del ciclo de vida de una llamada
+EVENT_RANK = {"call_started": 1, "call_ended": 2, "call_analyzed": 3}
+# call_ids recordados para el control de orden (LRU por shard)
+_RANK_MEMORY = 10000
+
+
+class _Envelope:
+    __slots__ = ("payload", "event", "call_id", "enqueued_at", "attempts")
+
+    def __init__(self, payload: dict, event: str, call_id: str):
+        self.payload = payload
+        self.event = event
+        self.call_id = call_id
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class WebhookPipeline:
+    """Colas acotadas por shard + un consumidor asyncio por shard"""
+
+    def __init__(self, handler: Callable[[dict], None], redis_client=None,
+                 shards: int = WEBHOOK_SHARDS, queue_size: int = WEBHOOK_QUEUE_SIZE,
+                 max_retries: int = WEBHOOK_MAX_RETRIES, retry_base: float = WEBHOOK_RETRY_BASE):
+        # handler es síncrono (supabase-py); se ejecuta en un hilo
+        self.handler = handler
+        self.redis = redis_client
+        self.shards = shards
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._applied_rank: List["OrderedDict[str, int]"] = [OrderedDict() for _ in range(shards)]
+
+        # Métricas
+        self.enqueued = 0
+        self.rejected = 0
+        self.processed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.stale_dropped = 0
+        self._latency_total_ms = 0.0
+        self._latency_max_ms = 0.0
+        self._handler_total_ms = 0.0
+
+    # ---------- ciclo de vida ----------
+    def start(self):
+        if self._tasks:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.shards)]
+        self._tasks = [asyncio.create_task(self._consume(i)) for i in range(self.shards)]
+        logger.info(f"✅ Webhook pipeline started ({self.shards} shards)")
+
+    async def stop(self, timeout: float = 10.0):
+        """Drena lo encolado (hasta timeout) y detiene los consumidores"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Webhook pipeline stopped with {self.depth()} events pending")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ---------- productor ----------
+    def _shard_for(self, call_id: str) -> int:
+        return zlib.crc32(call_id.encode()) % self.shards
+
+    def submit(self, payload: dict, event: str, call_id: str) -> bool:
+        """Encola sin bloquear; False si el shard está lleno (backpressure)"""
+        if not self._queues:
+            raise RuntimeError("Webhook pipeline not started")
+        queue = self._queues[self._shard_for(call_id)]
+        try:
+            queue.put_nowait(_Envelope(payload, event, call_id))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            WEBHOOK_OUTCOMES.labels("rejected").inc()
+            return False
+        self.enqueued += 1
+        return True
+
+    # ---------- consumidores ----------
+    def _is_stale(self, shard: int, env: _Envelope) -> bool:
+        ranks = self._applied_rank[shard]
+        rank = EVENT_RANK.get(env.event, 0)
+        applied = ranks.get(env.call_id, 0)
+        return rank < applied
+
+    def _mark_applied(self, shard: int, env: _Envelope):
+        ranks = self._applied_rank[shard]
+        rank = EVENT_RANK.get(env.event, 0)
+        if rank > ranks.get(env.call_id, 0):
+            ranks[env.call_id] = rank
+        ranks.move_to_end(env.call_id)
+        while len(ranks) > _RANK_MEMORY:
+            ranks.popitem(last=False)
+
+    async def _consume(self, shard: int):
+        queue = self._queues[shard]
+        while True:
+            env = await queue.get()
+            try:
+                await self._apply(shard, env)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Webhook pipeline error: {e}")
+            finally:
+                queue.task_done()
+
+    async def _apply(self, shard: int, env: _Envelope):
+        if self._is_stale(shard, env):
+            self.stale_dropped += 1
+            WEBHOOK_OUTCOMES.labels("stale").inc()
+            logger.warning(f"⏭️ Out-of-order {env.event} dropped for {env.call_id}")
+            return
+
+        while True:
+            env.attempts += 1
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.handler, env.payload)
+                break
+            except Exception as e:
+                if env.attempts > self.max_retries:
+                    await self._dead_letter(env, e)
+                    return
+                self.retried += 1
+                WEBHOOK_OUTCOMES.labels("retried").inc()
+                delay = self.retry_base * (2 ** (env.attempts - 1))
+                logger.warning(f"🔁 Webhook {env.event} {env.call_id} failed ({e}), retry in {delay:.1f}s")
+                # Reintentar en el mismo shard mantiene el orden de la llamada
+                await asyncio.sleep(delay)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._handler_total_ms += elapsed * 1000
+                WEBHOOK_SECONDS.labels(env.event).observe(elapsed)
+
+        self._mark_applied(shard, env)
+        self.processed += 1
+        WEBHOOK_OUTCOMES.labels("processed").inc()
+        latency_ms = (time.monotonic() - env.enqueued_at) * 1000
+        self._latency_total_ms += latency_ms
+        if latency_ms > self._latency_max_ms:
+            self._latency_max_ms = latency_ms
+
+    async def _dead_letter(self, env: _Envelope, error: Exception):
+        self.dead_lettered += 1
+        WEBHOOK_OUTCOMES.labels("dead_lettered").inc()
+        logger.error(f"☠️ Webhook {env.event} {env.call_id} dead-lettered after {env.attempts} attempts: {error}")
+        if self.redis is None:
+            return
+        record = json.dumps({
+            "event": env.event,
+            "call_id": env.call_id,
+            "error": str(error),
+            "attempts": env.attempts,
+            "payload": env.payload,
+        })
+        try:
+            pipe = self.redis.pipeline()
+            pipe.lpush(DEAD_LETTER_KEY, record)
+            pipe.ltrim(DEAD_LETTER_KEY, 0, DEAD_LETTER_MAX - 1)
+            await asyncio.to_thread(pipe.execute)
+        except Exception as e:
+            logger.error(f"Redis error (dead letter): {e}")
+
+    # ---------- métricas ----------
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "shard_depths": [q.qsize() for q in self._queues],
+            "capacity": self.shards * self.queue_size,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "stale_dropped": self.stale_dropped,
+            "avg_latency_ms": round(self._latency_total_ms / self.processed, 1) if self.processed else 0.0,
+            "max_latency_ms": round(self._latency_max_ms, 1),
+            "avg_handler_ms": round(self._handler_total_ms / (self.processed + self.retried + self.dead_lettered), 1)
+            if (self.processed + self.retried + self.dead_lettered) else 0.0,
+        }